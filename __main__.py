@@ -4,10 +4,43 @@ MopsDisplay 2.0
 Display realtime train departures for nearby stations and upcoming events from the HU calendar.
 """
 
+from argparse import ArgumentParser
+from functools import partial
 from itertools import zip_longest
-from src import root, defines as d, debug
-from src.data import Poster, Station, FETCH_DEPARTURE_TIMER
-from src.config import load_data
+import json
+import os
+import sys
+
+# benchmarks, load tests and replays draw without display, the backend must
+# be chosen before src is imported
+if {"--bench", "--loadtest", "--replay"} & set(sys.argv[1:]):
+    os.environ.setdefault("MOPSDISPLAY_BACKEND", "headless")
+# rendered frames are written by the offscreen backend
+if any(arg == "--offscreen" or arg.startswith("--offscreen=")
+       for arg in sys.argv[1:]):
+    os.environ.setdefault("MOPSDISPLAY_BACKEND", "offscreen")
+
+# pylint: disable=wrong-import-position
+from src.app import APP, ImportTimer
+
+if "--startup-report" in sys.argv[1:]:
+    APP.import_timer = ImportTimer()
+    sys.meta_path.insert(0, APP.import_timer)
+
+from src import BACKEND
+from src import defines as d, clock, debug, tracing, endpoints, log
+from src.monitor import LoopMonitor
+from src.scheduler import Scheduler
+from src.render import SlicedRenderer
+from src import profiler
+from src import recorder
+from src import heap
+from src import fanout
+from src import startup
+from src.data import (
+    Event, Poster, Station, FETCH_DEPARTURE_TIMER, upcoming_events
+)
+from src.config import load_data, load_posters
 from src.artist import (
     ClockArtist,
     StackArtist,
@@ -22,53 +55,115 @@ from src.artist import (
 
 StationArtist = tuple[Station, list[DepartureArtist]]
 
+RENDER_TIME = debug.REGISTRY.histogram(
+    "mops_render_seconds",
+    "Time to apply fetched departures to the departure artists (summed "
+    "over render slices)",
+    ("station",),
+)
+
 STATION_ARTISTS: list[StationArtist] = []
+EVENTS: list[Event] = []
 EVENT_ARTISTS: list[EventArtist] = []
 POSTER_ARTISTS: list[PosterArtist] = []
 CLOCK_ARTISTS: list[ClockArtist] = []
 
+# created with the root window by init
+MONITOR: LoopMonitor = None
+SCHEDULER: Scheduler = None
+RENDERER: SlicedRenderer = None
+# receives departures from a board server instead of the API if set
+SUBSCRIBER: fanout.Subscriber = None
+# first departure requests, sent before the widgets exist
+PREFETCH: startup.Prefetcher = None
+# time to the first painted station and to the full board
+STARTUP: startup.BoardTracker = None
+
+APP.mark("imports")
+
 
 @debug.Timed()
 def update_stations():
     """periodically update stations"""
+    # pylint: disable=global-statement
+    global PREFETCH
+    if PREFETCH is not None:
+        PREFETCH.cancel()
+        PREFETCH = None
     # reset timers
     FETCH_DEPARTURE_TIMER.reset()
     UPDATE_DEPARTURE_TIMER.reset()
 
-    for station, artists in STATION_ARTISTS:
-        update_departures(station, artists)
+    with tracing.span("update_stations"):
+        for station, artists in STATION_ARTISTS:
+            update_departures(station, artists)
+    tracing.TRACER.end_cycle(tracing.TRACE_PATH)
+    recorder.RECORDER.end_cycle()
+    heap.PAUSES.flush()
 
     FETCH_DEPARTURE_TIMER.readout()
     UPDATE_DEPARTURE_TIMER.readout()
-    root.after(d.STATION_UPDATE_TIME, update_stations)
 
 
 def update_events():
-    """periodically update events"""
-    # events currently dont update
-    root.after(d.EVENT_UPDATE_TIME, update_events)
+    """periodically update events, shows the next upcoming ones"""
+    window = upcoming_events(EVENTS, clock.now().date(), len(EVENT_ARTISTS))
+    for artist, event in zip_longest(EVENT_ARTISTS, window):
+        artist.update_event(event)
 
 
 def update_posters():
     """periodically update posters"""
     for artist in POSTER_ARTISTS:
         artist.update_poster()
-    root.after(d.POSTER_UPDATE_TIME, update_posters)
 
 
 def update_clocks():
     """periodically update clocks"""
     for artist in CLOCK_ARTISTS:
         artist.update_clock()
-    root.after(d.CLOCK_UPDATE_TIME, update_clocks)
 
 
-def update_departures(station: Station, artists: list[DepartureArtist]):
-    """update departures of a station"""
-    for departure, artist in zip_longest(station.fetch_departures(), artists):
+def update_metrics():
+    """periodically write metrics to debug.METRICS_PATH"""
+    debug.write_metrics(debug.METRICS_PATH, backups=debug.METRICS_BACKUPS)
+
+
+def update_departures(
+    station: Station,
+    artists: list[DepartureArtist],
+    departures: list = None,
+):
+    """update departures of a station, fetches them if departures is None
+
+    Artists whose display changes are updated in time slices by RENDERER,
+    stations with new trips first
+    """
+    if not artists:
+        return
+    if departures is None and SUBSCRIBER is None:
+        departures = station.fetch_departures()
+    elif departures is None:
+        departures = SUBSCRIBER.departures(station)
+
+    units = []
+    new_trips = False
+    for departure, artist in zip_longest(departures, artists):
         if artist is None:
             break
-        artist.update_departure(departure)
+        if artist.shows(departure):
+            continue
+        new_trips |= getattr(departure, "id", None) != artist.last_tripid
+        units.append(partial(artist.update_departure, departure))
+
+    def done(elapsed: float):
+        RENDER_TIME.observe(elapsed, station=station.label)
+        recorder.record("render", station.label, len(units), elapsed)
+        if STARTUP is not None:
+            STARTUP.painted(station.label)
+
+    RENDERER.submit(station.label, units, priority=int(not new_trips),
+                    done=done, context=artists[0].canvas.batch)
 
 
 def create_station_artist(
@@ -92,8 +187,24 @@ def create_station_artist(
     return station, departure_artists
 
 
-def main():
+def init():
+    """create the root window and the services scheduling on it"""
+    # pylint: disable=global-statement
+    global MONITOR, SCHEDULER, RENDERER
+    MONITOR = LoopMonitor(APP.root)
+    SCHEDULER = Scheduler(MONITOR)
+    RENDERER = SlicedRenderer(APP.root, monitor=MONITOR)
+
+
+def main(startup_report: str = None):
     """main"""
+    # pylint: disable=global-statement
+    global PREFETCH, STARTUP
+    if MONITOR is None:
+        init()
+    root = APP.root
+    heap.PAUSES.install()
+
     # define root geometry
     # --------------------
     root.rowconfigure(0, weight=0)
@@ -103,8 +214,85 @@ def main():
 
     # load data from config
     # ---------------------
-    stations, events, posters = load_data()
+    with APP.phase("config"):
+        stations, events, posters = load_data(images=False)
+
+    # the first departures are fetched while the widgets are created
+    if SUBSCRIBER is None:
+        with APP.phase("prefetch"):
+            PREFETCH = startup.Prefetcher(stations)
+    APP.load_assets()
+    if PREFETCH is not None:
+        PREFETCH.poll()
+    with APP.phase("posters"):
+        posters = load_posters(posters)
+    if PREFETCH is not None:
+        PREFETCH.poll()
+    with APP.phase("widgets"):
+        create_widgets(root, stations, events, posters)
+    # later collections skip the fonts, images and artists
+    if heap.FREEZE:
+        with APP.phase("freeze"):
+            heap.freeze()
+
+    STARTUP = startup.BoardTracker(
+        root, [station.label for station, artists in STATION_ARTISTS
+               if artists]
+    )
+    if PREFETCH is not None:
+        artists_by_label = {
+            station.label: artists for station, artists in STATION_ARTISTS
+        }
+        PREFETCH.start(root, lambda station, departures: update_departures(
+            station, artists_by_label[station.label], departures
+        ))
+
+    # expose metrics
+    # --------------
+    if debug.METRICS and debug.METRICS_PORT is not None:
+        debug.serve_metrics(debug.METRICS_PORT)
+    if debug.METRICS and debug.METRICS_PATH is not None:
+        SCHEDULER.add(update_metrics, d.METRICS_UPDATE_TIME, priority=-1)
+
+    # allow on-demand profiling
+    # ------------------------
+    profiler.install(profiler.SamplingProfiler())
+
+    # keep the last update cycles for post mortem analysis
+    # ----------------------------------------------------
+    recorder.install(root)
+
+    MONITOR.start_watchdog()
+    # cheap updates first, so they are not delayed by fetching departures
+    SCHEDULER.add(update_clocks, d.CLOCK_UPDATE_TIME, align=True, priority=3)
+    SCHEDULER.add(
+        update_posters, d.POSTER_UPDATE_TIME,
+        align=True, priority=2, deadline=d.POSTER_DEADLINE,
+    )
+    SCHEDULER.add(update_events, d.EVENT_UPDATE_TIME, align=True, priority=1)
+    # prefetched departures are shown until the next update boundary
+    SCHEDULER.add(
+        update_stations, d.STATION_UPDATE_TIME,
+        align=True, immediately=PREFETCH is None,
+    )
+    APP.mark("mainloop")
+    if startup_report is not None:
+        # report once the board is complete or the wait timed out
+        def report():
+            root.after_cancel(timeout)
+            write_report(APP.report(), startup_report)
+            root.quit()
+
+        STARTUP.on_full_board.append(report)
+        timeout = root.after(startup.REPORT_TIMEOUT, report)
+        if not STARTUP.pending:
+            report()
+            return
+    root.mainloop()
+
 
+def create_widgets(root, stations, events, posters):
+    """create the canvases and artists"""
     # create stations
     # ---------------
     station_canvas = GridCanvas(
@@ -143,9 +331,12 @@ def main():
 
     # create events
     # -------------
-    for event in events:
-        event_artist = EventArtist(event_canvas, event)
+    # a fixed pool of artists shows the upcoming events, see update_events
+    EVENTS.extend(events)
+    for _ in range(min(len(events), d.MAX_EVENTS)):
+        event_artist = EventArtist(event_canvas, events)
         EVENT_ARTISTS.append(event_artist)
+    update_events()
     title_artist = TitleArtist(
         event_canvas, "nächste Veranstaltungen:",
         font=d.FONT_EVENT,
@@ -167,13 +358,176 @@ def main():
         event_canvas.set(3 + row, 0, artist)
         POSTER_ARTISTS.append(artist)
 
-    root.after(0, update_stations)
-    root.after(0, update_clocks)
-    root.after(0, update_posters)
-    root.mainloop()
+
+def write_report(report: dict, output: str = None):
+    """write a json report to output, stdout if output is None or -"""
+    text = json.dumps(report, indent=2)
+    if output in (None, "-"):
+        print(text)
+    else:
+        with open(output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+
+
+def parse_args():
+    """parse command line arguments"""
+    parser = ArgumentParser(prog="MopsDisplay", description=__doc__)
+    parser.add_argument(
+        "--bench", action="store_true",
+        help="run the artist and layout benchmarks and exit",
+    )
+    parser.add_argument(
+        "--bench-output", metavar="PATH", default=None,
+        help="write benchmark results to PATH instead of stdout",
+    )
+    parser.add_argument(
+        "--bench-sizes", metavar="N", type=int, nargs="+", default=None,
+        help="board sizes (number of artists) to benchmark",
+    )
+    parser.add_argument(
+        "--api-url", metavar="URL", nargs="+", default=None,
+        help="base urls of compatible departure APIs in order of "
+             "preference, requests go to the fastest healthy one "
+             f"(default: {' '.join(endpoints.API_URLS)})",
+    )
+    parser.add_argument(
+        "--log-level", choices=list(log.LEVELS), default=None,
+        help=f"minimum level of log records (default: {log.LEVEL}), "
+             "SIGUSR2 toggles debug records at runtime",
+    )
+    parser.add_argument(
+        "--gc-threshold", metavar="N", type=int, nargs="+", default=None,
+        help="garbage collection thresholds of generation 0 (1 and 2), "
+             "larger thresholds collect less often but use more memory",
+    )
+    parser.add_argument(
+        "--startup-report", metavar="PATH", nargs="?", const="-",
+        default=None,
+        help="build the display, write startup phase and module import "
+             "times as json to PATH (default: stdout) and exit",
+    )
+    parser.add_argument(
+        "--offscreen", metavar="PATH", default=None,
+        help="write rendered frames to the png file PATH (selects the "
+             "offscreen backend)",
+    )
+
+    shared = parser.add_argument_group("shared fetcher")
+    shared.add_argument(
+        "--serve", metavar="PORT", type=int, nargs="?",
+        const=fanout.FANOUT_PORT, default=None,
+        help="fetch departures once for all displays and serve them on PORT "
+             f"(default: {fanout.FANOUT_PORT}) instead of displaying them",
+    )
+    shared.add_argument(
+        "--serve-host", metavar="HOST", default=fanout.FANOUT_HOST,
+        help="address the board server listens on (default: "
+             f"{fanout.FANOUT_HOST}, only this machine), 0.0.0.0 accepts "
+             "displays from the network",
+    )
+    shared.add_argument(
+        "--subscribe", metavar="URL", default=None,
+        help="receive departures from the board server at URL instead of "
+             "the API",
+    )
+
+    replay = parser.add_argument_group("record and replay")
+    replay.add_argument(
+        "--capture", metavar="PATH", default=None,
+        help="append API responses to PATH (gzip compressed if PATH ends "
+             "with .gz)",
+    )
+    replay.add_argument(
+        "--replay", metavar="PATH", default=None,
+        help="replay responses captured to PATH on virtual time and exit",
+    )
+    replay.add_argument(
+        "--replay-output", metavar="PATH", default=None,
+        help="write the replay report to PATH instead of stdout",
+    )
+
+    loadtest = parser.add_argument_group("load test")
+    loadtest.add_argument(
+        "--loadtest", action="store_true",
+        help="run the end-to-end load test against a local API stub and exit",
+    )
+    loadtest.add_argument(
+        "--loadtest-output", metavar="PATH", default=None,
+        help="write load test results to PATH instead of stdout",
+    )
+    loadtest.add_argument(
+        "--loadtest-sizes", metavar="NxM", nargs="+", default=None,
+        help="N stations with M directions each to test, e.g. 20x4",
+    )
+    loadtest.add_argument(
+        "--loadtest-cycles", metavar="K", type=int, default=5,
+        help="update cycles per size",
+    )
+    loadtest.add_argument(
+        "--loadtest-gc", action="store_true",
+        help="run every size with several garbage collector settings",
+    )
+    loadtest.add_argument("--stub-latency", type=float, default=0.05,
+                          help="stub response delay in seconds")
+    loadtest.add_argument("--stub-jitter", type=float, default=0.02,
+                          help="stub response delay jitter in seconds")
+    loadtest.add_argument("--stub-error-rate", type=float, default=0.0,
+                          help="probability of stub error responses")
+    loadtest.add_argument("--stub-departures", type=int, default=None,
+                          help="departures per stub response")
+    parsed = parser.parse_args()
+    if parsed.offscreen is not None and BACKEND != "offscreen":
+        parser.error("--offscreen requires the offscreen backend, "
+                     f"MOPSDISPLAY_BACKEND is {BACKEND}")
+    return parsed
 
 
 if __name__ == "__main__":
-    root.geometry(f"{d.WIDTH_ROOT}x{d.HEIGHT_ROOT}")
-    root.attributes("-fullscreen", True)
-    main()
+    args = parse_args()
+    if args.log_level is not None:
+        log.set_level(args.log_level)
+    log.install()
+    heap.configure(args.gc_threshold or heap.GC_THRESHOLDS)
+    if args.bench:
+        from src import bench
+        bench.main(args.bench_output, sizes=args.bench_sizes or bench.SIZES)
+        sys.exit()
+    if args.loadtest:
+        from src import loadtest
+        loadtest.main(
+            args.loadtest_output,
+            sizes=[loadtest.parse_size(size)
+                   for size in args.loadtest_sizes or []] or loadtest.SIZES,
+            cycles=args.loadtest_cycles,
+            latency=args.stub_latency,
+            jitter=args.stub_jitter,
+            error_rate=args.stub_error_rate,
+            departures=args.stub_departures,
+            gc_variants=args.loadtest_gc,
+        )
+        sys.exit()
+    if args.api_url is not None:
+        endpoints.configure(args.api_url)
+    if args.serve is not None:
+        fanout.serve(args.serve, args.serve_host)
+        sys.exit()
+    init()
+    if args.subscribe is not None:
+        SUBSCRIBER = fanout.Subscriber(args.subscribe)
+        SUBSCRIBER.start()
+    if args.replay is not None:
+        from src import replay
+        replayer = replay.install_replay(args.replay, APP.root, MONITOR)
+        main()
+        write_report(replayer.report(), args.replay_output)
+        sys.exit()
+    if args.capture is not None:
+        from src import replay
+        replay.install_capture(args.capture)
+    if args.offscreen is not None:
+        from src.offscreen import PNGSink
+        APP.root.sinks.append(PNGSink(args.offscreen))
+
+    APP.root.geometry(f"{d.WIDTH_ROOT}x{d.HEIGHT_ROOT}")
+    APP.root.attributes("-fullscreen", True)
+    main(args.startup_report)
@@ -1,8 +1,22 @@
 """App source package"""
 
-__all__ = ["root"]
+__all__ = ["BACKEND"]
 
-from tkinter import Tk
+import os
 
-# create root here to freely use tkinter objects anywhere in the project
-root = Tk()
+# "tk" draws on a tkinter window, "headless" records canvas operations
+# without a display (see headless.py), "offscreen" renders into a pillow
+# image (see offscreen.py)
+BACKEND = os.environ.get("MOPSDISPLAY_BACKEND", "tk")
+if BACKEND not in ("tk", "headless", "offscreen"):
+    raise ValueError(f"Unknown backend {BACKEND}")
+
+
+def __getattr__(name: str):
+    # the root window is created on first access, so that modules can be
+    # imported without a display (see app.py)
+    if name == "root":
+        from .app import APP  # pylint: disable=import-outside-toplevel
+
+        return APP.root
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
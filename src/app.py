@@ -0,0 +1,160 @@
+"""Application context
+Importing src and its modules has no side effects: the root window is created
+on first access of src.root (or APP.root), fonts, icons and the logo in
+defines.py on first access (APP.load_assets loads them at once), the http
+stack on the first request (data.load_http). Startup phases and, with an
+ImportTimer installed, module imports are timed for the startup report
+(`python . --startup-report`).
+"""
+
+from contextlib import contextmanager
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from . import BACKEND
+
+
+# zero of the startup report, importing src is the first thing __main__ does
+START = time.perf_counter()
+# number of modules listed in the startup report
+REPORT_MODULES = 25
+
+
+def create_root(backend: str):
+    """Create the root window of a backend"""
+    # pylint: disable=import-outside-toplevel
+    if backend == "headless":
+        from .headless import RecordingRoot
+
+        return RecordingRoot()
+    if backend == "offscreen":
+        from .offscreen import OffscreenRoot
+
+        return OffscreenRoot()
+    if backend == "tk":
+        from tkinter import Tk
+
+        return Tk()
+    raise ValueError(f"Unknown backend {backend}")
+
+
+class ImportTimer:
+    """Meta path finder that times the execution of imported modules
+
+    Install it before the imports to time (`sys.meta_path.insert(0, timer)`).
+    Self times exclude nested imports. Modules of builtin and frozen
+    importers are not timed.
+    """
+
+    def __init__(self):
+        self.times: Dict[str, float] = {}  # module -> seconds (self time)
+        self._children: List[float] = []  # nested import time per level
+
+    def find_spec(self, name, path=None, target=None):
+        """Find the spec with the other finders and time its loader"""
+        for finder in sys.meta_path:
+            find_spec = getattr(finder, "find_spec", None)
+            if finder is self or find_spec is None:
+                continue
+            spec = find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        # loader classes are shared by all their modules, instances are not
+        if loader is not None and not isinstance(loader, type):
+            try:
+                loader.exec_module = self._timed(name, loader.exec_module)
+            except AttributeError:
+                pass
+        return spec
+
+    def _timed(self, name: str, exec_module: Callable) -> Callable:
+        def timed(module):
+            self._children.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                total = time.perf_counter() - start
+                self.times[name] = total - self._children.pop()
+                if self._children:
+                    self._children[-1] += total
+
+        return timed
+
+    def summary(self, limit: int = REPORT_MODULES) -> Dict[str, float]:
+        """Self time per module in ms, modules of other packages summed per
+        top level package, the slowest first"""
+        totals: Dict[str, float] = {}
+        for name, seconds in self.times.items():
+            package = name.split(".")[0]
+            key = name if package in ("src", "__main__") else package
+            totals[key] = totals.get(key, 0.0) + seconds
+        slowest = sorted(totals.items(), key=lambda item: -item[1])
+        return {name: round(1e3 * seconds, 3)
+                for name, seconds in slowest[:limit]}
+
+
+class App:
+    """Creates the root window and assets on request and records the
+    startup phases"""
+
+    def __init__(self):
+        self._root = None
+        self.phases: List[Tuple[str, float, float]] = []  # name, start, end
+        self.import_timer: ImportTimer = None
+
+    @property
+    def root(self):
+        """Root window of the backend, created on first access"""
+        if self._root is None:
+            with self.phase("root"):
+                self._root = create_root(BACKEND)
+        return self._root
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Record the duration of a startup phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start, time.perf_counter()))
+
+    def mark(self, name: str):
+        """Record a point in time of the startup"""
+        now = time.perf_counter()
+        self.phases.append((name, now, now))
+
+    def load_assets(self):
+        """Create fonts and decode the icons and the logo"""
+        from . import defines as d  # pylint: disable=import-outside-toplevel
+
+        _ = self.root  # fonts and images need the root window
+        with self.phase("assets"):
+            for name in ("FONT_TITLE", "FONT_DEPARTURE", "FONT_EVENT",
+                         "FONT_CLOCK", "ICONS", "LOGO"):
+                getattr(d, name)
+
+    def report(self) -> dict:
+        """Startup phases (ms since START) and module import times"""
+        report = {
+            "backend": BACKEND,
+            "phases": [
+                {
+                    "name": name,
+                    "start": round(1e3 * (start - START), 3),
+                    "duration": round(1e3 * (end - start), 3),
+                }
+                for name, start, end in self.phases
+            ],
+        }
+        if self.import_timer is not None:
+            report["imports"] = self.import_timer.summary()
+        return report
+
+
+APP = App()
@@ -1,19 +1,46 @@
 """Manage (tkinter) canvas placement"""
 
-from datetime import datetime
+from functools import wraps
 from itertools import cycle
 from math import floor
-from tkinter import Canvas
 from tkinter.font import Font
-from typing import Any, Callable, List, Tuple, Union
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
 
+from . import BACKEND
+from . import clock
 from . import defines as d
 from . import debug
+from . import tracing
+from .badges import BADGES
+from .sprites import SPRITES
 from .config import Event, Poster
 from .data import Departure
 
+if BACKEND == "headless":
+    from .headless import RecordingCanvas as Canvas
+elif BACKEND == "offscreen":
+    from .offscreen import OffscreenCanvas as Canvas
+else:
+    from .batch import BatchedCanvas as Canvas
+
 
 UPDATE_DEPARTURE_TIMER = debug.TimedCumulative("departure display update")
+CANVAS_OPERATIONS = debug.REGISTRY.counter(
+    "mops_canvas_operations_total",
+    "Calls of tkinter canvas item operations",
+    ("canvas", "operation"),
+)
+
+# canvas methods counted by CANVAS_OPERATIONS
+COUNTED_OPERATIONS = (
+    "create_text",
+    "create_image",
+    "create_rectangle",
+    "create_oval",
+    "coords",
+    "itemconfigure",
+    "delete",
+)
 
 
 def fontheight(font: Font) -> int:
@@ -37,63 +64,41 @@ def textwidth(text: str, font: Font) -> int:
     return font.measure(text)
 
 
-# transform x coordinates from a corner to the center
-corner2center_x: dict[str, Callable[[int, int], int]] = {
-    "nw": lambda x, width: x + width / 2,
-    "ne": lambda x, width: x - width / 2,
-    "se": lambda x, width: x - width / 2,
-    "sw": lambda x, width: x + width / 2,
-    "n": lambda x, width: x,
-    "e": lambda x, width: x - width / 2,
-    "s": lambda x, width: x,
-    "w": lambda x, width: x + width / 2,
-    "center": lambda x, width: x,
+# position of a corner in a cell, as fraction of the cell width and height
+# measured from the north west corner
+CORNER_X = {
+    "nw": 0, "n": 0.5, "ne": 1, "e": 1, "se": 1,
+    "s": 0.5, "sw": 0, "w": 0, "center": 0.5,
 }
-
-# transform x coordinates from the center to a corner
-center2corner_x: dict[str, Callable[[int, int], int]] = {
-    "nw": lambda x, width: x - width / 2,
-    "ne": lambda x, width: x + width / 2,
-    "se": lambda x, width: x + width / 2,
-    "sw": lambda x, width: x - width / 2,
-    "n": lambda x, width: x,
-    "e": lambda x, width: x + width / 2,
-    "s": lambda x, width: x,
-    "w": lambda x, width: x - width / 2,
-    "center": lambda x, width: x,
+CORNER_Y = {
+    "nw": 0, "n": 0, "ne": 0, "e": 0.5, "se": 1,
+    "s": 1, "sw": 1, "w": 0.5, "center": 0.5,
 }
 
-# transform y coordinates from a corner to the center
-corner2center_y: dict[str, Callable[[int, int], int]] = {
-    "nw": lambda y, height: y + height / 2,
-    "ne": lambda y, height: y + height / 2,
-    "se": lambda y, height: y - height / 2,
-    "sw": lambda y, height: y - height / 2,
-    "n": lambda y, height: y + height / 2,
-    "e": lambda y, height: y,
-    "s": lambda y, height: y - height / 2,
-    "w": lambda y, height: y,
-    "center": lambda y, height: y,
-}
 
-# transform y coordinates from the center to a corner
-center2corner_y: dict[str, Callable[[int, int], int]] = {
-    "nw": lambda y, height: y - height / 2,
-    "ne": lambda y, height: y - height / 2,
-    "se": lambda y, height: y + height / 2,
-    "sw": lambda y, height: y + height / 2,
-    "n": lambda y, height: y - height / 2,
-    "e": lambda y, height: y,
-    "s": lambda y, height: y + height / 2,
-    "w": lambda y, height: y,
-    "center": lambda y, height: y,
-}
+def _offset_table(fractions: Dict[str, float]) -> Dict[str, Dict[str, float]]:
+    """Precompute table[anchor][corner], the factor of a cell dimension to
+    add to the anchor coordinate to get the corner coordinate"""
+    table = {}
+    for anchor, start in fractions.items():
+        table[anchor] = {}
+        for corner, stop in fractions.items():
+            offset = stop - start
+            # integral offsets keep integer coordinates integer
+            table[anchor][corner] = (
+                int(offset) if offset == int(offset) else offset
+            )
+    return table
+
+
+OFFSET_X = _offset_table(CORNER_X)
+OFFSET_Y = _offset_table(CORNER_Y)
 
 
 def _validate_corner(corner: Union[str, None]) -> str:
     if corner is None:
         return "center"
-    if corner in corner2center_x:
+    if corner in CORNER_X:
         return corner
     raise ValueError(f"Unexpected anchor/corner {corner}")
 
@@ -101,6 +106,9 @@ def _validate_corner(corner: Union[str, None]) -> str:
 class Cell:
     """Cell with static size"""
 
+    __slots__ = ("_x", "_y", "_width", "_height", "_anchor", "_offset_x",
+                 "_offset_y")
+
     def __init__(
         self, x: int, y: int, width: int, height: int, anchor: str = None
     ):
@@ -123,11 +131,8 @@ class Cell:
         if anchor is None:
             anchor = "center"  # center = default
         self._anchor = _validate_corner(anchor)
-
-    def _corners_differ(self, corner: Union[str, None]) -> bool:
-        if corner == self.anchor:
-            return False
-        return True
+        self._offset_x = OFFSET_X[self._anchor]
+        self._offset_y = OFFSET_Y[self._anchor]
 
     def get_x(self, corner: Union[str, None]) -> int:
         """Get x coordinate of a corner
@@ -138,12 +143,11 @@ class Cell:
             Which corner to get the coordinate from. None means cell's anchor.
             See anchor for possible values
         """
-        corner = _validate_corner(corner)
-        x = self.x
-        if self._corners_differ(corner):
-            x = corner2center_x[self.anchor](x, self.width)
-            x = center2corner_x[corner](x, self.width)
-        return x
+        try:
+            offset = self._offset_x["center" if corner is None else corner]
+        except KeyError:
+            raise ValueError(f"Unexpected anchor/corner {corner}") from None
+        return self._x + offset * self._width
 
     def set_x(self, x: int, corner: Union[str, None]):
         """Set x coordinate of a corner to the given value
@@ -156,7 +160,6 @@ class Cell:
             Which corner to get the coordinate from. None means cell's anchor.
             See anchor for possible values
         """
-        corner = _validate_corner(corner)
         self.x += x - self.get_x(corner)
 
     @property
@@ -177,12 +180,11 @@ class Cell:
             Which corner to get the coordinate from. None means cell's anchor.
             See anchor for possible values
         """
-        corner = _validate_corner(corner)
-        y = self.y
-        if self._corners_differ(corner):
-            y = corner2center_y[self.anchor](y, self.height)
-            y = center2corner_y[corner](y, self.height)
-        return y
+        try:
+            offset = self._offset_y["center" if corner is None else corner]
+        except KeyError:
+            raise ValueError(f"Unexpected anchor/corner {corner}") from None
+        return self._y + offset * self._height
 
     def set_y(self, y: int, corner: Union[str, None]):
         """Set y coordinate of a corner to the given value
@@ -195,7 +197,6 @@ class Cell:
             Which corner to get the coordinate from. None means cell's anchor.
             See anchor for possible values
         """
-        corner = _validate_corner(corner)
         self.y += y - self.get_y(corner)
 
     @property
@@ -368,9 +369,14 @@ class DepartureArtist(Artist):
     departure
     """
 
-    WIDTH_SPACE = textwidth(" ", d.FONT_DEPARTURE)
+    @property
+    def WIDTH_SPACE(self) -> int:  # pylint: disable=invalid-name
+        """Width of a space in defines.FONT_DEPARTURE"""
+        return d.WIDTH_SPACE_DEPARTURE
 
-    def __init__(self, canvas: Canvas, anchor: str = None):
+    def __init__(
+        self, canvas: Canvas, anchor: str = None, sprites: bool = None
+    ):
         """DepartureArtist constructor
 
         Will be constructed at (0, 0).
@@ -384,6 +390,9 @@ class DepartureArtist(Artist):
         anchor: str, optional
             Specify which point in the cell the coordinates (x, y) describe.
             Defaults to None (center). See anchor for possible values
+        sprites: bool, optional
+            Whether to show texts as pre-rasterized images, see sprites.py.
+            Defaults to None (defines.TEXT_SPRITES)
         """
         # create artist
         width = (
@@ -396,22 +405,61 @@ class DepartureArtist(Artist):
         super().__init__(canvas, 0, 0, width, height, anchor=anchor)
 
         # create contents
+        self.sprites = d.TEXT_SPRITES if sprites is None else sprites
+        # displayed sprites by item, tkinter deletes unreferenced images
+        self.shown_sprites: dict[int, d.PhotoImage] = {}
         self.last_tripid = None
+        self.last_shown = ()  # differs from any departure
         self.id_icon = self.canvas.create_image(0, 0, anchor="center")
-        self.id_drct = self.canvas.create_text(
-            0,
-            0,
-            text="could not fetch departure",
-            anchor="w",
-            font=d.FONT_DEPARTURE,
-            fill=d.COLOR_ERROR,
-        )
-        self.id_dots = self.canvas.create_text(
-            0, 0, anchor="e", font=d.FONT_DEPARTURE, fill=d.COLOR_TXT
-        )
-        self.id_time = self.canvas.create_text(
-            0, 0, anchor="e", font=d.FONT_DEPARTURE, fill=d.COLOR_TXT
+        self.id_drct = self.create_text(
+            "w", "could not fetch departure", d.COLOR_ERROR
         )
+        self.id_dots = self.create_text("e")
+        self.id_time = self.create_text("e")
+
+    def create_text(
+        self, anchor: str, text: str = "", fill: str = d.COLOR_TXT
+    ) -> int:
+        """Create a text item, or an image item showing a text sprite
+
+        Parameters
+        ----------
+        anchor: str
+            Item anchor
+        text: str, optional
+            Text to display. Defaults to ""
+        fill: str, optional
+            Text color. Defaults to defines.COLOR_TXT
+        """
+        if not self.sprites:
+            return self.canvas.create_text(
+                0, 0, text=text, anchor=anchor, font=d.FONT_DEPARTURE,
+                fill=fill
+            )
+        sprite = SPRITES.get(text, d.FONT_DEPARTURE, fill)
+        item = self.canvas.create_image(0, 0, image=sprite, anchor=anchor)
+        self.shown_sprites[item] = sprite
+        return item
+
+    def configure_text(self, item: int, text: str, fill: str = d.COLOR_TXT):
+        """Change text and color of an item created by create_text
+
+        Parameters
+        ----------
+        item: int
+            Item id
+        text: str
+            Text to display
+        fill: str, optional
+            Text color. Defaults to defines.COLOR_TXT
+        """
+        if not self.sprites:
+            self.canvas.itemconfigure(item, text=text, fill=fill)
+            return
+        sprite = SPRITES.get(text, d.FONT_DEPARTURE, fill)
+        if sprite is not self.shown_sprites[item]:
+            self.canvas.itemconfigure(item, image=sprite)
+            self.shown_sprites[item] = sprite
 
     def update_position(self):
         x = self.get_x("w")
@@ -435,6 +483,7 @@ class DepartureArtist(Artist):
             The departure information to display. None displays an error
         """
         tripid = getattr(departure, "id", None)
+        self.last_shown = self._shown(departure)
 
         if tripid != self.last_tripid:
             self.last_tripid = tripid
@@ -442,8 +491,26 @@ class DepartureArtist(Artist):
             self.configure_drct(departure)
         self.configure_time(departure)
 
+    def shows(self, departure: Union[Departure, None]) -> bool:
+        """Return True if updating to departure would not change the display
+        """
+        return self._shown(departure) == self.last_shown
+
+    @staticmethod
+    def _shown(departure: Union[Departure, None]) -> Union[tuple, None]:
+        """Displayed properties of a departure"""
+        if departure is None:
+            return None
+        time_left = departure.time_left
+        return (
+            departure.id,
+            None if time_left is None else floor(time_left),
+            departure.reachable,
+        )
+
     def clear_departure(self):
         """Display an error"""
+        self.last_shown = None
         self.last_tripid = None
         self.configure_icon(None)
         self.configure_drct(None)
@@ -459,21 +526,18 @@ class DepartureArtist(Artist):
         """
         # no deaprture found
         if departure is None:
-            self.canvas.itemconfigure(self.id_icon, image=d.ICONS.get("empty"))
+            self.canvas.itemconfigure(self.id_icon, image=d.icon("empty"))
             return
 
-        # get icon
-        icon = d.ICONS.get(departure.line, None)
+        # get icon, lines without icon get a generated badge
+        icon = d.icon(departure.line)
         if icon is None:
-            icon = d.ICONS.get(departure.product, None)
-            print(f"Warning: Fallback icon used for {departure.line}")
-        if icon is None:
-            icon = d.ICONS.get("default")
-            print(f"Warning: Default icon used for {departure.line}")
+            icon = BADGES.get(departure.line, departure.product)
 
         # configure
         self.canvas.itemconfigure(self.id_icon, image=icon)
 
+    @tracing.traced()
     def configure_drct(self, departure: Union[Departure, None]):
         """Change the displayed direction/destination
 
@@ -485,12 +549,10 @@ class DepartureArtist(Artist):
         # no departure found
         string = getattr(departure, "direction", None)
         if not isinstance(string, str):
-            self.canvas.itemconfigure(
-                self.id_drct,
-                text="could not fetch departure",
-                fill=d.COLOR_ERROR,
+            self.configure_text(
+                self.id_drct, "could not fetch departure", d.COLOR_ERROR
             )
-            self.canvas.itemconfigure(self.id_dots, text=" ")
+            self.configure_text(self.id_dots, " ")
             return
 
         # get display string and dots
@@ -519,8 +581,8 @@ class DepartureArtist(Artist):
             dots = ""
 
         # configure
-        self.canvas.itemconfigure(self.id_drct, text=string, fill=d.COLOR_TXT)
-        self.canvas.itemconfigure(self.id_dots, text=dots)
+        self.configure_text(self.id_drct, string)
+        self.configure_text(self.id_dots, dots)
 
     def configure_time(self, departure: Union[Departure, None]) -> str:
         """Change displayed remaining time
@@ -532,7 +594,7 @@ class DepartureArtist(Artist):
         """
         # no departure found
         if departure is None:
-            self.canvas.itemconfigure(self.id_time, text=" ")
+            self.configure_text(self.id_time, " ")
             return
 
         time = (
@@ -541,7 +603,7 @@ class DepartureArtist(Artist):
             else str(floor(departure.time_left))
         )
         color = d.COLOR_TXT if departure.reachable else d.COLOR_NOTIME
-        self.canvas.itemconfigure(self.id_time, text=time, fill=color)
+        self.configure_text(self.id_time, time, color)
 
 
 class TitleArtist(Artist):
@@ -550,7 +612,7 @@ class TitleArtist(Artist):
     """
 
     def __init__(
-        self, canvas: Canvas, text: str, font: Font = d.FONT_TITLE, anchor=None
+        self, canvas: Canvas, text: str, font: Font = None, anchor=None
     ):
         """TitleArtist constructor
 
@@ -569,6 +631,7 @@ class TitleArtist(Artist):
             Specify which point in the cell the coordinates (x, y) describe.
             Defaults to None (center). See anchor for possible values
         """
+        font = d.FONT_TITLE if font is None else font
         height = textheight(text, font)
         super().__init__(canvas, 0, 0, 1, height, anchor=anchor)
 
@@ -583,24 +646,32 @@ class TitleArtist(Artist):
 
 class EventArtist(Artist):
     """Display event information
-    Includes a date and a description
+    Includes a date and a description. The artist is reused for whichever
+    event it should show (see update_event), its canvas items are only
+    reconfigured
     """
 
-    WIDTH_SPACE = textwidth(" ", d.FONT_EVENT)
+    @property
+    def WIDTH_SPACE(self) -> int:  # pylint: disable=invalid-name
+        """Width of a space in defines.FONT_EVENT"""
+        return d.WIDTH_SPACE_EVENT
 
-    def __init__(self, canvas: Canvas, event: Event, anchor=None):
+    def __init__(
+        self, canvas: Canvas, events: Sequence[Event] = (), anchor=None
+    ):
         """EventArtist constructor
 
-        Will be constructed at (0, 0)
-        Size is determined defines.WIDTH_DATE, defines.FONT_EVENT and the
-        string event.desc
+        Will be constructed at (0, 0) and show nothing until update_event is
+        called. Size is determined by defines.WIDTH_DATE, defines.FONT_EVENT
+        and the largest of events, so that any of them can be shown without
+        changing the layout
 
         Parameters
         ----------
         canvas: tkinter.Canvas
             Canvas to draw on
-        event: Event
-            The event to display
+        events: list[Event], optional
+            The events the artist may display. Defaults to () (a single line)
         anchor: str, optional
             Specify which point in the cell the coordinates (x, y) describe.
             Defaults to None (center). See anchor for possible values
@@ -608,18 +679,22 @@ class EventArtist(Artist):
         width = (
             d.WIDTH_DATE
             + self.WIDTH_SPACE
-            + textwidth(event.desc, d.FONT_EVENT)
+            + max((textwidth(event.desc, d.FONT_EVENT) for event in events),
+                  default=0)
         )
         height = max(
-            textheight(event.date, d.FONT_EVENT),
-            textheight(event.desc, d.FONT_EVENT),
+            (max(textheight(event.date, d.FONT_EVENT),
+                 textheight(event.desc, d.FONT_EVENT))
+             for event in events),
+            default=lineheight(d.FONT_EVENT),
         )
         super().__init__(canvas, 0, 0, width, height, anchor=anchor)
 
+        self.event: Union[Event, None] = None
         self.id_date = self.canvas.create_text(
             0,
             0,
-            text=event.date,
+            text="",
             anchor="nw",
             font=d.FONT_EVENT,
             fill=d.COLOR_TXT,
@@ -627,7 +702,7 @@ class EventArtist(Artist):
         self.id_desc = self.canvas.create_text(
             0,
             0,
-            text=event.desc,
+            text="",
             anchor="nw",
             font=d.FONT_EVENT,
             fill=d.COLOR_TXT,
@@ -642,6 +717,24 @@ class EventArtist(Artist):
         )
         return super().update_position()
 
+    def update_event(self, event: Union[Event, None]):
+        """Update the displayed event, does nothing if it is already shown
+
+        Parameters
+        ----------
+        event: Event|None
+            The event to display. None displays nothing
+        """
+        if event == self.event:
+            return
+        self.event = event
+        self.canvas.itemconfigure(
+            self.id_date, text="" if event is None else event.date
+        )
+        self.canvas.itemconfigure(
+            self.id_desc, text="" if event is None else event.desc
+        )
+
 
 class PosterArtist(Artist):
     """Displays cycling posters"""
@@ -717,13 +810,16 @@ class ClockArtist(Artist):
 
     def update_clock(self):
         """Update clock to current time"""
-        timestr = datetime.now().strftime("%H:%M")
+        timestr = clock.now().strftime("%H:%M")
         self.canvas.itemconfigure(self.id_time, text=timestr)
 
 
 class GridCanvas(Canvas):
     """Canvas that evenly aligns artists in a grid
-    Automatically re-aligns artists if the canvas size changes
+    Automatically re-aligns artists if the canvas size changes. Bursts of
+    resize events are debounced, row and column sizes are cached until
+    artists are set or popped (artist sizes are fixed) and only artists whose
+    cell changed are moved.
     """
 
     def __init__(self, master, flush: str = None, **options):
@@ -741,11 +837,35 @@ class GridCanvas(Canvas):
             Keyword arguments passed to tkinter.Canvas.__init__()
         """
         super().__init__(master, **options)
-        self.bind("<Configure>", self.on_resize)
+        self.bind("<Configure>", self.on_configure)
 
         self.flush = _validate_corner(flush)
         self.artists: dict[tuple[int, int], Artist] = {}
 
+        # layout caches, see on_resize
+        self._sizes: Union[Tuple[List[int], List[int]], None] = None
+        self._cells: dict[tuple[int, int], Tuple[int, int, int, int]] = {}
+        self._size: Union[Tuple[int, int], None] = None
+        self._resize_job: Union[str, None] = None
+
+        # count canvas operations by shadowing methods on the instance, so
+        # there is no overhead if metrics are disabled
+        if debug.METRICS:
+            for operation in COUNTED_OPERATIONS:
+                method = getattr(self, operation)
+                setattr(self, operation, self._counted(method, operation))
+
+    def _counted(self, method: Callable, operation: str) -> Callable:
+        """Wrap a canvas method to count its calls"""
+        name = str(self)
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            CANVAS_OPERATIONS.inc(canvas=name, operation=operation)
+            return method(*args, **kwargs)
+
+        return wrapper
+
     def set(self, row: int, col: int, artist: Artist):
         """Set artist to grid position (row, col)
 
@@ -759,6 +879,8 @@ class GridCanvas(Canvas):
             Artist to place at (row, col)
         """
         self.artists[row, col] = artist
+        self._sizes = None
+        self._cells.pop((row, col), None)
 
     def get(self, row: int, col: int, *default) -> Union[Artist, Any]:
         """Get artist at grid position (row, col)
@@ -798,12 +920,19 @@ class GridCanvas(Canvas):
             The artist at grid position (row, col) or passed default value if
             grid position is empty
         """
+        self._sizes = None
+        self._cells.pop((row, col), None)
         return self.artists.pop((row, col), *default)
 
     def query_size(self):
         """Get minimal row and column sizes (widths, heights) required to place
         the artists in the grid
         """
+        if self._sizes is None:
+            self._sizes = self._query_size()
+        return self._sizes
+
+    def _query_size(self):
         widths = []
         heights = []
         for (row, col), artist in self.artists.items():
@@ -815,33 +944,67 @@ class GridCanvas(Canvas):
             heights[row] = max(heights[row], artist.height)
         return widths, heights
 
+    def on_configure(self, event):
+        """Canvas <Configure> event callback, debounces resizes
+        The first resize is laid out immediately, so the board shows up
+        without delay, later bursts (e.g. dragging a window border) once
+        RESIZE_DEBOUNCE_TIME ms after the last event.
+        """
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+            self._resize_job = None
+        if self._size is None:
+            self.on_resize(event)
+        else:
+            self._resize_job = self.after(
+                d.RESIZE_DEBOUNCE_TIME, self._on_debounced_resize, event
+            )
+
+    def _on_debounced_resize(self, event):
+        self._resize_job = None
+        if (event.width, event.height) != self._size or debug.DEBUG:
+            self.on_resize(event)
+
     @debug.Timed("artist position updates")
+    @tracing.traced("GridCanvas.on_resize")
     def on_resize(self, event):
-        """Canvas resize event callback, evenly space artists"""
+        """Evenly space artists in a canvas of the event's size, only artists
+        whose cell changed since the last layout are moved"""
+        self._size = (event.width, event.height)
         # delete debug outlines, since they will potentially be re-drawn
-        self.delete("debug_outlines")
+        if debug.DEBUG:
+            self.delete("debug_outlines")
+            self._cells.clear()  # redraw all outlines
 
         # calculate size and available padding for evenly spacing artists
         widths, heights = self.query_size()
         padx = (event.width - sum(widths)) / (1 + len(widths))
         pady = (event.height - sum(heights)) / (1 + len(heights))
+        flush_x = OFFSET_X["nw"][self.flush]
+        flush_y = OFFSET_Y["nw"][self.flush]
 
         # evenly place artists
-        y = pady
-        for row, height in enumerate(heights):
-            x = padx
-            for col, width in enumerate(widths):
-                # place artist if there is one
-                artist = self.artists.get((row, col), None)
-                if artist is not None:
-                    cell = Artist(self, x, y, width, height, anchor="nw")
-                    artist.set_x(cell.get_x(self.flush), self.flush)
-                    artist.set_y(cell.get_y(self.flush), self.flush)
-                    artist.update_position()
-
-                    # draw debug outlines
-                    if debug.DEBUG:
-                        cell.draw_debug_outlines(depth=0)
-                        artist.draw_debug_outlines(depth=1)
-                x += width + padx
-            y += height + pady
+        with self.batch():
+            y = pady
+            for row, height in enumerate(heights):
+                x = padx
+                for col, width in enumerate(widths):
+                    # place artist if there is one and its cell moved
+                    artist = self.artists.get((row, col), None)
+                    cell = (int(x), int(y), width, height)
+                    if (artist is not None
+                            and self._cells.get((row, col)) != cell):
+                        self._cells[row, col] = cell
+                        artist.set_x(cell[0] + flush_x * width, self.flush)
+                        artist.set_y(cell[1] + flush_y * height, self.flush)
+                        with tracing.span("update_position", row=row,
+                                          col=col):
+                            artist.update_position()
+
+                        # draw debug outlines
+                        if debug.DEBUG:
+                            outline = Artist(self, *cell, anchor="nw")
+                            outline.draw_debug_outlines(depth=0)
+                            artist.draw_debug_outlines(depth=1)
+                    x += width + padx
+                y += height + pady
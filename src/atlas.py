@@ -0,0 +1,173 @@
+"""Line icon atlas
+Instead of decoding and scaling every png in data/lines into its own image on
+startup, all icons are packed into a single atlas image with a name ->
+rectangle index. The atlas is cached on disk and rebuilt when an icon is
+added, removed or changed. Icons are cut out of the atlas when they are first
+displayed (tk: `image copy -from`, no pillow conversion), so lines that never
+depart from the configured stations cost no image memory.
+"""
+
+import hashlib
+import json
+import math
+from pathlib import Path
+from tkinter import PhotoImage as TkPhotoImage
+from typing import Callable, Dict, Iterator, List, Mapping, Tuple
+
+from PIL import Image
+
+from . import BACKEND
+from . import log
+
+
+LOG = log.get(__name__)
+
+Rect = Tuple[int, int, int, int]  # xmin, ymin, xmax, ymax
+
+
+def fingerprint(paths: List[Path], width: int, height: int) -> str:
+    """Hash of icon names, sizes and modification times and the icon size"""
+    digest = hashlib.sha1(f"{width}x{height}".encode())
+    for path in sorted(paths):
+        stat = path.stat()
+        entry = f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+        digest.update(entry.encode())
+    return digest.hexdigest()
+
+
+def build_atlas(
+    paths: List[Path], width: int, height: int
+) -> Tuple[Image.Image, Dict[str, Rect]]:
+    """Pack icons scaled to fit width x height into one image
+
+    Icons are placed in a grid of width x height cells and keep their aspect
+    ratio like defines.load_image.
+
+    Return
+    ------
+    tuple[PIL.Image.Image, dict[str, Rect]]
+        Atlas image and rectangle of every icon by file stem
+    """
+    paths = sorted(paths)
+    cols = max(1, math.ceil(math.sqrt(len(paths))))
+    rows = max(1, math.ceil(len(paths) / cols))
+    atlas = Image.new("RGBA", (cols * width, rows * height), (0, 0, 0, 0))
+    index = {}
+    for idx, path in enumerate(paths):
+        with Image.open(path) as image:
+            icon = image.convert("RGBA")
+        icon.thumbnail((width, height))
+        x = (idx % cols) * width
+        y = (idx // cols) * height
+        atlas.paste(icon, (x, y))
+        index[path.stem] = (x, y, x + icon.width, y + icon.height)
+    return atlas, index
+
+
+class IconAtlas(Mapping):
+    """Read only mapping of icon names to images cut out of an atlas"""
+
+    def __init__(
+        self,
+        atlas: Image.Image,
+        index: Dict[str, Rect],
+        photo_image: Callable[[Image.Image], object],
+    ):
+        """IconAtlas constructor
+
+        Parameters
+        ----------
+        atlas: PIL.Image.Image
+            Atlas image, see build_atlas
+        index: dict[str, Rect]
+            Rectangle of every icon in the atlas
+        photo_image: Callable[[PIL.Image.Image], object]
+            Image class of the backend, e.g. defines.PhotoImage
+        """
+        self.atlas = atlas
+        self.index = index
+        self._photo_image = photo_image
+        self._photo = None  # atlas image of the backend, created on demand
+        self._icons = {}
+
+    @classmethod
+    def load(
+        cls,
+        icon_path: Path,
+        cache_path: Path,
+        width: int,
+        height: int,
+        photo_image: Callable[[Image.Image], object],
+    ) -> "IconAtlas":
+        """Load the atlas of all pngs in icon_path from cache_path, rebuild
+        and cache it if the icons changed
+
+        Parameters
+        ----------
+        icon_path: Path
+            Directory of the icon pngs
+        cache_path: Path
+            Atlas image path, the index is stored next to it as json
+        width, height: int
+            Size the icons are scaled to fit in
+        photo_image: Callable[[PIL.Image.Image], object]
+            Image class of the backend, e.g. defines.PhotoImage
+        """
+        paths = list(icon_path.glob("*.png"))
+        key = fingerprint(paths, width, height)
+        index_path = cache_path.with_suffix(".json")
+        try:
+            cached = json.loads(index_path.read_text(encoding="utf-8"))
+            if cached["fingerprint"] == key:
+                with Image.open(cache_path) as atlas:
+                    atlas.load()
+                index = {name: tuple(rect)
+                         for name, rect in cached["icons"].items()}
+                return cls(atlas, index, photo_image)
+        except (OSError, ValueError, KeyError):
+            pass  # missing or broken cache
+
+        atlas, index = build_atlas(paths, width, height)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            atlas.save(cache_path)
+            index_path.write_text(
+                json.dumps({"fingerprint": key, "icons": index}),
+                encoding="utf-8",
+            )
+        except OSError as e:
+            LOG.warning("could not cache icon atlas", error=str(e))
+        return cls(atlas, index, photo_image)
+
+    def __getitem__(self, name: str):
+        icon = self._icons.get(name)
+        if icon is None:
+            rect = self.index[name]
+            icon = self._icons[name] = self._cut(rect)
+        return icon
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _cut(self, rect: Rect):
+        if BACKEND != "tk":
+            return self._photo_image(self.atlas.crop(rect))
+        # copy inside tk instead of converting every icon with pillow
+        if self._photo is None:
+            self._photo = self._photo_image(self.atlas)
+        icon = TkPhotoImage(width=rect[2] - rect[0], height=rect[3] - rect[1])
+        icon.tk.call(icon, "copy", str(self._photo), "-from", *rect)
+        return icon
+
+    @property
+    def bytes(self) -> int:
+        """Uncompressed size (4 bytes per pixel) of the atlas and the icons
+        cut out so far"""
+        size = 4 * self.atlas.width * self.atlas.height
+        for name in self._icons:
+            x0, y0, x1, y1 = self.index[name]
+            size += 4 * (x1 - x0) * (y1 - y0)
+        return size
@@ -0,0 +1,183 @@
+"""Generated line badges
+Lines without an icon in data/lines (replacement buses, new lines) get a
+badge with the line label on the base shape of their product, in the color
+of the product icon. Badges are rendered once per deployment: they are kept
+in memory and cached as png in data/cache/badges by (line, product, size).
+"""
+
+from functools import lru_cache
+import hashlib
+import re
+from typing import Dict, Set, Tuple, Union
+from xml.etree import ElementTree
+
+from PIL import Image, ImageDraw
+
+from . import debug
+from . import defines as d
+from . import log
+from .offscreen import OffscreenFont
+
+
+# bump to re-render cached badges after changing their style
+BADGE_VERSION = 1
+# rendering scale, badges are drawn larger and scaled down for smooth edges
+SUPERSAMPLE = 4
+# products drawn as pill instead of rectangle, like their line icons
+ROUND_PRODUCTS = ("suburban",)
+
+LOG = log.get(__name__)
+
+BADGE_REQUESTS = debug.REGISTRY.counter(
+    "mops_badge_requests_total",
+    "Badge requests of lines without icon by source (memory, disk, "
+    "rendered, fallback)",
+    ("source",),
+)
+
+BadgeKey = Tuple[str, str, Tuple[int, int]]  # line, product, size
+
+
+@lru_cache(maxsize=None)
+def base_size() -> Tuple[int, int]:
+    """Size of the badge base shape bus_base.svg"""
+    svg = ElementTree.parse(d.ICON_PATH / "bus_base.svg").getroot()
+    return int(float(svg.get("width"))), int(float(svg.get("height")))
+
+
+def product_color(product: str) -> Union[Tuple[int, ...], None]:
+    """Background color of a product icon (pixel at the top center), None
+    if the product has no icon"""
+    path = d.ICON_PATH / f"{product}.png"
+    if not path.is_file():
+        return None
+    with Image.open(path) as image:
+        image = image.convert("RGBA")
+        return image.getpixel((image.width // 2, 3))
+
+
+def render_badge(
+    label: str, color: Tuple[int, ...], size: Tuple[int, int], round_=False
+) -> Image.Image:
+    """Render label in white on a rectangle (or pill) of color, scaled to
+    fit size with the aspect ratio of the base shape"""
+    base_width, base_height = base_size()
+    scale = min(size[0] / base_width, size[1] / base_height)
+    width = max(1, round(base_width * scale))
+    height = max(1, round(base_height * scale))
+
+    big = (width * SUPERSAMPLE, height * SUPERSAMPLE)
+    image = Image.new("RGBA", big, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    radius = big[1] // 2 if round_ else 0
+    draw.rounded_rectangle((0, 0, big[0] - 1, big[1] - 1), radius, color)
+
+    # largest bold font fitting the shape, font sizes are points at 96 dpi
+    pixels = int(0.75 * big[1])
+    while True:
+        font = OffscreenFont(("Helvetica", pixels * 72 // 96, "bold")).pil
+        x0, y0, x1, y1 = draw.textbbox((0, 0), label, font=font)
+        if x1 - x0 <= 0.85 * (big[0] - 2 * radius // 3) or pixels <= 4:
+            break
+        pixels -= max(1, pixels // 10)
+    draw.text(
+        ((big[0] - (x1 + x0)) / 2, (big[1] - (y1 + y0)) / 2),
+        label, font=font, fill="#ffffff",
+    )
+    return image.resize((width, height), Image.LANCZOS)
+
+
+class BadgeCache:
+    """Badges of lines without icon, cached in memory and on disk"""
+
+    def __init__(self, path=d.CACHE_PATH / "badges"):
+        """BadgeCache constructor
+
+        Parameters
+        ----------
+        path: Path, optional
+            Directory of the cached pngs. Defaults to data/cache/badges
+        """
+        self.path = path
+        self._badges: Dict[BadgeKey, d.PhotoImage] = {}
+        self._colors: Dict[str, Union[Tuple[int, ...], None]] = {}
+        self._warned: Set[tuple] = set()
+
+    def _file(self, key: BadgeKey):
+        line, product, (width, height) = key
+        # readable and collision free file names for any line label
+        safe = re.sub(r"[^A-Za-z0-9]", "_", line)
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:8]
+        return self.path / (
+            f"v{BADGE_VERSION}_{product}_{safe}_{width}x{height}_{digest}.png"
+        )
+
+    def get(
+        self,
+        line: str,
+        product: str,
+        size: Tuple[int, int] = None,
+    ) -> d.PhotoImage:
+        """Badge of a line, the product icon or the default icon if the line
+        or product are unknown (warns once per line)
+
+        Parameters
+        ----------
+        line: str
+            Line label, e.g. "n65"
+        product: str
+            Line product, e.g. "bus"
+        size: tuple[int, int], optional
+            Size to fit the badge in. Defaults to None (line icon size)
+        """
+        if size is None:
+            size = (d.WIDTH_ICON, d.HEIGHT_ICON)
+        key = (line, product, tuple(size))
+        badge = self._badges.get(key)
+        if badge is not None:
+            BADGE_REQUESTS.inc(source="memory")
+            return badge
+
+        if product not in self._colors:
+            self._colors[product] = product_color(product)
+        color = self._colors[product]
+        if not isinstance(line, str) or not line or color is None:
+            BADGE_REQUESTS.inc(source="fallback")
+            return self._fallback(line, product)
+
+        file = self._file(key)
+        try:
+            with Image.open(file) as image:
+                image.load()
+            BADGE_REQUESTS.inc(source="disk")
+        except OSError:
+            image = render_badge(
+                line.upper(), color, key[2], product in ROUND_PRODUCTS
+            )
+            BADGE_REQUESTS.inc(source="rendered")
+            try:
+                self.path.mkdir(parents=True, exist_ok=True)
+                image.save(file)
+            except OSError as e:
+                self._warn(("cache",), "could not cache badges", error=str(e))
+        badge = self._badges[key] = d.PhotoImage(image)
+        return badge
+
+    def _fallback(self, line: str, product: str) -> d.PhotoImage:
+        icon = d.icon(product)
+        if icon is not None:
+            self._warn(("line", line), "fallback icon used", line=line,
+                       product=product)
+            return icon
+        self._warn(("line", line), "default icon used", line=line,
+                   product=product)
+        return d.icon("default")
+
+    def _warn(self, key: tuple, event: str, **fields):
+        """Log a warning once per key"""
+        if key not in self._warned:
+            self._warned.add(key)
+            LOG.warning(event, **fields)
+
+
+BADGES = BadgeCache()
@@ -0,0 +1,133 @@
+"""Submit tkinter canvas updates in a single tcl call
+Every canvas method call is a separate call from python into tcl. Inside
+BatchedCanvas.batch(), item updates (coords, itemconfigure, delete) are
+collected and passed as list objects to a tcl procedure that evaluates them
+in order when the outermost batch exits, with the same result as calling
+them one by one.
+"""
+
+from contextlib import contextmanager
+from tkinter import Canvas
+from typing import Iterator, List, Tuple, Union
+
+from . import debug
+from . import defines as d
+
+
+# evaluates every argument as a command given as list, no string parsing
+BATCH_PROC = "::mops_batch"
+BATCH_PROC_BODY = "foreach command $args {{*}$command}"
+
+BATCH_COMMANDS = debug.REGISTRY.histogram(
+    "mops_canvas_batch_commands",
+    "Canvas commands submitted per tcl call",
+    buckets=(1, 10, 50, 100, 500, 1_000, 5_000),
+)
+
+
+class BatchedCanvas(Canvas):
+    """tkinter canvas that can collect item updates and submit them at once
+
+    Queries (coords or itemconfigure without values, itemcget, bbox, ...) and
+    item creation submit collected updates first, so they see the same state
+    as without batching. Errors of collected updates are raised when the
+    batch is submitted, the updates before the failing one are applied.
+    """
+
+    def __init__(self, master=None, cnf=None, **kw):
+        super().__init__(master, cnf or {}, **kw)
+        self._commands: Union[List[Tuple], None] = None
+        self.tk.call("proc", BATCH_PROC, "args", BATCH_PROC_BODY)
+
+    @contextmanager
+    def batch(self, enabled: bool = None) -> Iterator[None]:
+        """Collect item updates until the outermost batch exits
+
+        Parameters
+        ----------
+        enabled: bool, optional
+            Whether to collect updates, False submits them one by one.
+            Defaults to None (defines.BATCH_CANVAS)
+        """
+        enabled = d.BATCH_CANVAS if enabled is None else enabled
+        if self._commands is not None or not enabled:
+            yield
+            return
+        self._commands = []
+        try:
+            yield
+        finally:
+            # updates before an exception were applied without batching, too
+            try:
+                self.submit()
+            finally:
+                self._commands = None
+
+    def submit(self):
+        """Evaluate the collected updates, called before queries"""
+        commands = self._commands
+        if not commands:
+            return
+        self._commands = []
+        BATCH_COMMANDS.observe(len(commands))
+        self.tk.call(BATCH_PROC, *commands)
+
+    # updates
+    # -------
+    def coords(self, *args):
+        if self._commands is not None and len(args) > 1:
+            self._commands.append((self._w, "coords") + args)
+            return []
+        self.submit()
+        return super().coords(*args)
+
+    def itemconfigure(self, tagOrId, cnf=None, **kw):
+        if self._commands is not None and (kw or isinstance(cnf, dict)):
+            options = self._options(cnf, kw)
+            self._commands.append((self._w, "itemconfigure", tagOrId)
+                                  + options)
+            return None
+        self.submit()
+        return super().itemconfigure(tagOrId, cnf, **kw)
+
+    itemconfig = itemconfigure
+
+    def delete(self, *args):
+        if self._commands is not None:
+            self._commands.append((self._w, "delete") + args)
+            return
+        super().delete(*args)
+
+    # queries and item creation
+    # -------------------------
+    def _create(self, itemType, args, kw):
+        self.submit()
+        return super()._create(itemType, args, kw)
+
+    def itemcget(self, tagOrId, option):
+        self.submit()
+        return super().itemcget(tagOrId, option)
+
+    def bbox(self, *args):
+        self.submit()
+        return super().bbox(*args)
+
+    def find_withtag(self, tagOrId):
+        self.submit()
+        return super().find_withtag(tagOrId)
+
+    def gettags(self, *args):
+        self.submit()
+        return super().gettags(*args)
+
+    def type(self, tagOrId):
+        self.submit()
+        return super().type(tagOrId)
+
+    def update(self):
+        self.submit()
+        super().update()
+
+    def update_idletasks(self):
+        self.submit()
+        super().update_idletasks()
@@ -0,0 +1,411 @@
+"""Micro benchmarks of the artist and layout layer
+Run with `python . --bench`. Benchmarks use the headless backend unless
+MOPSDISPLAY_BACKEND is set explicitly, results are written as json.
+"""
+
+from itertools import cycle
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from . import BACKEND
+from .app import APP
+from . import defines as d
+from .atlas import IconAtlas
+from .artist import Cell, DepartureArtist, GridCanvas, StackArtist
+from .batch import BatchedCanvas
+from .data import Departure
+
+
+# board sizes (number of artists) every benchmark runs with
+SIZES = (10, 100, 1000)
+# number of timed repetitions per benchmark and size
+REPEAT = 7
+# minimal seconds a single repetition should take, small boards are run
+# multiple times per repetition to reach it
+MIN_TIME = 0.05
+
+ANCHORS = ("nw", "n", "ne", "e", "se", "s", "sw", "w", "center")
+DIRECTIONS = (
+    "S Grünau",
+    "S+U Warschauer Str.",
+    "Flughafen BER Terminal 1-2 (Berlin)",
+    "Schienenersatzverkehr S Schöneweide Bhf",
+    "Johannisthal, Haeckelstr.",
+)
+
+# benchmark name -> setup(size) -> (function that processes the board once,
+# canvas the function draws on or None), None if the benchmark is not
+# available with the current backend
+Run = Callable[[], None]
+Setup = Callable[[int], Union[Tuple[Run, Optional[GridCanvas]], None]]
+BENCHMARKS: Dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> Callable:
+    """Register a benchmark setup function"""
+
+    def decorator(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def make_canvas(width: int = d.WIDTH_STATION_CANVAS) -> GridCanvas:
+    """Create a station canvas"""
+    return GridCanvas(
+        APP.root,
+        flush="w",
+        width=width,
+        height=d.HEIGHT_STATION_CANVAS,
+        background=d.COLOR_BG_STATION,
+        highlightthickness=0,
+    )
+
+
+def make_departures(count: int, offset: int = 0) -> List[Departure]:
+    """Create count synthetic departures with distinct trip ids"""
+    directions = cycle(DIRECTIONS)
+    return [
+        Departure(
+            id=f"trip-{offset + i}",
+            line="s46",
+            direction=next(directions),
+            time_left=float(i % 90),
+            delay=0.0,
+            product="suburban",
+            reachable=i % 3 != 0,
+        )
+        for i in range(count)
+    ]
+
+
+@benchmark("Cell.get_x/get_y")
+def bench_cell(size: int) -> Tuple[Run, None]:
+    """Query all corners of size cells with mixed anchors"""
+    anchors = cycle(ANCHORS)
+    cells = [Cell(i, i, 100, 20, anchor=next(anchors)) for i in range(size)]
+
+    def run():
+        for cell in cells:
+            for corner in ANCHORS:
+                cell.get_x(corner)
+                cell.get_y(corner)
+
+    return run, None
+
+
+@benchmark("StackArtist.update_position")
+def bench_stack(size: int) -> Tuple[Run, GridCanvas]:
+    """Reposition a stack of size departure artists"""
+    canvas = make_canvas()
+    artists = [DepartureArtist(canvas, anchor="w") for _ in range(size)]
+    stack = StackArtist(canvas, 0, 0, anchor="w", flush="w", artists=artists)
+
+    def run():
+        stack.x += 1
+        stack.update_position()
+
+    return run, canvas
+
+
+def make_grid(size: int, per_cell: int = 10) -> GridCanvas:
+    """Create a canvas with size departure artists stacked in a grid"""
+    canvas = make_canvas()
+    cells = max(1, size // per_cell)
+    cols = max(1, int(math.sqrt(cells)))
+    for idx in range(cells):
+        artists = [DepartureArtist(canvas, anchor="w")
+                   for _ in range(per_cell)]
+        stack = StackArtist(
+            canvas, 0, 0, anchor="w", flush="w", artists=artists
+        )
+        canvas.set(idx // cols, idx % cols, stack)
+    return canvas
+
+
+@benchmark("GridCanvas.query_size")
+def bench_query_size(size: int) -> Tuple[Run, GridCanvas]:
+    """Query row and column sizes of a grid of size departure artists,
+    without the cache of GridCanvas.query_size"""
+    canvas = make_grid(size)
+    return canvas._query_size, canvas  # pylint: disable=protected-access
+
+
+def batched(
+    run: Run, canvas: GridCanvas
+) -> Union[Tuple[Run, GridCanvas], None]:
+    """Run inside a forced canvas batch, None if the backend has no tcl"""
+    if not isinstance(canvas, BatchedCanvas):
+        return None
+
+    def run_batched():
+        with canvas.batch(enabled=True):
+            run()
+
+    return run_batched, canvas
+
+
+@benchmark("GridCanvas.on_resize")
+def bench_on_resize(size: int) -> Tuple[Run, GridCanvas]:
+    """Relayout a grid of size departure artists with alternating sizes"""
+    canvas = make_grid(size)
+    events = cycle([
+        SimpleNamespace(width=d.WIDTH_STATION_CANVAS,
+                        height=d.HEIGHT_STATION_CANVAS),
+        SimpleNamespace(width=d.WIDTH_STATION_CANVAS + 10,
+                        height=d.HEIGHT_STATION_CANVAS + 10),
+    ])
+
+    def run():
+        canvas.on_resize(next(events))
+
+    return run, canvas
+
+
+@benchmark("GridCanvas.on_resize (unchanged)")
+def bench_on_resize_unchanged(size: int) -> Tuple[Run, GridCanvas]:
+    """Relayout a grid of size departure artists to its current size, no
+    artist moves"""
+    canvas = make_grid(size)
+    event = SimpleNamespace(width=d.WIDTH_STATION_CANVAS,
+                            height=d.HEIGHT_STATION_CANVAS)
+    canvas.on_resize(event)
+
+    def run():
+        canvas.on_resize(event)
+
+    return run, canvas
+
+
+@benchmark("GridCanvas.on_resize (batched)")
+def bench_on_resize_batched(size: int) -> Union[Tuple[Run, GridCanvas], None]:
+    """Relayout with canvas updates submitted in a single tcl call
+    Only available with the tk backend
+    """
+    return batched(*bench_on_resize(size))
+
+
+@benchmark("DepartureArtist.configure_drct")
+def bench_configure_drct(size: int) -> Tuple[Run, GridCanvas]:
+    """Configure directions of size departure artists"""
+    canvas = make_canvas()
+    artists = [DepartureArtist(canvas, anchor="w") for _ in range(size)]
+    departures = make_departures(size)
+
+    def run():
+        for artist, departure in zip(artists, departures):
+            artist.configure_drct(departure)
+
+    return run, canvas
+
+
+@benchmark("DepartureArtist.update_departure (new trips)")
+def bench_update_new(
+    size: int, sprites: bool = False
+) -> Tuple[Run, GridCanvas]:
+    """Update size departure artists with trips they did not show before"""
+    canvas = make_canvas()
+    artists = [DepartureArtist(canvas, anchor="w", sprites=sprites)
+               for _ in range(size)]
+    boards = cycle([make_departures(size), make_departures(size, size)])
+
+    def run():
+        for artist, departure in zip(artists, next(boards)):
+            artist.update_departure(departure)
+
+    return run, canvas
+
+
+@benchmark("DepartureArtist.update_departure (new trips, batched)")
+def bench_update_new_batched(
+    size: int
+) -> Union[Tuple[Run, GridCanvas], None]:
+    """Full board refresh with canvas updates submitted in a single tcl call
+    Only available with the tk backend
+    """
+    return batched(*bench_update_new(size))
+
+
+@benchmark("DepartureArtist.update_departure (new trips, sprites)")
+def bench_update_new_sprites(size: int) -> Tuple[Run, GridCanvas]:
+    """Full board refresh showing texts as cached sprites (see sprites.py),
+    the boards repeat, so sprites are rasterized in the first runs only"""
+    return bench_update_new(size, sprites=True)
+
+
+@benchmark("DepartureArtist.update_departure (same trips)")
+def bench_update_same(size: int) -> Tuple[Run, GridCanvas]:
+    """Update size departure artists with the trips they already show"""
+    canvas = make_canvas()
+    artists = [DepartureArtist(canvas, anchor="w") for _ in range(size)]
+    departures = make_departures(size)
+    for artist, departure in zip(artists, departures):
+        artist.update_departure(departure)
+
+    def run():
+        for artist, departure in zip(artists, departures):
+            artist.update_departure(departure)
+
+    return run, canvas
+
+
+def icon_names(size: int) -> List[str]:
+    """Icon names of size departures, cycling through the lines"""
+    lines = cycle(sorted(file.stem for file in d.ICON_PATH.glob("*.png")))
+    return [next(lines) for _ in range(size)]
+
+
+@benchmark("load icons (per file)")
+def bench_icons_per_file(size: int) -> Tuple[Run, None]:
+    """Load every icon png into its own image on startup and look up the
+    icons of size departures"""
+    names = icon_names(size)
+
+    def run():
+        icons = {file.stem: d.load_image(file, d.WIDTH_ICON, d.HEIGHT_ICON)
+                 for file in d.ICON_PATH.glob("*.png")}
+        for name in names:
+            icons.get(name)
+
+    return run, None
+
+
+@benchmark("load icons (atlas)")
+def bench_icons_atlas(size: int) -> Tuple[Run, None]:
+    """Load the cached icon atlas and cut out the icons of size departures"""
+    names = icon_names(size)
+
+    def run():
+        icons = IconAtlas.load(d.ICON_PATH, d.ATLAS_PATH, d.WIDTH_ICON,
+                               d.HEIGHT_ICON, d.PhotoImage)
+        for name in names:
+            icons.get(name)
+
+    return run, None
+
+
+@benchmark("OffscreenCanvas.render (new trips)")
+def bench_render(size: int) -> Union[Tuple[Run, GridCanvas], None]:
+    """Update size departure artists and rasterize the damaged regions
+    Only available with the offscreen backend
+    """
+    canvas = make_grid(size)
+    if not hasattr(canvas, "render"):
+        return None
+    canvas.resize(d.WIDTH_STATION_CANVAS, d.HEIGHT_STATION_CANVAS)
+    artists = [artist for stack in canvas.artists.values()
+               for artist in stack._artists]  # pylint: disable=protected-access
+    boards = cycle([make_departures(size), make_departures(size, size)])
+    canvas.render()
+
+    def run():
+        for artist, departure in zip(artists, next(boards)):
+            artist.update_departure(departure)
+        canvas.render()
+
+    return run, canvas
+
+
+def measure(run: Run, repeat: int = REPEAT) -> Dict[str, float]:
+    """Time run, similar to timeit.Timer.autorange followed by repeat
+
+    Return
+    ------
+    dict[str, float]
+        Number of runs per repetition and min/median/max seconds per run
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        passed = time.perf_counter() - start
+        if passed >= MIN_TIME or number >= 1_000_000:
+            break
+        number *= 10
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        "number": number,
+        "min": min(times),
+        "median": statistics.median(times),
+        "max": max(times),
+    }
+
+
+def canvas_operations(run: Run, canvas: GridCanvas) -> Dict[str, int]:
+    """Count canvas operations of a single run (headless backend only)"""
+    if canvas is None or not hasattr(canvas, "operations"):
+        return {}
+    canvas.reset_operations()
+    run()
+    return dict(canvas.operations)
+
+
+def run_benchmarks(
+    names: Sequence[str] = None, sizes: Sequence[int] = SIZES
+) -> dict:
+    """Run benchmarks and collect their results
+
+    Parameters
+    ----------
+    names: list[str], optional
+        Benchmarks to run. Defaults to None (all)
+    sizes: list[int], optional
+        Board sizes to run the benchmarks with. Defaults to SIZES
+
+    Return
+    ------
+    dict
+        Environment information and one result per benchmark and size
+    """
+    names = list(BENCHMARKS) if names is None else names
+    results = []
+    for name in names:
+        for size in sizes:
+            setup = BENCHMARKS[name](size)
+            if setup is None:
+                continue  # not available with this backend
+            run, canvas = setup
+            result = measure(run)
+            results.append({
+                "name": name,
+                "size": size,
+                **result,
+                "per_artist": result["median"] / size,
+                "canvas_operations": canvas_operations(run, canvas),
+            })
+            print(f"{name} [{size}]: {result['median']*1e3:.3f}ms",
+                  file=sys.stderr)
+    return {
+        "backend": BACKEND,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def main(output: str = None, names: Sequence[str] = None,
+         sizes: Sequence[int] = SIZES):
+    """Run benchmarks and write json results to output (default stdout)"""
+    report = run_benchmarks(names, sizes)
+    text = json.dumps(report, indent=2)
+    if output is None:
+        print(text)
+    else:
+        with open(output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    APP.root.destroy()
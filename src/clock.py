@@ -0,0 +1,75 @@
+"""Injectable clock
+All code that depends on the current time asks this module, so the
+application can run on virtual time (see replay.py)
+"""
+
+from datetime import datetime, timedelta, tzinfo
+import time
+from typing import Union
+
+
+class Clock:
+    """Real time clock"""
+
+    def now(self, tz: Union[tzinfo, None] = None) -> datetime:
+        """Current time, see datetime.datetime.now"""
+        return datetime.now(tz)
+
+    def monotonic(self) -> float:
+        """Monotonic seconds, see time.monotonic"""
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        """Wait for seconds"""
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """Clock that only advances when sleeping, so waiting costs no time"""
+
+    def __init__(self, start: datetime):
+        """VirtualClock constructor
+
+        Parameters
+        ----------
+        start: datetime
+            Time the clock starts at, naive times are considered local
+        """
+        self.start = start.astimezone()
+        self.elapsed = 0.0
+
+    def now(self, tz: Union[tzinfo, None] = None) -> datetime:
+        now = self.start + timedelta(seconds=self.elapsed)
+        if tz is None:
+            return now.astimezone().replace(tzinfo=None)
+        return now.astimezone(tz)
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def sleep(self, seconds: float):
+        self.elapsed += max(0.0, seconds)
+
+
+CLOCK: Clock = Clock()
+
+
+def set_clock(clock: Clock):
+    """Replace the clock used by the application"""
+    global CLOCK  # pylint: disable=global-statement
+    CLOCK = clock
+
+
+def now(tz: Union[tzinfo, None] = None) -> datetime:
+    """Current time of the application clock"""
+    return CLOCK.now(tz)
+
+
+def monotonic() -> float:
+    """Monotonic seconds of the application clock"""
+    return CLOCK.monotonic()
+
+
+def sleep(seconds: float):
+    """Wait for seconds on the application clock"""
+    CLOCK.sleep(seconds)
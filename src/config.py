@@ -4,7 +4,6 @@ from pathlib import Path
 from typing import List, Tuple, Type
 
 import kdl
-from PIL.ImageTk import PhotoImage
 
 from . import defines as d
 from .data import Station, DirectionsAndProducts, Event, Poster
@@ -19,14 +18,15 @@ def strip(x):
 
 
 # pylint: disable=unused-argument
-def kdl2poster(string: kdl.String, raw: kdl.ParseFragment) -> PhotoImage:
-    """Convert kdl string to an image path relative to defines.POSTER_PATH"""
+def kdl2poster(string: kdl.String, raw: kdl.ParseFragment) -> Path:
+    """Convert kdl string to an image path relative to defines.POSTER_PATH,
+    the image is loaded by load_posters"""
     path = d.POSTER_PATH / string.value
     path = path.resolve()
 
     if not path.is_file():
         raise ValueError(f"Could not find file {path}")
-    return d.load_image(path, d.WIDTH_POSTER, d.HEIGHT_POSTER)
+    return path
 
 
 # pylint: disable=unused-argument
@@ -84,9 +84,26 @@ def load_config(path: Path):
     return doc
 
 
-def load_data() -> Tuple[List[Station], List[Event], List[Poster]]:
+def load_posters(posters: List[Poster]) -> List[Poster]:
+    """Load the poster images of posters parsed with images=False"""
+    return [
+        Poster(images=[d.load_image(path, d.WIDTH_POSTER, d.HEIGHT_POSTER)
+                       for path in poster.images])
+        for poster in posters
+    ]
+
+
+def load_data(
+    images: bool = True,
+) -> Tuple[List[Station], List[Event], List[Poster]]:
     """Load stations, events and posters from kdl config
 
+    Parameters
+    ----------
+    images: bool, optional
+        Whether to load the poster images, they need the root window.
+        Defaults to True, False leaves image paths (see load_posters)
+
     Returns
     -------
     stations: list[Station]
@@ -110,4 +127,7 @@ def load_data() -> Tuple[List[Station], List[Event], List[Poster]]:
     if posters is None:
         raise ValueError("Node 'posters' not found")
 
-    return stations.args, events.args, posters.args
+    posters = posters.args
+    if images:
+        posters = load_posters(posters)
+    return stations.args, events.args, posters
@@ -0,0 +1,291 @@
+"""Connection management of the API session
+Departure requests reuse pooled keep-alive connections. The pool holds a
+connection per concurrent request (POOL_SIZE), host names are resolved once
+per DNS_TTL, TCP keep-alive probes keep idle connections (and NAT entries)
+open between update cycles, and warm() replaces connections the server
+closed before a cycle instead of during its requests. Every new connection
+(TCP and TLS handshake) is counted and timed.
+
+Import after grequests (see data.load_http), gevent must patch socket and
+ssl first. warm() needs urllib3 2 and is skipped with a warning on older
+versions.
+"""
+
+# pylint: disable=protected-access
+from dataclasses import dataclass, field
+import socket
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import gevent
+import urllib3
+from requests import Request
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+
+from . import debug
+from . import log
+
+
+# pooled connections per host, the startup requests all stations at once
+POOL_SIZE = 16
+# seconds resolved addresses are reused
+DNS_TTL = 300
+# seconds a connection is idle before TCP keep-alive probes are sent, and
+# between probes. Below the update interval, so that idle connections are
+# kept open by NATs and firewalls and dead ones are detected
+KEEPALIVE_IDLE = 5
+KEEPALIVE_INTERVAL = 5
+KEEPALIVE_PROBES = 3
+# seconds warm() waits for new connections
+WARM_TIMEOUT = 3
+
+HANDSHAKES = debug.REGISTRY.counter(
+    "mops_http_handshakes_total",
+    "New connections (TCP and TLS handshake) by host",
+    ("host",),
+)
+HANDSHAKE_TIME = debug.REGISTRY.histogram(
+    "mops_http_handshake_seconds",
+    "Time to open a new connection (TCP and TLS handshake) by host",
+    ("host",),
+)
+DNS_LOOKUPS = debug.REGISTRY.counter(
+    "mops_dns_lookups_total",
+    "Host name resolutions by result (hit, miss, error)",
+    ("result",),
+)
+LOG = log.get(__name__)
+
+# warm() inspects pooled connections, urllib3 < 2 connections can not tell
+# whether they are open
+WARM_SUPPORTED = all(
+    hasattr(HTTPConnection, name) for name in ("is_closed", "is_connected")
+) and all(hasattr(HTTPConnectionPool, name)
+          for name in ("_get_conn", "_put_conn"))
+_warned = False
+
+DROPPED = debug.REGISTRY.counter(
+    "mops_http_dropped_connections_total",
+    "Pooled connections found closed by the server and replaced by warm",
+    ("host",),
+)
+
+
+def socket_options() -> List[Tuple[int, int, int]]:
+    """Default urllib3 socket options with TCP keep-alive"""
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    # per socket timings are not available on every platform
+    for name, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+                        ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                        ("TCP_KEEPCNT", KEEPALIVE_PROBES)):
+        if hasattr(socket, name):
+            option = getattr(socket, name)
+            options.append((socket.IPPROTO_TCP, option, value))
+    return options
+
+
+@dataclass
+class DNSEntry:
+    """Resolved addresses of a host"""
+
+    addresses: List[str]
+    expires: float  # time.monotonic()
+    # addresses that did not accept connections
+    failed: set = field(default_factory=set)
+
+
+class DNSCache:
+    """Cache of resolved host names"""
+
+    def __init__(self, ttl: float = DNS_TTL):
+        """DNSCache constructor
+
+        Parameters
+        ----------
+        ttl: float, optional
+            Seconds resolved addresses are reused. Defaults to DNS_TTL
+        """
+        self.ttl = ttl
+        self.entries: Dict[Tuple[str, int], DNSEntry] = {}
+
+    def resolve(self, host: str, port: int) -> str:
+        """Address to connect to, the host itself if it can not be resolved
+        (the connection then reports the error)"""
+        key = (host, port)
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            DNS_LOOKUPS.inc(result="hit")
+        else:
+            try:
+                infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+            except OSError:
+                DNS_LOOKUPS.inc(result="error")
+                return host
+            DNS_LOOKUPS.inc(result="miss")
+            # keep the resolver order (RFC 6724), drop duplicates
+            addresses = list(dict.fromkeys(info[4][0] for info in infos))
+            entry = self.entries[key] = DNSEntry(
+                addresses, time.monotonic() + self.ttl
+            )
+        for address in entry.addresses:
+            if address not in entry.failed:
+                return address
+        entry.failed.clear()  # all failed, start over
+        return entry.addresses[0]
+
+    def failed(self, host: str, port: int, address: str):
+        """Report that address did not accept a connection, other addresses
+        of the host are tried first until the entry expires"""
+        entry = self.entries.get((host, port))
+        if entry is not None:
+            entry.failed.add(address)
+
+
+DNS = DNSCache()
+
+
+class _CachedTimedConnection:
+    """Connection mixin resolving with DNS and recording handshakes"""
+
+    handshakes = 0  # connects of this connection
+    # set by urllib3's HTTPConnection the mixin is combined with
+    host: str
+    port: int
+    _dns_host: str
+
+    def connect(self):
+        """Connect to the cached address of the host"""
+        host = self.host
+        address = DNS.resolve(host, self.port)
+        self._dns_host = address  # TLS still verifies self.host
+        start = time.perf_counter()
+        try:
+            # connect of the HTTPConnection that follows in the mro
+            super().connect()  # pylint: disable=no-member
+        except (OSError, ConnectTimeoutError):
+            # includes NewConnectionError
+            DNS.failed(host, self.port, address)
+            raise
+        finally:
+            self._dns_host = host
+        self.handshakes += 1
+        HANDSHAKES.inc(host=host)
+        HANDSHAKE_TIME.observe(time.perf_counter() - start, host=host)
+
+
+class CachedHTTPConnection(_CachedTimedConnection, HTTPConnection):
+    """HTTPConnection with cached DNS and handshake metrics"""
+
+
+class CachedHTTPSConnection(_CachedTimedConnection, HTTPSConnection):
+    """HTTPSConnection with cached DNS and handshake metrics"""
+
+
+class CachedHTTPConnectionPool(HTTPConnectionPool):
+    """HTTPConnectionPool of CachedHTTPConnections"""
+
+    ConnectionCls = CachedHTTPConnection
+
+
+class CachedHTTPSConnectionPool(HTTPSConnectionPool):
+    """HTTPSConnectionPool of CachedHTTPSConnections"""
+
+    ConnectionCls = CachedHTTPSConnection
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """Transport adapter with sized pools of cached keep-alive connections"""
+
+    def __init__(self, pool_size: int = POOL_SIZE, **kwargs):
+        """KeepAliveAdapter constructor
+
+        Parameters
+        ----------
+        pool_size: int, optional
+            Connections kept per host. Defaults to POOL_SIZE
+        """
+        super().__init__(pool_maxsize=pool_size, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault("socket_options", socket_options())
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CachedHTTPConnectionPool,
+            "https": CachedHTTPSConnectionPool,
+        }
+
+
+def install(session, pool_size: int = POOL_SIZE):
+    """Mount KeepAliveAdapters on a requests session"""
+    adapter = KeepAliveAdapter(pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+def connection_pool(session, url: str) -> HTTPConnectionPool:
+    """Pool of the session used for requests to url"""
+    adapter = session.get_adapter(url)
+    # the ca bundle may be set by the environment, like in session.request
+    settings = session.merge_environment_settings(
+        url, {}, None, session.verify, session.cert
+    )
+    verify, cert = settings["verify"], settings["cert"]
+    if hasattr(adapter, "get_connection_with_tls_context"):
+        # requests >= 2.32 keys pools by their tls settings
+        request = session.prepare_request(Request("GET", url))
+        return adapter.get_connection_with_tls_context(
+            request, verify, cert=cert
+        )
+    pool = adapter.get_connection(url)
+    adapter.cert_verify(pool, url, verify, cert)
+    return pool
+
+
+def warm(session, url: str, count: int) -> int:
+    """Make sure the session's pool holds at least count open connections
+    to the host of url, replaces connections the server closed
+
+    Missing connections are opened concurrently, warm returns after all
+    opened or WARM_TIMEOUT. Returns the number of opened connections, 0
+    if warming is not supported (see WARM_SUPPORTED).
+    """
+    global _warned  # pylint: disable=global-statement
+    pool = connection_pool(session, url)
+    if not WARM_SUPPORTED or not hasattr(getattr(pool, "pool", None),
+                                         "queue"):
+        if not _warned:
+            _warned = True
+            LOG.warning("connection warming needs urllib3 2, skipped",
+                        urllib3=urllib3.__version__)
+        return 0
+    host = urlsplit(url).hostname
+    # idle connections come first (LIFO), dropped ones are returned closed.
+    # All idle connections are checked, not only count
+    idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+    conns = [pool._get_conn() for _ in range(max(count, idle))]
+    for conn in conns:
+        if conn.is_closed and conn.handshakes:
+            DROPPED.inc(host=host)
+    opening = [gevent.spawn(_connect, conn)
+               for conn in conns if conn.is_closed]
+    if opening:
+        gevent.joinall(opening, timeout=WARM_TIMEOUT)
+    for conn in conns:
+        if not conn.is_connected:
+            conn.close()  # failed or timed out, connects again on use
+        pool._put_conn(conn)
+    return sum(1 for greenlet in opening if greenlet.value)
+
+
+def _connect(conn) -> bool:
+    try:
+        conn.connect()
+    except (OSError, ConnectTimeoutError):
+        conn.close()
+        return False
+    return True
@@ -3,18 +3,116 @@ requests to obtain departure informations"""
 
 from __future__ import annotations
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Iterator, List, Union
-from dateutil import parser as dateparser
-from PIL.ImageTk import PhotoImage
-import grequests
-import requests
+from datetime import date, datetime
+import importlib
+import re
+import time
+from typing import TYPE_CHECKING, Iterator, List, Sequence, Tuple, Union
+from urllib.parse import urlsplit
+from . import clock
 from . import debug
+from . import endpoints
+from . import log
+from . import monitor
+from . import recorder
+from . import tracing
+
+if TYPE_CHECKING:
+    from PIL.ImageTk import PhotoImage
+    from requests import Response, Session
+
+
+# the http stack is imported on the first request (see load_http), gevent
+# monkey patching on import of grequests takes longer than the rest of the
+# startup together
+grequests = None
+requests = None  # pylint: disable=invalid-name
+session = None  # pylint: disable=invalid-name
+# concurrent requests of a station, connections kept open between cycles
+REQUEST_CONCURRENCY = 2
+
+
+def load_http() -> Session:
+    """Import grequests and requests and create the session on first call
+    grequests is imported first, gevent must patch ssl before requests
+    imports it
+    """
+    # pylint: disable=global-statement,import-outside-toplevel
+    global grequests, requests, session
+    if session is None:
+        grequests = importlib.import_module("grequests")
+        requests = importlib.import_module("requests")
+        from . import connections
+
+        session = requests.Session()
+        connections.install(session)
+    return session
+
+
+def parse_datetime(string: str, **kwargs) -> datetime:
+    """Parse a date and time with dateutil, imported on first use"""
+    from dateutil import parser  # pylint: disable=import-outside-toplevel
 
+    return parser.parse(string, **kwargs)
+
+
+def send_requests(urls: List[str]) -> Iterator[Response]:
+    """Send asynchronous GET requests, yield responses as they arrive
+    urls are relative to the API endpoint, each request is routed to the
+    best endpoint (see endpoints.py) whose pooled connections are checked
+    and opened first (see connections.py). Failed requests are skipped.
+    Replaced by replay.py to record or replay responses. Nothing is sent
+    before the first response is requested, so warming counts as waiting
+    (see monitor.waiting)
+    """
+    # pylint: disable=import-outside-toplevel
+    load_http()
+    from gevent.pool import Pool
+    from . import connections
+
+    router = endpoints.ROUTER
+    endpoint = router.candidates()[0]
+    # replace connections closed by the server since the last cycle, not if
+    # the endpoint is failing, the requests would wait a second time
+    if urls and endpoint.failures == 0:
+        try:
+            connections.warm(
+                session, endpoint.url, min(len(urls), REQUEST_CONCURRENCY)
+            )
+        except requests.RequestException:
+            pass  # invalid url, reported by the requests
+    pool = Pool(REQUEST_CONCURRENCY)
+    responses = pool.imap_unordered(lambda url: router.get(session, url), urls)
+    yield from (response for response in responses if response is not None)
+
+
+LOG = log.get(__name__)
 
-session = requests.Session()
 FETCH_DEPARTURE_TIMER = debug.TimedCumulative(name="fetch departures")
 
+FETCH_LATENCY = debug.REGISTRY.histogram(
+    "mops_fetch_latency_seconds",
+    "Time between sending a departure request and receiving its response "
+    "by station and endpoint (scheme and host)",
+    ("station", "endpoint"),
+)
+RESPONSE_BYTES = debug.REGISTRY.histogram(
+    "mops_response_bytes",
+    "Size of departure response bodies",
+    ("station",),
+    buckets=debug.SIZE_BUCKETS,
+)
+PARSE_TIME = debug.REGISTRY.histogram(
+    "mops_parse_seconds",
+    "Time to decode a departure response and create its departures",
+    ("station",),
+)
+FETCH_ERRORS = debug.REGISTRY.counter(
+    "mops_fetch_errors_total",
+    "Departure responses that could not be used",
+    ("station", "reason"),
+)
+
 
 @dataclass(frozen=True)
 class Event:
@@ -32,6 +130,85 @@ class Event:
     desc: str
 
 
+# DD.MM. with optional year (YY or YYYY)
+EVENT_DATE = re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4}|\d{2})?")
+
+
+def _event_date(year: int, month: str, day: str) -> Union[date, None]:
+    try:
+        return date(year, int(month), int(day))
+    except ValueError:
+        return None  # e.g. 29.02. in other years or 31.04.
+
+
+def _event_year(year: str) -> int:
+    return int(year) + (2000 if len(year) == 2 else 0)
+
+
+def event_days(event: Event, today: date) -> Union[Tuple[date, date], None]:
+    """First and last day of an event, None if its date contains no valid
+    DD.MM.(YYYY) date
+
+    A range like "08.12.-10.12." lasts from its first to its last date, the
+    last date is the next one on or after the first. Dates without year are
+    placed in the earliest year in which the event did not end before today.
+
+    Parameters
+    ----------
+    event: Event
+        Event whose date is parsed
+    today: datetime.date
+        Day dates without year are placed relative to
+    """
+    matches = [match.groups() for match in EVENT_DATE.finditer(event.date)]
+    if not matches:
+        return None
+    day, month, year = matches[0]
+    last_day, last_month, last_year = matches[-1]
+    if year is not None:
+        years = [_event_year(year)]
+    else:
+        # up to the next leap year for 29.02.
+        years = range(today.year - 1, today.year + 4)
+
+    days = None
+    for candidate in years:
+        first = _event_date(candidate, month, day)
+        if first is None:
+            continue
+        if last_year is not None:
+            lasts = [_event_date(_event_year(last_year), last_month,
+                                 last_day)]
+        else:
+            lasts = [_event_date(first.year + offset, last_month, last_day)
+                     for offset in (0, 1)]
+        last = next((last for last in lasts
+                     if last is not None and last >= first), first)
+        days = first, last
+        if last >= today:
+            break
+    return days
+
+
+def upcoming_events(
+    events: Sequence[Event], today: date, count: int
+) -> List[Event]:
+    """The next count events that did not end before today
+
+    Events are sorted by their first day, events without date (see
+    event_days) are never outdated and follow in config order.
+    """
+    dated, undated = [], []
+    for event in events:
+        days = event_days(event, today)
+        if days is None:
+            undated.append(event)
+        elif days[1] >= today:
+            dated.append((days[0], event))
+    dated.sort(key=lambda item: item[0])
+    return ([event for _, event in dated] + undated)[:count]
+
+
 @dataclass(frozen=True)
 class Poster:
     """Poster data
@@ -142,7 +319,7 @@ class Station:
     night: DirectionsAndProducts = None
 
     def __post_init__(self):
-        # prepare api urls for day time
+        # prepare api urls (relative to the endpoint) for day time
         day_urls = []
         if self.day is not None:
             day_urls = [self._get_url(self.day, drct)
@@ -157,9 +334,9 @@ class Station:
         object.__setattr__(self, "night_urls", night_urls)
 
     def _get_url(self, dap: DirectionsAndProducts, direction: str=None) -> Iterator[str]:
-        """Get BVG API url"""
+        """Get BVG API url relative to the endpoint, see endpoints.py"""
         url = (
-            f"https://v6.bvg.transport.rest/stops/{self.id}/departures?"
+            f"/stops/{self.id}/departures?"
             f"when=in+{self.min_time}+minutes&"
             f"duration={self.max_time-self.min_time}&"
             f"results={self.max_departures}&"
@@ -173,17 +350,26 @@ class Station:
         )
         return url if direction is None else url + f"&direction={direction}"
 
+    @property
+    def label(self) -> str:
+        """Unique station name used in metrics and logs
+        Titles are not unique, since columns of the same station have no title
+        """
+        return f"{self.id}@{self.row},{self.col}"
+
     @property
     def is_night(self) -> bool:
         """Return True if night options should be active"""
-        start = dateparser.parse(self.start_night)
-        stop = dateparser.parse(self.stop_night)
-        now = datetime.now()
+        now = clock.now()
+        start = parse_datetime(self.start_night, default=now)
+        stop = parse_datetime(self.stop_night, default=now)
         return time_is_between(start, now, stop)
 
     @FETCH_DEPARTURE_TIMER
+    @tracing.traced()
     def fetch_departures(self) -> List[Departure]:
         """Fetch departures from BVG API"""
+        fetch_start = time.perf_counter()
 
         # pick urls
         if self.is_night:
@@ -192,37 +378,82 @@ class Station:
             urls = self.day_urls
 
         # send asynchronous requests
-        requests = (grequests.get(url, session=session, timeout=30_000) 
-                    for url in urls)
-        responses = grequests.imap(requests)
+        # waiting for responses does not count as stalling the event loop
+        responses = monitor.waiting(send_requests(urls))
 
         # collect departues from responses
         departures = []
         for response in responses:
+            if tracing.TRACE:
+                # elapsed covers sending the request until the response
+                # headers arrived
+                wait = response.elapsed.total_seconds() * 1e6
+                tracing.TRACER.complete(
+                    "response wait", tracing.timestamp() - wait, wait,
+                    station=self.label, url=response.request.url,
+                    status=response.status_code,
+                )
+            if debug.METRICS:
+                latency = response.elapsed.total_seconds()
+                # not the url, queries would add series every cycle
+                parts = urlsplit(response.request.url)
+                FETCH_LATENCY.observe(
+                    latency, station=self.label,
+                    endpoint=f"{parts.scheme}://{parts.netloc}",
+                )
+                size = len(response.content)
+                RESPONSE_BYTES.observe(size, station=self.label)
+                start = time.perf_counter()
+
+            if not response.ok:
+                FETCH_ERRORS.inc(station=self.label, reason="status")
+                LOG.warning("departure request failed", station=self.label,
+                            status=response.status_code)
+                continue
+
             # try decoding response
             try:
-                data = response.json()
+                with tracing.span("json decode", station=self.label):
+                    data = response.json()
             except requests.exceptions.JSONDecodeError as e:
+                FETCH_ERRORS.inc(station=self.label, reason="json")
+                LOG.warning("could not decode departures",
+                            station=self.label, error=str(e))
                 continue
 
             for departure_data in data.get("departures", []):
                 # try extracting departure information from decoded response
                 try:
-                    departure = self._create_departure(departure_data)
-                except Exception as e:
-                    # report unconsidered errors
-                    print(departure_data)
-                    print(e)
+                    with tracing.span("_create_departure"):
+                        departure = self._create_departure(departure_data)
+                except Exception as e:  # pylint: disable=broad-except
+                    # report unconsidered errors, skip the departure
+                    FETCH_ERRORS.inc(station=self.label, reason="departure")
+                    trip = None
+                    if isinstance(departure_data, dict):
+                        trip = departure_data.get("tripId")
+                    LOG.warning(
+                        "could not create departure", station=self.label,
+                        trip=trip, error=repr(e),
+                    )
+                    LOG.debug("departure data", data=departure_data)
+                    continue
 
                 if departure is None:
                     continue
                 departures.append(departure)
 
+            if debug.METRICS:
+                passed = time.perf_counter() - start
+                PARSE_TIME.observe(passed, station=self.label)
+
         # do not use heapq.merge(), because it uses __eq__ (reserved for
         # Departure id comparison). sort() supposedly competes in speed by
         # detection of order trends: https://stackoverflow.com/a/38340755
         departures = list(dict.fromkeys(departures))  # duplicate filter
         departures.sort() # concatenated responses are not ordered
+        recorder.record("fetch", self.label, len(departures),
+                        time.perf_counter() - fetch_start)
         return departures
 
     def _create_departure(self, data: dict) -> Union[Departure, None]:
@@ -324,11 +555,11 @@ def time_is_between(
     time_is_between("10:00:00", Any, "10:00:00") # ValueError
     """
     if isinstance(start, str):
-        start = dateparser.parse(start)
+        start = parse_datetime(start)
     if isinstance(time, str):
-        time = dateparser.parse(time)
+        time = parse_datetime(time)
     if isinstance(stop, str):
-        stop = dateparser.parse(stop)
+        stop = parse_datetime(stop)
 
     if start == stop:
         raise ValueError(f"Cannot resolve ambiguous time span {start}->{stop}")
@@ -341,6 +572,6 @@ def time_is_between(
 
 def time_left(timestr: Union[str, None]) -> int:
     """Parse string and calculate remaining time in minutes"""
-    dep = dateparser.parse(timestr)
-    time = dep - datetime.now(dep.tzinfo)
+    dep = parse_datetime(timestr)
+    time = dep - clock.now(dep.tzinfo)
     return time.total_seconds() / 60
\ No newline at end of file
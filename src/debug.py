@@ -1,12 +1,31 @@
 """Debug and benchmark tools"""
 
+from bisect import bisect_left
 from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+from pathlib import Path
+import socket
+from threading import Lock, Thread
 import time
-from typing import Callable
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Union
 
 
 DEBUG = False
 BENCHMARK = False
+METRICS = False
+
+
+def rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, AttributeError, ValueError):
+        # maximum resident set size is the closest portable approximation
+        import resource  # pylint: disable=import-outside-toplevel
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
 
 
 class CycleWithIndex:
@@ -36,6 +55,13 @@ COLORS = CycleWithIndex(
 )
 
 
+def _log():
+    # log.py records its metrics in REGISTRY, import it on use
+    from . import log  # pylint: disable=import-outside-toplevel
+
+    return log.get(__name__)
+
+
 class Timed:
     """Execution time measurement class
     instances can be used as function decorator
@@ -47,15 +73,17 @@ class Timed:
         self.start = 0
 
     def __enter__(self):
-        if BENCHMARK:
+        if BENCHMARK or METRICS:
             self.start = time.perf_counter()
         return self
 
     def __exit__(self, *args):
-        if BENCHMARK:
+        if BENCHMARK or METRICS:
             passed = time.perf_counter() - self.start
             name = "unnamed code block" if self.name is None else self.name
-            print(f"Executing {name} took {passed:.6f}s")
+            TIMED_HISTOGRAM.observe(passed, name=name)
+            if BENCHMARK:
+                _log().info("timed", name=name, seconds=f"{passed:.6f}")
 
     def __call__(self, func: Callable):
         """function decorator"""
@@ -68,7 +96,7 @@ class Timed:
                 res = func(*args, **kwargs)
             return res
 
-        return wrapper if BENCHMARK else func
+        return wrapper if BENCHMARK or METRICS else func
 
 
 class TimedCumulative(Timed):
@@ -79,16 +107,384 @@ class TimedCumulative(Timed):
         self.time = 0
 
     def __exit__(self, *args):
-        if BENCHMARK:
+        if BENCHMARK or METRICS:
             passed = time.perf_counter() - self.start
             self.time += passed
+            name = "unnamed code block" if self.name is None else self.name
+            TIMED_HISTOGRAM.observe(passed, name=name)
 
     def readout(self):
-        """Print timer"""
+        """Log timer"""
         if BENCHMARK:
             name = "unnamed code block" if self.name is None else self.name
-            print(f"Executing {name} took {self.time:.6f}s until now")
+            _log().info("timed until now", name=name,
+                        seconds=f"{self.time:.6f}")
 
     def reset(self):
-        """Reset timer to 0"""
+        """Reset timer to 0
+        The accumulated time is recorded in the cumulative timer histogram
+        before it is discarded
+        """
+        if METRICS and self.time > 0:
+            name = "unnamed code block" if self.name is None else self.name
+            CUMULATIVE_HISTOGRAM.observe(self.time, name=name)
         self.time = 0
+
+
+# metrics
+# -------
+# Metrics are only recorded if METRICS is True. Every record call returns
+# immediately otherwise, so instrumented hot paths cost a single flag check.
+# Recorded metrics are exposed in the Prometheus text format, either through
+# an http endpoint (METRICS_PORT) or a periodically written file
+# (METRICS_PATH, e.g. for the node_exporter textfile collector)
+METRICS_PORT: Union[int, None] = 9105
+METRICS_PATH: Union[Path, None] = None
+METRICS_BACKUPS = 0
+
+LabelKey = Tuple[str, ...]
+
+# upper bucket bounds in seconds, ms resolution up to the 30s request timeout
+TIME_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0,
+)
+# upper bucket bounds in bytes, 256B to 4MiB
+SIZE_BUCKETS = tuple(256 * 4**i for i in range(8))
+
+
+class Metric:
+    """Base class of labelled metrics
+
+    A metric holds one value per combination of label values. Label values
+    are passed as keyword arguments to the record methods of subclasses.
+    Missing labels default to an empty string.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str = "", labels: Sequence[str] = ()):
+        """Metric constructor
+
+        Parameters
+        ----------
+        name: str
+            Metric name, should follow the prometheus naming conventions
+        doc: str, optional
+            Short description of the metric
+        labels: list[str], optional
+            Label names of the metric. Defaults to no labels
+        """
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values: dict = {}
+        self._lock = Lock()
+
+    def _key(self, labels: dict) -> LabelKey:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def reset(self):
+        """Remove all recorded values"""
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> Iterator[Tuple[str, dict, float]]:
+        """Yield (name, labels, value) for every exposed sample"""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Counter(Metric):
+    """Monotonically increasing value"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase counter by amount"""
+        if not METRICS:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Get counter value"""
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        """Set gauge to value"""
+        if not METRICS:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase gauge by amount (may be negative)"""
+        if not METRICS:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Get gauge value"""
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """Distribution of values in fixed buckets
+
+    Keeps a count per bucket, the total count and the sum of all observed
+    values. Percentiles are estimated by linear interpolation inside the
+    bucket the percentile falls into.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str = "",
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = TIME_BUCKETS,
+    ):
+        """Histogram constructor
+
+        Parameters
+        ----------
+        name, doc, labels:
+            See Metric.__init__
+        buckets: list[float], optional
+            Sorted upper bucket bounds. An overflow bucket (+Inf) is added
+            implicitly. Defaults to TIME_BUCKETS
+        """
+        super().__init__(name, doc=doc, labels=labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        """Record a value"""
+        if not METRICS:
+            return
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [bucket counts, count, sum]
+                entry = [[0] * (len(self.buckets) + 1), 0, 0.0]
+                self._values[key] = entry
+            entry[0][idx] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def count(self, **labels) -> int:
+        """Get number of observed values"""
+        entry = self._values.get(self._key(labels))
+        return 0 if entry is None else entry[1]
+
+    def percentile(self, q: float, **labels) -> float:
+        """Estimate the q-th percentile (0 <= q <= 1) of observed values
+        Returns NaN if nothing was observed
+        """
+        entry = self._values.get(self._key(labels))
+        if entry is None or entry[1] == 0:
+            return float("nan")
+        return self._percentile(q, entry)
+
+    def _percentile(self, q: float, entry: list) -> float:
+        counts, total, _ = entry
+        target = q * total
+        cumulative = 0
+        for idx, count in enumerate(counts):
+            if count > 0 and cumulative + count >= target:
+                if idx == len(self.buckets):
+                    # overflow bucket has no upper bound
+                    return self.buckets[-1]
+                lower = self.buckets[idx - 1] if idx > 0 else 0.0
+                upper = self.buckets[idx]
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def samples(self) -> Iterator[Tuple[str, dict, float]]:
+        with self._lock:
+            items = [
+                (key, list(counts), total, summed)
+                for key, (counts, total, summed) in self._values.items()
+            ]
+        for key, counts, total, summed in items:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            bounds = [repr(float(b)) for b in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": bound}, cumulative
+            yield f"{self.name}_sum", labels, summed
+            yield f"{self.name}_count", labels, total
+
+    def quantiles(
+        self, qs: Sequence[float] = (0.5, 0.95, 0.99)
+    ) -> Iterator[Tuple[str, dict, float]]:
+        """Yield estimated quantile samples, see Histogram.percentile"""
+        with self._lock:
+            items = [
+                (key, [list(entry[0]), entry[1], entry[2]])
+                for key, entry in self._values.items()
+            ]
+        for key, entry in items:
+            labels = dict(zip(self.labels, key))
+            for q in qs:
+                value = self._percentile(q, entry)
+                yield f"{self.name}_quantile", {**labels, "quantile": str(q)}, value
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    def escape(value: str) -> str:
+        return (value.replace("\\", r"\\")
+                .replace("\n", r"\n")
+                .replace('"', r"\""))
+    content = ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+    return "{" + content + "}"
+
+
+class MetricsRegistry:
+    """Collection of named metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = cls(name, *args, **kwargs)
+            self._metrics[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} already exists as {metric.kind}")
+        return metric
+
+    def counter(self, name: str, doc: str = "", labels=()) -> Counter:
+        """Get or create a Counter, see Metric.__init__"""
+        return self._get_or_create(Counter, name, doc=doc, labels=labels)
+
+    def gauge(self, name: str, doc: str = "", labels=()) -> Gauge:
+        """Get or create a Gauge, see Metric.__init__"""
+        return self._get_or_create(Gauge, name, doc=doc, labels=labels)
+
+    def histogram(
+        self, name: str, doc: str = "", labels=(), buckets=TIME_BUCKETS
+    ) -> Histogram:
+        """Get or create a Histogram, see Histogram.__init__"""
+        return self._get_or_create(
+            Histogram, name, doc=doc, labels=labels, buckets=buckets
+        )
+
+    def __iter__(self) -> Iterator[Metric]:
+        return iter(list(self._metrics.values()))
+
+    def reset(self):
+        """Remove all recorded values of all metrics"""
+        for metric in self:
+            metric.reset()
+
+    def render(self) -> str:
+        """Render all metrics in the prometheus text exposition format
+        Histograms additionally expose estimated p50/p95/p99 quantiles as
+        gauges named <histogram>_quantile
+        """
+        lines: List[str] = []
+        for metric in self:
+            lines.append(f"# HELP {metric.name} {metric.doc}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            if isinstance(metric, Histogram):
+                lines.append(f"# TYPE {metric.name}_quantile gauge")
+                for name, labels, value in metric.quantiles():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+TIMED_HISTOGRAM = REGISTRY.histogram(
+    "mops_timed_seconds", "Execution time of Timed code blocks", ("name",)
+)
+CUMULATIVE_HISTOGRAM = REGISTRY.histogram(
+    "mops_timed_cumulative_seconds",
+    "Accumulated time of TimedCumulative code blocks between resets",
+    ("name",),
+)
+
+
+class ThreadingServer(ThreadingHTTPServer):
+    """Http server handling every request in a daemon thread
+
+    grequests monkey patches sockets with gevent sockets, which can only be
+    used in the thread that created them, so request sockets are recreated
+    in their handler thread.
+    """
+
+    daemon_threads = True
+
+    def process_request_thread(self, request, client_address):
+        request = socket.socket(fileno=request.detach())
+        super().process_request_thread(request, client_address)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serve REGISTRY.render() on /metrics"""
+
+    def do_GET(self):
+        """Handle GET request"""
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Do not log scrapes"""
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve metrics on http://host:port/metrics from a daemon thread"""
+    server = ThreadingServer((host, port), _MetricsHandler)
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def write_metrics(path: Path, backups: int = 0):
+    """Atomically write metrics to path
+
+    Parameters
+    ----------
+    path: Path
+        File to write to
+    backups: int, optional
+        Number of previous snapshots to keep as path.1, path.2, ...
+        Defaults to 0 (overwrite)
+    """
+    path = Path(path)
+    for idx in range(backups, 0, -1):
+        src = path if idx == 1 else path.with_name(f"{path.name}.{idx-1}")
+        if src.exists():
+            os.replace(src, path.with_name(f"{path.name}.{idx}"))
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(REGISTRY.render(), encoding="utf-8")
+    os.replace(tmp, path)
@@ -1,20 +1,66 @@
 """Project globals
-Define display properties (sizes, fonts, colors), update times and paths
+Define display properties (sizes, fonts, colors), update times and paths.
+Fonts, sizes measured with them and images are created on first access (see
+Lazy), so importing defines needs no display.
 """
 
+import hashlib
 from pathlib import Path
-from tkinter.font import Font
-from typing import List, Tuple
+import sys
+from typing import Any, Callable, Dict, List, Tuple
 from PIL.Image import open as open_image
-from PIL.ImageTk import PhotoImage
+from . import BACKEND
+from .atlas import IconAtlas
+
+if BACKEND == "headless":
+    from .headless import RecordingFont as Font
+    from .headless import RecordingImage as PhotoImage
+elif BACKEND == "offscreen":
+    from .offscreen import OffscreenFont as Font
+    from .offscreen import OffscreenImage as PhotoImage
+else:
+    from tkinter.font import Font
+    from PIL.ImageTk import PhotoImage
+
+
+class Lazy:
+    """Module global created by factory on first access"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+
+
+# factories of Lazy globals, moved here at the end of the module
+_LAZY: Dict[str, Callable[[], Any]] = {}
+_module = sys.modules[__name__]
+
+
+def __getattr__(name: str) -> Any:
+    factory = _LAZY.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = factory()
+    return value
+
+
+def _root():
+    """Root window, tkinter fonts and images can only be created after it"""
+    from .app import APP  # pylint: disable=import-outside-toplevel
+
+    return APP.root
+
+
+def _font(*font) -> Font:
+    _root()
+    return Font(font=font)
 
 
 # used fonts
 # ----------
-FONT_TITLE = Font(font=("Helvetica", 24, "bold"))
-FONT_DEPARTURE = Font(font=("Helvetica", 17, "bold"))
-FONT_EVENT = Font(font=("Helvetica", 17, "bold"))
-FONT_CLOCK = Font(font=("Helvetica", 17, "bold"))
+FONT_TITLE = Lazy(lambda: _font("Helvetica", 24, "bold"))
+FONT_DEPARTURE = Lazy(lambda: _font("Helvetica", 17, "bold"))
+FONT_EVENT = Lazy(lambda: _font("Helvetica", 17, "bold"))
+FONT_CLOCK = Lazy(lambda: _font("Helvetica", 17, "bold"))
 
 # canvas sizes
 # ----------------
@@ -29,14 +75,20 @@ HEIGHT_EVENT_CANVAS = HEIGHT_ROOT
 
 # station departure sizes
 # -----------------------
-HEIGHT_ICON = FONT_DEPARTURE.metrics("linespace")
+HEIGHT_ICON = Lazy(lambda: _module.FONT_DEPARTURE.metrics("linespace"))
 WIDTH_ICON = 40
 WIDTH_DIRECTION = 250
-WIDTH_TIME = FONT_DEPARTURE.measure("00")  # space for MM time format
+WIDTH_SPACE_DEPARTURE = Lazy(lambda: _module.FONT_DEPARTURE.measure(" "))
+# space for MM time format
+WIDTH_TIME = Lazy(lambda: _module.FONT_DEPARTURE.measure("00"))
 
 # information sizes
 # -----------------
-WIDTH_DATE = FONT_EVENT.measure("00.00.")  # space for DD.MM. date format
+WIDTH_SPACE_EVENT = Lazy(lambda: _module.FONT_EVENT.measure(" "))
+# space for DD.MM. date format
+WIDTH_DATE = Lazy(lambda: _module.FONT_EVENT.measure("00.00."))
+# number of upcoming events shown, events disappear after their (last) day
+MAX_EVENTS = 5
 HEIGHT_POSTER = 350
 WIDTH_POSTER = 450
 HEIGHT_LOGO = 150
@@ -52,10 +104,29 @@ COLOR_BG_INFO = "#4070c5"  # information background
 
 # update times
 # ------------
+# stations, events, posters and clocks update on multiples of their update
+# time in local time (see scheduler.py), the clock on the exact minute
 STATION_UPDATE_TIME = 10_000
 EVENT_UPDATE_TIME = 60_000
 POSTER_UPDATE_TIME = 60_000
-CLOCK_UPDATE_TIME = 10_000
+CLOCK_UPDATE_TIME = 60_000
+METRICS_UPDATE_TIME = 60_000  # only used if debug.METRICS_PATH is set
+# late poster changes are skipped, so that displays change posters in sync
+POSTER_DEADLINE = 5_000
+# milliseconds departure updates may block the event loop at once, see
+# render.py
+RENDER_BUDGET = 8
+# submit the canvas updates of a render slice or relayout in a single tcl
+# call (tk backend, see batch.py). Calls into the embedded tcl interpreter
+# are cheap, batching did not pay off in benchmarks (python . --bench)
+BATCH_CANVAS = False
+# milliseconds without resize events before the grids are laid out again
+RESIZE_DEBOUNCE_TIME = 50
+# show departure texts as pre-rasterized images (see sprites.py), the cache
+# is bounded by number of sprites and uncompressed bytes
+TEXT_SPRITES = False
+SPRITE_CACHE_COUNT = 1_024
+SPRITE_CACHE_BYTES = 16 * 2**20
 
 # resource paths
 # --------------
@@ -65,18 +136,59 @@ POSTER_PATH = PATH / "posters"
 CONFIG_PATH = PATH / "config.kdl"
 LOGO_PATH = PATH / "logo.png"
 ICON_PATH = PATH / "lines"
+CACHE_PATH = PATH / "cache"  # generated files, safe to delete
+ATLAS_PATH = CACHE_PATH / "lines.png"
+
+
+IMAGE_CACHE_PATH = CACHE_PATH / "images"
 
 
 def load_image(path: Path, width: int, height: int) -> PhotoImage:
-    """Load a tkinter image with pillow"""
-    image = open_image(path)
-    image.thumbnail((width, height))
+    """Load a tkinter image with pillow
+    Scaled images are cached in IMAGE_CACHE_PATH, decoding large images
+    (e.g. the logo) dominates startup otherwise
+    """
+    _root()
+    stat = path.stat()
+    key = f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    key += f":{width}x{height}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    cached = IMAGE_CACHE_PATH / f"{path.stem}_{digest}.png"
+    try:
+        image = open_image(cached)
+        image.load()
+    except OSError:
+        image = open_image(path)
+        image.thumbnail((width, height))
+        try:
+            IMAGE_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+            image.save(cached, compress_level=1)
+        except OSError:
+            pass  # e.g. read only deployment, load uncached
     return PhotoImage(image)
 
 
-ICONS = {file.stem: load_image(file, WIDTH_ICON, HEIGHT_ICON)
-         for file in ICON_PATH.glob("*.png")}
-LOGO = load_image(LOGO_PATH, WIDTH_LOGO, HEIGHT_LOGO)
+def _load_icons():
+    _root()
+    if ICON_ATLAS:
+        return IconAtlas.load(
+            ICON_PATH, ATLAS_PATH, WIDTH_ICON, _module.HEIGHT_ICON, PhotoImage
+        )
+    return {file.stem: load_image(file, WIDTH_ICON, _module.HEIGHT_ICON)
+            for file in ICON_PATH.glob("*.png")}
+
+
+# line icons are cut out of a cached atlas on first use (see atlas.py),
+# False loads every png into its own image
+ICON_ATLAS = True
+ICONS = Lazy(_load_icons)
+LOGO = Lazy(lambda: load_image(LOGO_PATH, WIDTH_LOGO, HEIGHT_LOGO))
+
+
+def icon(name: str, default: Any = None) -> Any:
+    """Line icon of name (see ICONS), default if there is none"""
+    return _module.ICONS.get(name, default)
+
 
 # direction name replacement filter
 # ---------------------------------
@@ -87,3 +199,11 @@ DIRECTION_FILTER: List[Tuple[str, str]] = [
     ("Bhf", ""),
     ("Flughafen BER", "BER"),
 ]
+
+
+# first access of Lazy globals calls __getattr__
+for _name, _value in list(globals().items()):
+    if isinstance(_value, Lazy):
+        _LAZY[_name] = _value.factory
+        del globals()[_name]
+del _name, _value
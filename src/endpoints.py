@@ -0,0 +1,206 @@
+"""Departure API endpoints
+Departure requests can be served by several compatible endpoints, e.g. the
+public v6.bvg.transport.rest, a self-hosted hafas-rest-api or a local caching
+proxy. Every request goes to the fastest healthy endpoint (endpoints within
+PREFERENCE_MARGIN of the fastest in configured order) and is retried once on
+the next one if it fails. Endpoints failing FAILURE_THRESHOLD times in a row
+are skipped for RETRY_TIME (doubled per failed retry), endpoints that got no
+requests for PROBE_INTERVAL are measured with a single request, so traffic
+fails back once a preferred endpoint is healthy or fast again.
+"""
+
+import time
+from typing import List
+
+from . import debug
+from . import recorder
+
+
+# base urls in order of preference, see configure
+API_URLS = ["https://v6.bvg.transport.rest"]
+# connect and read timeout of a request in seconds
+TIMEOUT = (3, 10)
+# endpoints tried per request
+MAX_ATTEMPTS = 2
+# weight of a new sample in the moving average of an endpoint's latency
+LATENCY_SMOOTHING = 0.2
+# an endpoint configured earlier is preferred unless the fastest one is more
+# than this factor faster, avoids flapping between similar endpoints
+PREFERENCE_MARGIN = 1.5
+# consecutive failures until an endpoint is skipped
+FAILURE_THRESHOLD = 3
+# seconds an unhealthy endpoint is skipped, doubled per failed retry
+RETRY_TIME = 10
+MAX_RETRY_TIME = 300
+# seconds without requests until an endpoint is measured again
+PROBE_INTERVAL = 60
+
+REQUESTS = debug.REGISTRY.counter(
+    "mops_endpoint_requests_total",
+    "Departure requests by endpoint and result (ok, error)",
+    ("endpoint", "result"),
+)
+LATENCY = debug.REGISTRY.gauge(
+    "mops_endpoint_latency_seconds",
+    "Moving average of the response time of an endpoint",
+    ("endpoint",),
+)
+HEALTHY = debug.REGISTRY.gauge(
+    "mops_endpoint_healthy",
+    "Whether an endpoint receives requests (1) or is skipped (0)",
+    ("endpoint",),
+)
+FAILOVERS = debug.REGISTRY.counter(
+    "mops_endpoint_failovers_total",
+    "Requests retried on another endpoint",
+)
+
+
+def is_failure(response) -> bool:
+    """Whether a response indicates a problem of the endpoint rather than
+    of the request (server errors, rate limits)"""
+    return response.status_code >= 500 or response.status_code == 429
+
+
+class Endpoint:
+    """Latency and health of a departure API endpoint"""
+
+    def __init__(self, url: str):
+        """Endpoint constructor
+
+        Parameters
+        ----------
+        url: str
+            Base url, e.g. "https://v6.bvg.transport.rest"
+        """
+        self.url = url.rstrip("/")
+        self.latency: float = None  # seconds, moving average
+        self.failures = 0  # consecutive
+        self.retry_at = 0.0  # time.monotonic() of the next retry if unhealthy
+        self.backoff = RETRY_TIME
+        self.last_used = float("-inf")  # time.monotonic()
+        HEALTHY.set(1, endpoint=self.url)
+
+    @property
+    def healthy(self) -> bool:
+        """Whether the endpoint failed less than FAILURE_THRESHOLD times in a
+        row"""
+        return self.failures < FAILURE_THRESHOLD
+
+    def success(self, seconds: float):
+        """Record a successful request that took seconds"""
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+        self.failures = 0
+        self.backoff = RETRY_TIME
+        REQUESTS.inc(endpoint=self.url, result="ok")
+        LATENCY.set(self.latency, endpoint=self.url)
+        HEALTHY.set(1, endpoint=self.url)
+
+    def failure(self):
+        """Record a failed request"""
+        self.failures += 1
+        REQUESTS.inc(endpoint=self.url, result="error")
+        if self.failures >= FAILURE_THRESHOLD:
+            self.retry_at = time.monotonic() + self.backoff
+            self.backoff = min(2 * self.backoff, MAX_RETRY_TIME)
+            HEALTHY.set(0, endpoint=self.url)
+
+
+class Router:
+    """Route requests to the fastest healthy endpoint"""
+
+    def __init__(self, urls: List[str]):
+        """Router constructor
+
+        Parameters
+        ----------
+        urls: list[str]
+            Base urls of the endpoints in order of preference
+        """
+        if not urls:
+            raise ValueError("No API endpoint configured")
+        self.endpoints = [Endpoint(url) for url in urls]
+
+    def candidates(self) -> List[Endpoint]:
+        """Endpoints to try for the next request, in order"""
+        healthy = [e for e in self.endpoints if e.healthy]
+        measured = [e.latency for e in healthy if e.latency is not None]
+        fastest = min(measured, default=0.0)
+
+        def rank(endpoint: Endpoint):
+            slow = (endpoint.latency is None
+                    or endpoint.latency > PREFERENCE_MARGIN * fastest)
+            return slow, self.endpoints.index(endpoint)
+
+        unhealthy = [e for e in self.endpoints if not e.healthy]
+        ranked = sorted(healthy, key=rank) + sorted(
+            unhealthy, key=lambda endpoint: endpoint.retry_at
+        )
+
+        # a single request measures a stale endpoint or retries one (see
+        # get, which updates last_used and retry_at)
+        now = time.monotonic()
+        for endpoint in ranked:
+            if endpoint.healthy:
+                probe = now - endpoint.last_used > PROBE_INTERVAL
+            else:
+                probe = endpoint.retry_at <= now
+            if probe:
+                ranked.remove(endpoint)
+                return [endpoint] + ranked
+        return ranked
+
+    def get(self, session, path: str):
+        """Send a GET request for path to the best endpoints until one
+        succeeds
+
+        Parameters
+        ----------
+        session: requests.Session
+            Session to send the request with
+        path: str
+            Path and query relative to the endpoint, e.g.
+            "/stops/900100001/departures?results=10"
+
+        Returns
+        -------
+        requests.Response or None
+            Response of the last attempt, None if no endpoint responded
+        """
+        response = None
+        for attempt, endpoint in enumerate(self.candidates()[:MAX_ATTEMPTS]):
+            if attempt:
+                FAILOVERS.inc()
+            endpoint.last_used = time.monotonic()
+            if not endpoint.healthy:
+                endpoint.retry_at = endpoint.last_used + endpoint.backoff
+            url = endpoint.url + path
+            start = time.perf_counter()
+            try:
+                response = session.get(url, timeout=TIMEOUT)
+            except OSError:  # includes requests.RequestException
+                recorder.record("request", url, None,
+                                time.perf_counter() - start)
+                endpoint.failure()
+                continue
+            recorder.record("request", url, response.status_code,
+                            time.perf_counter() - start)
+            if is_failure(response):
+                endpoint.failure()
+                continue
+            endpoint.success(response.elapsed.total_seconds())
+            return response
+        return response
+
+
+ROUTER = Router(API_URLS)
+
+
+def configure(urls: List[str]):
+    """Route requests to the endpoints at urls, in order of preference"""
+    # pylint: disable=global-statement
+    global ROUTER
+    ROUTER = Router(urls)
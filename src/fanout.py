@@ -0,0 +1,273 @@
+"""Share one departure fetcher between many displays
+Server mode (`python . --serve PORT`) fetches the departures of all
+configured stations once per STATION_UPDATE_TIME and publishes them as
+per-station boards over http. Displays started with `--subscribe URL` long
+poll the server for changed boards instead of fetching from the API, so the
+API load does not depend on the number of displays.
+
+    GET /boards?since=VERSION&wait=SECONDS
+
+answers with all boards changed after VERSION as soon as there is one (or
+after SECONDS with no boards). since=0 returns all boards immediately, so
+new displays show a full board on startup. Departures are published with
+their absolute departure time, so boards only change if the departures do
+and subscribers compute the time left on their own clock.
+"""
+
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler
+import json
+from threading import Condition, Thread
+import time
+from typing import Dict, List, Union
+from urllib.parse import parse_qs, urlsplit
+
+from . import clock
+from . import data
+from . import debug
+from . import defines as d
+from . import log
+from .config import load_data
+from .data import Departure, Station
+
+
+# address and port the board server listens on by default. The loopback
+# address only accepts displays on the same machine, "0.0.0.0" (all
+# interfaces) or the LAN address of the fetcher accepts displays in the
+# network
+FANOUT_HOST = "127.0.0.1"
+FANOUT_PORT = 9106
+# seconds a subscriber request waits for changed boards
+BOARD_WAIT = 25
+# seconds a subscriber waits before retrying after a failed request
+RETRY_TIME = 5
+
+Board = Dict[str, Union[int, float, list]]
+
+LOG = log.get(__name__)
+
+BOARD_UPDATES = debug.REGISTRY.counter(
+    "mops_board_updates_total",
+    "Published departure boards that differed from the previous board",
+    ("station",),
+)
+SUBSCRIBERS = debug.REGISTRY.gauge(
+    "mops_subscribers",
+    "Subscriber requests currently waiting for changed boards",
+)
+SUBSCRIBE_ERRORS = debug.REGISTRY.counter(
+    "mops_subscribe_errors_total",
+    "Failed requests of a subscriber to the board server",
+)
+
+
+def pack_departure(departure: Departure, fetched: float) -> dict:
+    """Convert a departure to json, time_left is replaced by the departure
+    time (seconds since epoch, rounded to seconds)"""
+    packed = asdict(departure)
+    time_left = packed.pop("time_left")
+    del packed["reachable"]  # depends on the station only
+    packed["when"] = round(fetched + 60 * time_left)
+    return packed
+
+
+def unpack_departure(packed: dict, station: Station, now: float):
+    """Create a departure from json at time now (seconds since epoch),
+    return None if it left or can no longer be reached in min_time"""
+    packed = dict(packed)
+    time_left = (packed.pop("when") - now) / 60
+    if time_left < station.min_time:
+        return None
+    return Departure(
+        time_left=time_left,
+        reachable=time_left > station.time_needed,
+        **packed,
+    )
+
+
+class BoardServer(debug.ThreadingServer):
+    """Http server holding the latest departure board of every station
+
+    Every board has the version of the publication it last changed in, so
+    subscribers only receive the boards that changed since their last
+    request.
+    """
+
+    def __init__(self, address):
+        """BoardServer constructor
+
+        Parameters
+        ----------
+        address: tuple[str, int]
+            Host and port to listen on
+        """
+        super().__init__(address, BoardHandler)
+        self.version = 0
+        self.boards: Dict[str, Board] = {}
+        self._changed = Condition()
+
+    def publish(self, station: Station, departures: List[Departure]) -> bool:
+        """Publish the departures of a station, return True if its board
+        changed"""
+        fetched = clock.now().timestamp()
+        packed = [pack_departure(dep, fetched) for dep in departures]
+        with self._changed:
+            board = self.boards.get(station.label)
+            if board is not None and board["departures"] == packed:
+                return False
+            self.version += 1
+            self.boards[station.label] = {
+                "version": self.version,
+                "departures": packed,
+            }
+            self._changed.notify_all()
+        BOARD_UPDATES.inc(station=station.label)
+        return True
+
+    def changes(self, since: int, wait: float) -> dict:
+        """Boards that changed after version since, waits up to wait seconds
+        for a change"""
+        SUBSCRIBERS.inc()
+        try:
+            with self._changed:
+                self._changed.wait_for(lambda: self.version > since, wait)
+                boards = {
+                    label: board for label, board in self.boards.items()
+                    if board["version"] > since
+                }
+                return {"version": self.version, "boards": boards}
+        finally:
+            SUBSCRIBERS.inc(-1)
+
+    def run(self, stations: List[Station], interval: int = None):
+        """Serve boards from a daemon thread and fetch the departures of
+        stations every interval ms (defaults to STATION_UPDATE_TIME) until
+        interrupted"""
+        interval = d.STATION_UPDATE_TIME if interval is None else interval
+        Thread(target=self.serve_forever, name="boards", daemon=True).start()
+        try:
+            while True:
+                start = clock.monotonic()
+                for station in stations:
+                    self.publish(station, station.fetch_departures())
+                passed = clock.monotonic() - start
+                clock.sleep(max(0.0, interval / 1000 - passed))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+
+class BoardHandler(BaseHTTPRequestHandler):
+    """Serve changed boards on /boards"""
+
+    server: BoardServer
+
+    def do_GET(self):
+        """Handle GET request"""
+        url = urlsplit(self.path)
+        if url.path != "/boards":
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        try:
+            since = int(query.get("since", ["0"])[0])
+            wait = min(float(query.get("wait", ["0"])[0]), BOARD_WAIT)
+        except ValueError:
+            self.send_error(400)
+            return
+
+        body = json.dumps(self.server.changes(since, wait)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Do not log requests"""
+
+
+class Subscriber:
+    """Receive departure boards from a BoardServer in a daemon thread"""
+
+    def __init__(self, url: str, wait: float = BOARD_WAIT):
+        """Subscriber constructor
+
+        Parameters
+        ----------
+        url: str
+            Base url of the board server, e.g. http://127.0.0.1:9106
+        wait: float, optional
+            Seconds a request waits for changed boards. Defaults to BOARD_WAIT
+        """
+        self.url = url.rstrip("/") + "/boards"
+        self.wait = wait
+        self.version = 0
+        self.boards: Dict[str, Board] = {}
+        self._thread: Union[Thread, None] = None
+
+    def start(self, timeout: float = RETRY_TIME):
+        """Fetch all boards (waits up to timeout seconds) and start
+        receiving changes"""
+        data.load_http()
+        try:
+            self.poll(0, timeout)
+        except data.requests.RequestException as e:
+            SUBSCRIBE_ERRORS.inc()
+            LOG.warning("could not reach board server", url=self.url,
+                        error=str(e))
+        self._thread = Thread(target=self._run, name="subscriber",
+                              daemon=True)
+        self._thread.start()
+
+    def poll(self, wait: float, timeout: float = None):
+        """Request boards changed since the last request"""
+        timeout = wait + RETRY_TIME if timeout is None else timeout
+        response = data.load_http().get(
+            self.url,
+            params={"since": self.version, "wait": wait},
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        changes = response.json()
+        if changes["version"] < self.version:
+            # the server restarted, start over
+            self.version = 0
+            return
+        # replace the dict, so readers never see a partial update
+        self.boards = {**self.boards, **changes["boards"]}
+        self.version = changes["version"]
+
+    def _run(self):
+        while True:
+            try:
+                self.poll(self.wait)
+            except (data.requests.RequestException, ValueError) as e:
+                SUBSCRIBE_ERRORS.inc()
+                LOG.warning("board server request failed", url=self.url,
+                            error=str(e))
+                time.sleep(RETRY_TIME)
+
+    def departures(self, station: Station) -> List[Departure]:
+        """Latest departures of a station, replaces Station.fetch_departures
+        """
+        board = self.boards.get(station.label)
+        if board is None:
+            return []
+        now = clock.now().timestamp()
+        departures = [
+            unpack_departure(packed, station, now)
+            for packed in board["departures"]
+        ]
+        return [dep for dep in departures if dep is not None]
+
+
+def serve(port: int = FANOUT_PORT, host: str = FANOUT_HOST):
+    """Fetch the configured stations and serve their boards until
+    interrupted"""
+    stations, _, _ = load_data(images=False)
+    server = BoardServer((host, port))
+    host, port = server.server_address[:2]
+    print(f"Serving boards on http://{host}:{port}/boards", flush=True)
+    server.run(stations)
@@ -0,0 +1,330 @@
+"""Headless backend
+Stand-ins for the tkinter root, canvas, fonts and images that record canvas
+operations instead of drawing them. Select it by setting the environment
+variable MOPSDISPLAY_BACKEND=headless before importing src.
+"""
+
+from collections import Counter, deque
+from contextlib import nullcontext
+import heapq
+from itertools import count
+from types import SimpleNamespace
+from typing import Any, Callable, Deque, Dict, List, Tuple, Union
+
+from . import clock
+
+
+# number of operations kept in RecordingCanvas.log
+LOG_LENGTH = 10_000
+
+
+class RecordingFont:
+    """Font with deterministic metrics
+
+    Every character is 0.6 * size wide and a line is 1.5 * size high
+    (rounded to pixels), so layouts do not depend on installed fonts.
+    """
+
+    def __init__(self, font: Union[Tuple, None] = None, **options):
+        """RecordingFont constructor, see tkinter.font.Font
+
+        Parameters
+        ----------
+        font: tuple, optional
+            Font description (family, size, *styles).
+            Defaults to None (("Helvetica", 12))
+        **options
+            Font options, only size is considered
+        """
+        family, size, *styles = ("Helvetica", 12) if font is None else font
+        size = abs(int(options.get("size", size)))
+        self.family = family
+        self.size = size
+        self.styles = tuple(styles)
+        self.charwidth = round(0.6 * size)
+        self.ascent = round(1.2 * size)
+        self.descent = round(1.5 * size) - self.ascent
+
+    def measure(self, text: str, displayof=None) -> int:
+        """Width of the longest line of text in pixels"""
+        longest = max(len(line) for line in str(text).split("\n"))
+        return longest * self.charwidth
+
+    def metrics(self, *options, **kwargs) -> Union[int, Dict[str, int]]:
+        """Font metrics, see tkinter.font.Font.metrics"""
+        metrics = {
+            "ascent": self.ascent,
+            "descent": self.descent,
+            "linespace": self.ascent + self.descent,
+            "fixed": 1,
+        }
+        if len(options) == 1:
+            return metrics[options[0]]
+        if options:
+            return {option: metrics[option] for option in options}
+        return metrics
+
+    def __str__(self) -> str:
+        return f"{self.family} {self.size} {' '.join(self.styles)}".strip()
+
+
+class RecordingImage:
+    """Image that only keeps the size of the pillow image it is created from"""
+
+    _ids = count()
+
+    def __init__(self, image=None, width: int = 0, height: int = 0, **kw):
+        """RecordingImage constructor, see PIL.ImageTk.PhotoImage"""
+        if image is not None:
+            width, height = image.size
+        self._width = int(width)
+        self._height = int(height)
+        self.name = f"pyimage{next(self._ids)}"
+
+    def width(self) -> int:
+        """Image width"""
+        return self._width
+
+    def height(self) -> int:
+        """Image height"""
+        return self._height
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class RecordingRoot:
+    """Root window with a minimal event loop for after callbacks
+    Runs on the application clock, so it can run on virtual time
+    """
+
+    def __init__(self):
+        self._queue: List[Tuple[float, int, str]] = []
+        self._jobs: Dict[str, Tuple[Callable, tuple]] = {}
+        self._ids = count()
+        self._running = False
+
+    def now(self) -> float:
+        """Seconds on the event loop clock"""
+        return clock.monotonic()
+
+    def after(self, ms: int, func: Callable, *args) -> str:
+        """Schedule func(*args) in ms milliseconds"""
+        idx = next(self._ids)
+        job = f"after#{idx}"
+        self._jobs[job] = (func, args)
+        heapq.heappush(self._queue, (self.now() + ms / 1000, idx, job))
+        return job
+
+    def after_idle(self, func: Callable, *args) -> str:
+        """Schedule func(*args) as soon as possible"""
+        return self.after(0, func, *args)
+
+    def after_cancel(self, job: str):
+        """Cancel a scheduled job"""
+        self._jobs.pop(job, None)
+
+    def run_pending(self) -> int:
+        """Run all due jobs, return number of jobs run"""
+        ran = 0
+        now = self.now()
+        while self._queue and self._queue[0][0] <= now:
+            _, _, job = heapq.heappop(self._queue)
+            func, args = self._jobs.pop(job, (None, ()))
+            if func is not None:
+                func(*args)
+                ran += 1
+        return ran
+
+    def next_due(self) -> Union[float, None]:
+        """Clock time of the next scheduled job, None if there is none"""
+        while self._queue and self._queue[0][2] not in self._jobs:
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def mainloop(self, n: int = 0):
+        """Run jobs until quit is called or no job is left"""
+        self._running = True
+        while self._running:
+            due = self.next_due()
+            if due is None:
+                break
+            wait = due - self.now()
+            if wait > 0:
+                clock.sleep(wait)
+            self.run_pending()
+
+    def quit(self):
+        """Stop mainloop"""
+        self._running = False
+
+    def update(self):
+        """Run due jobs"""
+        self.run_pending()
+
+    update_idletasks = update
+
+    # pylint: disable=unused-argument
+    def _ignore(self, *args, **kwargs):
+        """Window management has no effect without a display"""
+
+    geometry = _ignore
+    attributes = _ignore
+    rowconfigure = _ignore
+    columnconfigure = _ignore
+    destroy = _ignore
+
+
+class RecordingCanvas:
+    """Canvas that records and counts its operations
+
+    Implements the subset of tkinter.Canvas used by the artists. Items are
+    stored as dictionaries with type, coords, options and tags.
+
+    Attributes
+    ----------
+    items: dict[int, dict]
+        Canvas items by id
+    operations: collections.Counter
+        Number of calls per operation name
+    log: collections.deque
+        The last LOG_LENGTH operations as (name, args, kwargs)
+    """
+
+    _count = count()
+
+    def __init__(self, master: RecordingRoot = None, **options):
+        """RecordingCanvas constructor, see tkinter.Canvas"""
+        self.master = master
+        self.options = options
+        self.items: Dict[int, Dict[str, Any]] = {}
+        self.operations: Counter = Counter()
+        self.log: Deque[Tuple[str, tuple, dict]] = deque(maxlen=LOG_LENGTH)
+        self._bindings: Dict[str, List[Callable]] = {}
+        self._ids = count(1)
+        self._name = f".!recordingcanvas{next(self._count)}"
+
+    def __str__(self) -> str:
+        return self._name
+
+    def _record(self, operation: str, args: tuple, kwargs: dict):
+        self.operations[operation] += 1
+        self.log.append((operation, args, kwargs))
+
+    def reset_operations(self):
+        """Clear operation counts and log"""
+        self.operations.clear()
+        self.log.clear()
+
+    def _create(self, kind: str, args: tuple, options: dict) -> int:
+        self._record(f"create_{kind}", args, options)
+        item = next(self._ids)
+        tags = options.pop("tags", ())
+        self.items[item] = {
+            "type": kind,
+            "coords": [float(arg) for arg in args],
+            "options": options,
+            "tags": (tags,) if isinstance(tags, str) else tuple(tags),
+        }
+        return item
+
+    def create_text(self, *args, **options) -> int:
+        """Create text item"""
+        return self._create("text", args, options)
+
+    def create_image(self, *args, **options) -> int:
+        """Create image item"""
+        return self._create("image", args, options)
+
+    def create_rectangle(self, *args, **options) -> int:
+        """Create rectangle item"""
+        return self._create("rectangle", args, options)
+
+    def create_oval(self, *args, **options) -> int:
+        """Create oval item"""
+        return self._create("oval", args, options)
+
+    def create_line(self, *args, **options) -> int:
+        """Create line item"""
+        return self._create("line", args, options)
+
+    def coords(self, item: int, *args) -> Union[List[float], None]:
+        """Get or set coordinates of an item"""
+        self._record("coords", (item, *args), {})
+        if not args:
+            return list(self.items[item]["coords"])
+        self.items[item]["coords"] = [float(arg) for arg in args]
+        return None
+
+    def itemconfigure(self, item: int, **options):
+        """Configure options of an item"""
+        self._record("itemconfigure", (item,), options)
+        self.items[item]["options"].update(options)
+
+    itemconfig = itemconfigure
+
+    def itemcget(self, item: int, option: str) -> Any:
+        """Get option of an item"""
+        return self.items[item]["options"].get(option)
+
+    def batch(self, enabled: bool = None):
+        """Operations are recorded immediately, see batch.BatchedCanvas"""
+        return nullcontext()
+
+    def _find(self, tag_or_id: Union[int, str]) -> List[int]:
+        if tag_or_id == "all":
+            return list(self.items)
+        if isinstance(tag_or_id, int):
+            return [tag_or_id] if tag_or_id in self.items else []
+        return [i for i, item in self.items.items() if tag_or_id in item["tags"]]
+
+    def delete(self, *tags_or_ids: Union[int, str]):
+        """Delete items by id or tag"""
+        self._record("delete", tags_or_ids, {})
+        for tag_or_id in tags_or_ids:
+            for item in self._find(tag_or_id):
+                del self.items[item]
+
+    def bind(self, sequence: str, func: Callable, add: str = None):
+        """Bind an event handler, only <Configure> is ever generated"""
+        if not add:
+            self._bindings[sequence] = []
+        self._bindings.setdefault(sequence, []).append(func)
+
+    def event_generate(self, sequence: str, **kwargs):
+        """Call event handlers with an event holding kwargs as attributes"""
+        if sequence == "<Configure>":
+            self.options.update(kwargs)
+        event = SimpleNamespace(widget=self, **kwargs)
+        for func in self._bindings.get(sequence, []):
+            func(event)
+
+    def after(self, ms: int, func: Callable, *args) -> str:
+        """Schedule func(*args) on the master's clock"""
+        return self.master.after(ms, func, *args)
+
+    def after_cancel(self, job: str):
+        """Cancel a job scheduled with after"""
+        self.master.after_cancel(job)
+
+    def winfo_width(self) -> int:
+        """Canvas width"""
+        return int(self.options.get("width", 0))
+
+    def winfo_height(self) -> int:
+        """Canvas height"""
+        return int(self.options.get("height", 0))
+
+    def resize(self, width: int, height: int):
+        """Resize the canvas and generate a <Configure> event"""
+        self.event_generate("<Configure>", width=width, height=height)
+
+    # pylint: disable=unused-argument
+    def grid(self, *args, **kwargs):
+        """Trigger the initial <Configure> event like a mapped tkinter widget"""
+        width, height = self.winfo_width(), self.winfo_height()
+        if self.master is not None:
+            self.master.after_idle(self.resize, width, height)
+
+    pack = grid
+    place = grid
@@ -0,0 +1,178 @@
+"""Garbage collector pauses and tuning
+Every update cycle allocates short-lived departures, response dicts and
+strings, while decoded images, tkinter wrappers and imported modules live
+as long as the application. Full (generation 2) collections walk all of
+them and can cause visible hitches. PauseMonitor times every collection
+with gc.callbacks, freeze() moves the heap built during startup into the
+permanent generation that collections skip, and GC_THRESHOLDS trades memory
+against the frequency of collections (compare settings with
+`python . --loadtest --loadtest-gc`).
+"""
+
+from collections import deque
+import gc
+import time
+from typing import Deque, Dict, Sequence, Tuple, Union
+
+from . import debug
+from . import log
+from . import recorder
+
+
+# thresholds of generations 0, 1 and 2 (see gc.set_threshold), None keeps
+# Python's defaults (700, 10, 10). Larger thresholds collect less often but
+# keep more garbage (memory) between collections
+GC_THRESHOLDS: Union[Tuple[int, ...], None] = None
+# freeze the heap once all artists are built, see freeze
+FREEZE = True
+# seconds a collection may pause until it is logged as warning
+PAUSE_WARNING = 0.05
+# seconds a collection may pause until it is kept in the flight recorder
+RECORD_PAUSE = 0.005
+# pauses waiting to be published to the metrics, further pauses are dropped
+PENDING_PAUSES = 10_000
+
+LOG = log.get(__name__)
+
+PAUSE_TIME = debug.REGISTRY.histogram(
+    "mops_gc_pause_seconds",
+    "Duration of garbage collections by generation",
+    ("generation",),
+)
+COLLECTED = debug.REGISTRY.counter(
+    "mops_gc_collected_objects_total",
+    "Unreachable objects found by garbage collections by generation",
+    ("generation",),
+)
+UNCOLLECTABLE = debug.REGISTRY.counter(
+    "mops_gc_uncollectable_objects_total",
+    "Unreachable objects garbage collections could not free",
+)
+FROZEN = debug.REGISTRY.gauge(
+    "mops_gc_frozen_objects",
+    "Objects in the permanent generation, see heap.freeze",
+)
+
+# generation, seconds, collected, uncollectable
+Pause = Tuple[int, float, int, int]
+
+
+class PauseMonitor:
+    """Time garbage collections with gc.callbacks
+
+    Collections run in the middle of arbitrary code, possibly while the
+    metrics or the logger hold their lock. The callback only updates plain
+    statistics and queues the pause, flush publishes queued pauses to the
+    metrics and log from the event loop.
+    """
+
+    def __init__(self):
+        """PauseMonitor constructor, see install"""
+        # generation -> [collections, seconds, longest pause]
+        self.stats: Dict[int, list] = {}
+        self.pending: Deque[Pause] = deque(maxlen=PENDING_PAUSES)
+        self._start: Union[float, None] = None
+        self.reset()
+
+    def callback(self, phase: str, info: dict):
+        """gc.callbacks entry"""
+        if phase == "start":
+            self._start = time.perf_counter()
+            return
+        if self._start is None:
+            return  # installed during a collection
+        seconds = time.perf_counter() - self._start
+        self._start = None
+        generation = info["generation"]
+        stats = self.stats[generation]
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+        if debug.METRICS or seconds >= PAUSE_WARNING:
+            self.pending.append((generation, seconds, info["collected"],
+                                 info["uncollectable"]))
+        if seconds >= RECORD_PAUSE:
+            recorder.record("gc", f"generation {generation}",
+                            info["collected"], seconds)
+
+    def install(self):
+        """Start timing collections"""
+        if self.callback not in gc.callbacks:
+            gc.callbacks.append(self.callback)
+
+    def uninstall(self):
+        """Stop timing collections"""
+        if self.callback in gc.callbacks:
+            gc.callbacks.remove(self.callback)
+        self._start = None
+
+    def flush(self):
+        """Publish queued pauses to the metrics and log long ones"""
+        while self.pending:
+            generation, seconds, collected, uncollectable = (
+                self.pending.popleft()
+            )
+            PAUSE_TIME.observe(seconds, generation=str(generation))
+            COLLECTED.inc(collected, generation=str(generation))
+            if uncollectable:
+                UNCOLLECTABLE.inc(uncollectable)
+            if seconds >= PAUSE_WARNING:
+                LOG.warning("garbage collection paused", generation=generation,
+                            seconds=f"{seconds:.3f}", collected=collected)
+
+    def reset(self):
+        """Drop the statistics and queued pauses"""
+        self.stats = {generation: [0, 0.0, 0.0] for generation in range(3)}
+        self.pending.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Statistics of the collections since the last reset
+
+        Return
+        ------
+        dict[str, dict[str, float]]
+            "generation N" mapped to the number of collections, their total
+            and longest pause in seconds
+        """
+        return {
+            f"generation {generation}": {
+                "collections": collections,
+                "total": total,
+                "max": longest,
+            }
+            for generation, (collections, total, longest)
+            in sorted(self.stats.items())
+        }
+
+
+PAUSES = PauseMonitor()
+
+
+def configure(thresholds: Union[Sequence[int], None] = GC_THRESHOLDS):
+    """Set the collection thresholds, see GC_THRESHOLDS"""
+    if thresholds is None:
+        return
+    if not 1 <= len(thresholds) <= 3:
+        raise ValueError(f"Expected 1 to 3 gc thresholds, got {thresholds}")
+    gc.set_threshold(*thresholds)
+    LOG.info("set gc thresholds", thresholds=gc.get_threshold())
+
+
+def freeze() -> int:
+    """Collect once, then move all objects into the permanent generation
+    that later collections skip. Call after startup, when fonts, images and
+    artists are built. Returns the number of frozen objects
+    """
+    gc.collect()
+    gc.freeze()
+    count = gc.get_freeze_count()
+    FROZEN.set(count)
+    LOG.info("froze startup heap", objects=count)
+    return count
+
+
+def unfreeze():
+    """Move the frozen objects back into the oldest generation"""
+    gc.unfreeze()
+    FROZEN.set(0)
@@ -0,0 +1,258 @@
+"""End-to-end load test against the local API stub
+Run with `python . --loadtest`. For every size N stations x M directions the
+fetch -> display update pipeline is run for a number of cycles against
+stub.py, reporting cycle latency, cpu time, garbage collection pauses and
+memory as json. With --loadtest-gc every size is run with each of
+GC_VARIANTS to compare their effect on the worst cycle latency.
+"""
+
+from contextlib import contextmanager
+import gc
+from itertools import zip_longest
+import json
+from pathlib import Path
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from . import BACKEND
+from .app import APP
+from . import debug
+from . import defines as d
+from . import endpoints
+from . import heap
+from .artist import DepartureArtist, GridCanvas
+from .data import DirectionsAndProducts, Station
+
+
+# stations x directions per station
+SIZES = ((1, 1), (6, 2), (20, 4), (50, 8))
+# update cycles per size
+CYCLES = 5
+# garbage collector settings compared by --loadtest-gc: name mapped to
+# thresholds (None keeps the configured ones) and whether to freeze the heap
+GC_VARIANTS = {
+    "default": (None, False),
+    "frozen": (None, True),
+    "threshold 10000": ((10_000, 10, 10), False),
+    "frozen, threshold 10000": ((10_000, 10, 10), True),
+}
+STUB_PATH = Path(__file__).with_name("stub.py")
+
+
+def parse_size(size: str) -> Tuple[int, int]:
+    """Parse a size given as NxM"""
+    stations, directions = size.lower().split("x")
+    return int(stations), int(directions)
+
+
+def make_stations(
+    count: int, directions: int, max_departures: int = 8
+) -> List[Station]:
+    """Create count stations with the given number of directions each"""
+    options = DirectionsAndProducts(
+        directions=[f"9000{idx:05d}" for idx in range(directions)],
+        S=True, U=True, T=True, B=True,
+    )
+    return [
+        Station(
+            row=idx,
+            col=0,
+            title=f"Station {idx}",
+            id=f"9001{idx:05d}",
+            max_departures=max_departures,
+            min_time=0,
+            max_time=90,
+            time_needed=5,
+            start_night="01:00:00",
+            stop_night="04:00:00",
+            day=options,
+            night=options,
+        )
+        for idx in range(count)
+    ]
+
+
+def run_size(count: int, directions: int, cycles: int = CYCLES) -> dict:
+    """Run the fetch and update pipeline for count stations
+
+    Return
+    ------
+    dict
+        Cycle latency and cpu time (median, p95, max in seconds), garbage
+        collections during the cycles, memory (bytes) and number of
+        displayed departures
+    """
+    canvas = GridCanvas(APP.root, flush="w", width=d.WIDTH_STATION_CANVAS,
+                        height=d.HEIGHT_STATION_CANVAS)
+    boards = []
+    for station in make_stations(count, directions):
+        artists = [DepartureArtist(canvas, anchor="w")
+                   for _ in range(station.max_departures)]
+        boards.append((station, artists))
+
+    latencies, cpu_times = [], []
+    shown = 0
+    heap.PAUSES.reset()
+    for _ in range(cycles):
+        start, cpu = time.perf_counter(), time.process_time()
+        shown = 0
+        for station, artists in boards:
+            departures = station.fetch_departures()
+            for departure, artist in zip_longest(departures, artists):
+                if artist is None:
+                    break
+                artist.update_departure(departure)
+                shown += departure is not None
+        latencies.append(time.perf_counter() - start)
+        cpu_times.append(time.process_time() - cpu)
+
+    def stats(values: List[float]) -> Dict[str, float]:
+        values = sorted(values)
+        return {
+            "median": statistics.median(values),
+            "p95": values[min(len(values) - 1, int(0.95 * len(values)))],
+            "max": values[-1],
+        }
+
+    return {
+        "stations": count,
+        "directions": directions,
+        "requests_per_cycle": count * directions,
+        "cycle_latency": stats(latencies),
+        "cycle_cpu": stats(cpu_times),
+        "gc": heap.PAUSES.summary(),
+        "rss": debug.rss(),
+        "departures_shown": shown,
+    }
+
+
+def run_gc_variants(count: int, directions: int, cycles: int = CYCLES):
+    """Run the pipeline for count stations with each of GC_VARIANTS
+
+    Return
+    ------
+    list[dict]
+        Results of run_size with the variant name and thresholds
+    """
+    configured = gc.get_threshold()
+    results = []
+    try:
+        for name, (thresholds, freeze) in GC_VARIANTS.items():
+            heap.unfreeze()
+            gc.set_threshold(*(thresholds or configured))
+            if freeze:
+                heap.freeze()
+            else:
+                gc.collect()  # same start for every variant
+            result = run_size(count, directions, cycles)
+            results.append({"gc_variant": name,
+                            "gc_thresholds": gc.get_threshold(), **result})
+    finally:
+        heap.unfreeze()
+        gc.set_threshold(*configured)
+    return results
+
+
+@contextmanager
+def start_stub(
+    latency: float, jitter: float, error_rate: float, departures: int
+) -> Iterator[str]:
+    """Run stub.py in a separate process while in context, yields the base
+    url"""
+    args = [
+        sys.executable, str(STUB_PATH),
+        "--latency", str(latency),
+        "--jitter", str(jitter),
+        "--error-rate", str(error_rate),
+    ]
+    if departures is not None:
+        args += ["--departures", str(departures)]
+    with subprocess.Popen(args, stdout=subprocess.PIPE, text=True) as process:
+        try:
+            url = process.stdout.readline().strip()
+            if not url:
+                raise RuntimeError("API stub did not start")
+            yield url
+        finally:
+            process.terminate()
+
+
+def main(
+    output: str = None,
+    sizes: Sequence[Tuple[int, int]] = SIZES,
+    cycles: int = CYCLES,
+    latency: float = 0.05,
+    jitter: float = 0.02,
+    error_rate: float = 0.0,
+    departures: int = None,
+    gc_variants: bool = False,
+):
+    """Run the load test and write json results to output (default stdout)
+
+    Parameters
+    ----------
+    output: str, optional
+        File to write results to. Defaults to None (stdout)
+    sizes: list[tuple[int, int]], optional
+        (stations, directions) to test. Defaults to SIZES
+    cycles: int, optional
+        Update cycles per size. Defaults to CYCLES
+    latency, jitter, error_rate, departures: optional
+        Stub configuration, see stub.StubServer
+    gc_variants: bool, optional
+        Run every size with each of GC_VARIANTS. Defaults to False
+    """
+    with start_stub(latency, jitter, error_rate, departures) as url:
+        endpoints.configure([url])
+        heap.PAUSES.install()
+        try:
+            results = []
+            for count, directions in sizes:
+                if gc_variants:
+                    runs = run_gc_variants(count, directions, cycles)
+                else:
+                    runs = [run_size(count, directions, cycles)]
+                for result in runs:
+                    results.append(result)
+                    variant = result.get("gc_variant")
+                    pauses = [stats["max"]
+                              for stats in result["gc"].values()]
+                    cycle = result["cycle_latency"]
+                    print(
+                        f"{count}x{directions}"
+                        f"{f' ({variant})' if variant else ''}: "
+                        f"{cycle['median']*1e3:.1f}ms/cycle, "
+                        f"{cycle['max']*1e3:.1f}ms max, "
+                        f"{result['cycle_cpu']['median']*1e3:.1f}ms cpu, "
+                        f"{max(pauses)*1e3:.1f}ms max gc pause, "
+                        f"{result['rss'] / 2**20:.1f}MiB",
+                        file=sys.stderr,
+                    )
+        finally:
+            heap.PAUSES.uninstall()
+
+    report = {
+        "backend": BACKEND,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stub": {
+            "latency": latency,
+            "jitter": jitter,
+            "error_rate": error_rate,
+            "departures": departures,
+        },
+        "gc_thresholds": gc.get_threshold(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output is None:
+        print(text)
+    else:
+        with open(output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    APP.root.destroy()
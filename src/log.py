@@ -0,0 +1,284 @@
+"""Structured logging without blocking the event loop
+Records are key=value (or json) lines of an event name and fields. Logging
+only puts the record into a bounded queue, a background thread formats and
+writes them, so slow stdout, SD cards or journald do not stall the tkinter
+thread. A full queue drops records instead of waiting. Identical records
+within DEDUPE_TIME and records of an event beyond RATE_LIMIT per RATE_WINDOW
+are suppressed and counted in the next record of the event.
+
+Levels can be changed at runtime with set_level or by sending LEVEL_SIGNAL
+(`kill -USR2 <pid>`), which toggles all loggers between their level and
+debug.
+"""
+
+import atexit
+from datetime import datetime
+import json
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Dict, Tuple, Union
+
+from . import debug
+
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+# level of loggers without their own level
+LEVEL = "info"
+# "text" (key=value) or "json" lines
+FORMAT = "text"
+# file to append to, None writes to stderr
+LOG_PATH = None
+# records waiting for the writer thread, further records are dropped
+QUEUE_SIZE = 1_000
+# seconds identical records (event and fields) are suppressed
+DEDUPE_TIME = 60
+# records per event and RATE_WINDOW seconds, further records are suppressed
+RATE_LIMIT = 10
+RATE_WINDOW = 60
+# signal toggling debug logging, None disables (SIGUSR2 is not available on
+# windows)
+LEVEL_SIGNAL = getattr(signal, "SIGUSR2", None)
+
+RECORDS = debug.REGISTRY.counter(
+    "mops_log_records_total",
+    "Log records queued for writing by level",
+    ("level",),
+)
+SUPPRESSED = debug.REGISTRY.counter(
+    "mops_log_suppressed_total",
+    "Log records not written by reason (duplicate, rate, queue)",
+    ("reason",),
+)
+
+# time, level, logger, event, fields
+Record = Tuple[float, str, str, str, dict]
+
+
+def format_record(record: Record, fmt: str = FORMAT) -> str:
+    """Format a record as key=value or json line"""
+    timestamp, level, name, event, fields = record
+    when = datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds")
+    if fmt == "json":
+        return json.dumps({"time": when, "level": level, "logger": name,
+                           "event": event, **fields}, default=str)
+    pairs = " ".join(f"{key}={_quote(value)}" for key, value in fields.items())
+    line = f"{when} {level.upper()} {name}: {event}"
+    return f"{line} {pairs}" if pairs else line
+
+
+def _quote(value) -> str:
+    text = str(value)
+    if not text or any(char in text for char in ' ="\n'):
+        return json.dumps(text)
+    return text
+
+
+class Writer:
+    """Bounded record queue written by a daemon thread"""
+
+    def __init__(self, size: int = QUEUE_SIZE):
+        """Writer constructor, the thread starts with the first record
+
+        Parameters
+        ----------
+        size: int, optional
+            Maximum number of queued records. Defaults to QUEUE_SIZE
+        """
+        self.queue: "queue.Queue[Record]" = queue.Queue(size)
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()
+
+    def put(self, record: Record):
+        """Queue a record, drops it if the queue is full"""
+        if self._thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            SUPPRESSED.inc(reason="queue")
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            try:
+                self._write(record)
+            except Exception:  # pylint: disable=broad-except
+                pass  # logging must not fail, nothing left to report to
+            finally:
+                self.queue.task_done()
+
+    def _write(self, record: Record):
+        line = format_record(record, FORMAT) + "\n"
+        if LOG_PATH is None:
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            with open(LOG_PATH, "a", encoding="utf-8") as file:
+                file.write(line)
+
+    def flush(self, timeout: float = 1.0):
+        """Wait up to timeout seconds until all queued records are written"""
+        if self._thread is None:
+            return
+        stop = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < stop:
+            time.sleep(0.01)
+
+
+WRITER = Writer()
+
+
+class Logger:
+    """Named logger with its own level, see get"""
+
+    # suppression state shared by all loggers, keyed by logger and event
+    _lock = threading.Lock()
+    _seen: Dict[tuple, Tuple[float, int]] = {}  # record -> until, count
+    _rates: Dict[tuple, list] = {}  # event -> [window start, count, dropped]
+
+    def __init__(self, name: str, level: str = None):
+        """Logger constructor
+
+        Parameters
+        ----------
+        name: str
+            Name in written records, e.g. the module name
+        level: str, optional
+            Minimum level of written records. Defaults to None (LEVEL)
+        """
+        self.name = name
+        self.level = level
+
+    def enabled(self, level: str) -> bool:
+        """Whether records of level are written"""
+        minimum = self.level or LEVEL
+        if _DEBUG_TOGGLED:
+            minimum = "debug"
+        return LEVELS[level] >= LEVELS[minimum]
+
+    def log(self, level: str, event: str, **fields):
+        """Queue a record of event with fields if level is enabled
+
+        Parameters
+        ----------
+        level: str
+            One of LEVELS
+        event: str
+            Constant description of what happened, details go into fields
+        **fields
+            Record fields, formatted with str by the writer thread
+        """
+        if not self.enabled(level):
+            return
+        now = time.time()
+        with self._lock:
+            fields = self._suppress(now, level, event, fields)
+        if fields is None:
+            return
+        RECORDS.inc(level=level)
+        WRITER.put((now, level, self.name, event, fields))
+
+    def _suppress(self, now: float, level: str, event: str, fields: dict):
+        """Fields to write including suppression counts, None to drop"""
+        try:
+            key = (self.name, level, event, tuple(fields.items()))
+            hash(key)
+        except TypeError:
+            key = None  # unhashable fields are not deduplicated
+        if key is not None:
+            until, repeated = self._seen.get(key, (0.0, 0))
+            if now < until:
+                self._seen[key] = (until, repeated + 1)
+                SUPPRESSED.inc(reason="duplicate")
+                return None
+            self._seen[key] = (now + DEDUPE_TIME, 0)
+            if repeated:
+                fields = {**fields, "repeated": repeated}
+            if len(self._seen) > QUEUE_SIZE:
+                self._expire(now)
+
+        rate = self._rates.setdefault((self.name, event), [now, 0, 0])
+        if now - rate[0] > RATE_WINDOW:
+            rate[0], rate[1] = now, 0
+        rate[1] += 1
+        if rate[1] > RATE_LIMIT:
+            rate[2] += 1
+            SUPPRESSED.inc(reason="rate")
+            return None
+        if rate[2]:
+            fields = {**fields, "suppressed": rate[2]}
+            rate[2] = 0
+        return fields
+
+    def _expire(self, now: float):
+        for key in [key for key, (until, repeated) in self._seen.items()
+                    if until <= now and not repeated]:
+            del self._seen[key]
+
+    def debug(self, event: str, **fields):
+        """Log a debug record, see log"""
+        self.log("debug", event, **fields)
+
+    def info(self, event: str, **fields):
+        """Log an info record, see log"""
+        self.log("info", event, **fields)
+
+    def warning(self, event: str, **fields):
+        """Log a warning record, see log"""
+        self.log("warning", event, **fields)
+
+    def error(self, event: str, **fields):
+        """Log an error record, see log"""
+        self.log("error", event, **fields)
+
+
+LOGGERS: Dict[str, Logger] = {}
+_DEBUG_TOGGLED = False
+
+
+def get(name: str) -> Logger:
+    """Logger of name, created on first request"""
+    logger = LOGGERS.get(name)
+    if logger is None:
+        logger = LOGGERS[name] = Logger(name)
+    return logger
+
+
+def set_level(level: str, name: str = None):
+    """Set the level of a logger, of all loggers without own level if name
+    is None"""
+    # pylint: disable=global-statement
+    global LEVEL
+    if level not in LEVELS:
+        raise ValueError(f"Unknown log level {level}")
+    if name is None:
+        LEVEL = level
+    else:
+        get(name).level = level
+
+
+def toggle_debug(*_):
+    """Toggle between the configured levels and debug, signal handler"""
+    # pylint: disable=global-statement
+    global _DEBUG_TOGGLED
+    # no record, the interrupted thread may hold the logger or queue lock
+    _DEBUG_TOGGLED = not _DEBUG_TOGGLED
+
+
+def install(level_signal: Union[int, None] = LEVEL_SIGNAL):
+    """Toggle debug logging on level_signal, must be called from the main
+    thread"""
+    if level_signal is not None:
+        signal.signal(level_signal, toggle_debug)
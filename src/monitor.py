@@ -0,0 +1,263 @@
+"""Monitor the tkinter event loop
+Measure drift and duration of scheduled callbacks, report stalls and dump
+thread stacks if the event loop stops responding. Time callbacks spend
+waiting for the network (see waiting) is part of their duration but not of
+the stall check, a station update waits for its responses every cycle.
+"""
+
+from collections import deque
+import faulthandler
+import sys
+from threading import Event, Thread
+import time
+from tkinter import Misc
+from typing import Callable, Deque, Dict, Iterable, Iterator, Tuple, Union
+
+from . import clock
+from . import debug
+from . import log
+from . import recorder
+
+
+# seconds a callback may run (or start late) before it is reported
+STALL_THRESHOLD = 0.5
+# seconds without heartbeat until the watchdog dumps all thread stacks,
+# None disables the watchdog
+WATCHDOG_TIMEOUT: Union[float, None] = None
+# milliseconds between heartbeats of the watchdog
+HEARTBEAT_TIME = 1_000
+# number of runs per callback kept for the rolling statistics
+ROLLING_WINDOW = 360
+
+# seconds spent waiting for the network so far, see waiting
+_waited = 0.0
+
+LOG = log.get(__name__)
+
+CALLBACK_DRIFT = debug.REGISTRY.histogram(
+    "mops_callback_drift_seconds",
+    "Difference between planned and actual start of scheduled callbacks",
+    ("callback",),
+)
+CALLBACK_DURATION = debug.REGISTRY.histogram(
+    "mops_callback_duration_seconds",
+    "Run time of scheduled callbacks",
+    ("callback",),
+)
+STALLS = debug.REGISTRY.counter(
+    "mops_stalls_total",
+    "Callbacks that ran or started later than the stall threshold",
+    ("callback", "kind"),
+)
+
+
+def waiting(items: Iterable) -> Iterator:
+    """Yield the items, the time until each one arrives counts as waiting
+    for the network, e.g. responses of data.send_requests"""
+    global _waited  # pylint: disable=global-statement
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            _waited += time.perf_counter() - start
+            return
+        # not on errors, e.g. GreenletExit of a cancelled prefetch
+        _waited += time.perf_counter() - start
+        yield item
+
+
+def waited() -> float:
+    """Seconds spent waiting for the network so far, see waiting"""
+    return _waited
+
+
+def _percentile(values: list, q: float) -> float:
+    if len(values) == 0:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class LoopMonitor:
+    """Schedule tkinter callbacks and measure their drift and duration
+
+    Use LoopMonitor.after instead of tkinter's after to monitor a callback
+    (e.g. render slices, see render.SlicedRenderer).
+    Drift is the time between the planned and the actual start of a
+    callback, duration is its run time. Both are kept in a rolling window
+    per callback and recorded in the debug metrics.
+    """
+
+    def __init__(
+        self,
+        root: Misc,
+        stall_threshold: float = STALL_THRESHOLD,
+        window: int = ROLLING_WINDOW,
+    ):
+        """LoopMonitor constructor
+
+        Parameters
+        ----------
+        root: tkinter.Misc
+            Widget whose after method is used for scheduling
+        stall_threshold: float, optional
+            Seconds a callback may run or start late before it is reported.
+            Defaults to STALL_THRESHOLD
+        window: int, optional
+            Number of runs per callback to keep for rolling statistics.
+            Defaults to ROLLING_WINDOW
+        """
+        self.root = root
+        self.stall_threshold = stall_threshold
+        self.window = window
+        self.current: Union[str, None] = None
+        self.heartbeat = time.monotonic()
+        self._runs: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._watchdog: Union[Thread, None] = None
+        self._stop = Event()
+
+    def after(self, ms: int, func: Callable, *args) -> str:
+        """Schedule a monitored callback, see tkinter.Misc.after"""
+        planned = clock.monotonic() + ms / 1000
+        planned_wait = waited()
+        name = getattr(func, "__qualname__", repr(func))
+
+        # drift is measured on the application clock, run time in real time
+        def callback():
+            start = clock.monotonic()
+            real_start = time.perf_counter()
+            start_wait = waited()
+            self.current = name
+            try:
+                func(*args)
+            finally:
+                self.current = None
+                duration = time.perf_counter() - real_start
+                self.record(
+                    name, start - planned, duration,
+                    drift_wait=start_wait - planned_wait,
+                    duration_wait=waited() - start_wait,
+                )
+
+        return self.root.after(ms, callback)
+
+    def record(
+        self,
+        name: str,
+        drift: float,
+        duration: float,
+        drift_wait: float = 0.0,
+        duration_wait: float = 0.0,
+    ):
+        """Store a callback run and report it if it stalled the loop
+        Used by LoopMonitor.after and scheduler.Scheduler
+
+        Parameters
+        ----------
+        name: str
+            Callback name
+        drift, duration: float
+            Seconds the callback started late and ran
+        drift_wait, duration_wait: float, optional
+            Seconds of drift and duration spent waiting for the network (see
+            waiting), not counted as stall. Defaults to 0.0
+        """
+        runs = self._runs.get(name)
+        if runs is None:
+            runs = self._runs[name] = deque(maxlen=self.window)
+        runs.append((drift, duration))
+
+        CALLBACK_DRIFT.observe(drift, callback=name)
+        CALLBACK_DURATION.observe(duration, callback=name)
+        recorder.record("callback", name, drift, duration)
+        if duration - duration_wait > self.stall_threshold:
+            STALLS.inc(callback=name, kind="duration")
+            LOG.warning("callback blocked the event loop", callback=name,
+                        seconds=f"{duration:.3f}",
+                        network=f"{duration_wait:.3f}")
+            recorder.RECORDER.stall(name, duration)
+        if drift - drift_wait > self.stall_threshold:
+            STALLS.inc(callback=name, kind="drift")
+            LOG.warning("callback started late", callback=name,
+                        seconds=f"{drift:.3f}", network=f"{drift_wait:.3f}")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Rolling statistics of all monitored callbacks
+
+        Return
+        ------
+        dict[str, dict[str, float]]
+            Callback name mapped to runs, drift and duration percentiles
+            (p50, p95, max) in seconds
+        """
+        summary = {}
+        for name, runs in list(self._runs.items()):
+            drifts = [drift for drift, _ in runs]
+            durations = [duration for _, duration in runs]
+            summary[name] = {
+                "runs": len(runs),
+                "drift_p50": _percentile(drifts, 0.5),
+                "drift_p95": _percentile(drifts, 0.95),
+                "drift_max": max(drifts),
+                "duration_p50": _percentile(durations, 0.5),
+                "duration_p95": _percentile(durations, 0.95),
+                "duration_max": max(durations),
+            }
+        return summary
+
+    def start_watchdog(
+        self,
+        timeout: float = WATCHDOG_TIMEOUT,
+        heartbeat: int = HEARTBEAT_TIME,
+    ):
+        """Dump all thread stacks if the event loop stops responding
+
+        The event loop updates a heartbeat timestamp every heartbeat ms. A
+        daemon thread dumps the stacks once per stall, if the heartbeat is
+        older than timeout seconds.
+
+        Parameters
+        ----------
+        timeout: float, optional
+            Seconds without heartbeat until stacks are dumped.
+            Defaults to WATCHDOG_TIMEOUT
+        heartbeat: int, optional
+            Milliseconds between heartbeats. Defaults to HEARTBEAT_TIME
+        """
+        if timeout is None or self._watchdog is not None:
+            return
+
+        def beat():
+            self.heartbeat = time.monotonic()
+            self.root.after(heartbeat, beat)
+
+        def watch():
+            dumped = False
+            while not self._stop.wait(timeout / 4):
+                silent = time.monotonic() - self.heartbeat
+                if silent < timeout:
+                    dumped = False
+                elif not dumped:
+                    dumped = True
+                    self.dump_stacks(silent)
+
+        beat()
+        self._watchdog = Thread(target=watch, name="watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop_watchdog(self):
+        """Stop the watchdog thread"""
+        self._stop.set()
+
+    def dump_stacks(self, silent: float):
+        """Report the running callback and dump all thread stacks to stderr"""
+        STALLS.inc(callback=self.current or "", kind="watchdog")
+        LOG.error("event loop did not respond", seconds=f"{silent:.1f}",
+                  callback=self.current)
+        log.WRITER.flush()  # before the stacks
+        faulthandler.dump_traceback(file=sys.stderr, all_threads=True)
+        recorder.RECORDER.dump(
+            "watchdog", f"no response for {silent:.1f}s in {self.current}"
+        )
@@ -0,0 +1,389 @@
+"""Offscreen backend
+Render the canvases into a pillow image instead of a tkinter window. Only
+regions that changed since the last frame are re-rasterized and passed to
+the frame sinks, so e-paper or networked panels can be updated partially.
+Select it by setting the environment variable MOPSDISPLAY_BACKEND=offscreen
+before importing src.
+"""
+
+import os
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, Union
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .headless import RecordingCanvas, RecordingRoot
+
+
+Rect = Tuple[int, int, int, int]  # xmin, ymin, xmax, ymax
+# frame, damaged rectangles of the frame
+Sink = Callable[[Image.Image, List[Rect]], None]
+
+# truetype fonts to try (regular, bold) if the requested family is missing
+FALLBACK_FONTS = (
+    ("DejaVuSans.ttf", "DejaVuSans-Bold.ttf"),
+    ("LiberationSans-Regular.ttf", "LiberationSans-Bold.ttf"),
+    ("Arial.ttf", "Arial Bold.ttf"),
+)
+# tkinter anchor -> (horizontal, vertical) fraction of the size to subtract
+ANCHOR_OFFSETS: Dict[str, Tuple[float, float]] = {
+    "nw": (0, 0), "n": (0.5, 0), "ne": (1, 0),
+    "w": (0, 0.5), "center": (0.5, 0.5), "e": (1, 0.5),
+    "sw": (0, 1), "s": (0.5, 1), "se": (1, 1),
+}
+
+
+class OffscreenFont:
+    """Pillow truetype font with the tkinter.font.Font measuring interface"""
+
+    def __init__(self, font: Union[Tuple, None] = None, **options):
+        """OffscreenFont constructor, see tkinter.font.Font
+
+        Parameters
+        ----------
+        font: tuple, optional
+            Font description (family, size, *styles).
+            Defaults to None (("Helvetica", 12))
+        **options
+            Font options, only size is considered
+        """
+        family, size, *styles = ("Helvetica", 12) if font is None else font
+        self.size = abs(int(options.get("size", size)))
+        bold = "bold" in styles
+        # tkinter sizes are points, pillow sizes are pixels (96 dpi)
+        pixels = round(self.size * 96 / 72)
+        candidates = [f"{family}{' Bold' if bold else ''}.ttf"]
+        candidates += [fonts[bold] for fonts in FALLBACK_FONTS]
+        self.pil = None
+        for candidate in candidates:
+            try:
+                self.pil = ImageFont.truetype(candidate, pixels)
+                break
+            except OSError:
+                continue
+        if self.pil is None:
+            self.pil = ImageFont.load_default()
+        ascent, descent = self.pil.getmetrics()
+        self.ascent = ascent
+        self.descent = descent
+
+    def measure(self, text: str, displayof=None) -> int:
+        """Width of the longest line of text in pixels"""
+        return max(
+            round(self.pil.getlength(line)) for line in str(text).split("\n")
+        )
+
+    def metrics(self, *options, **kwargs) -> Union[int, Dict[str, int]]:
+        """Font metrics, see tkinter.font.Font.metrics"""
+        metrics = {
+            "ascent": self.ascent,
+            "descent": self.descent,
+            "linespace": self.ascent + self.descent,
+            "fixed": 0,
+        }
+        if len(options) == 1:
+            return metrics[options[0]]
+        if options:
+            return {option: metrics[option] for option in options}
+        return metrics
+
+
+class OffscreenImage:
+    """Pillow image with the tkinter.PhotoImage size interface"""
+
+    def __init__(self, image: Image.Image = None, **kw):
+        """OffscreenImage constructor, see PIL.ImageTk.PhotoImage"""
+        self.image = image.convert("RGBA")
+
+    def width(self) -> int:
+        """Image width"""
+        return self.image.width
+
+    def height(self) -> int:
+        """Image height"""
+        return self.image.height
+
+
+def _union(a: Rect, b: Rect) -> Rect:
+    return (
+        min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+    )
+
+
+def _overlap(a: Rect, b: Rect) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def merge_rects(rects: List[Rect]) -> List[Rect]:
+    """Merge overlapping rectangles until none overlap"""
+    merged: List[Rect] = []
+    for rect in rects:
+        while True:
+            for idx, other in enumerate(merged):
+                if _overlap(rect, other):
+                    rect = _union(rect, merged.pop(idx))
+                    break
+            else:
+                break
+        merged.append(rect)
+    return merged
+
+
+class OffscreenCanvas(RecordingCanvas):
+    """Canvas that rasterizes its items into a pillow image
+
+    Every operation that changes the appearance of an item marks the old and
+    new bounding box of the item as damaged. render() only redraws damaged
+    regions.
+    """
+
+    def __init__(self, master: "OffscreenRoot" = None, **options):
+        """OffscreenCanvas constructor, see tkinter.Canvas"""
+        super().__init__(master, **options)
+        self.image = Image.new("RGB", (1, 1))
+        self.damage: List[Rect] = []
+        self.grid_options: Dict[str, int] = {}
+        if isinstance(master, OffscreenRoot):
+            master.canvases.append(self)
+
+    @property
+    def background(self) -> str:
+        """Background color"""
+        default = self.options.get("bg", "white")
+        return self.options.get("background", default)
+
+    def bbox(self, item: int) -> Union[Rect, None]:
+        """Bounding box of an item, None if it is invisible
+        Cached until the item changes
+        """
+        entry = self.items[item]
+        if "bbox" not in entry:
+            entry["bbox"] = self._bbox(entry)
+        return entry["bbox"]
+
+    @staticmethod
+    def _bbox(entry: dict) -> Union[Rect, None]:
+        coords = entry["coords"]
+        options = entry["options"]
+        kind = entry["type"]
+        if kind in ("rectangle", "oval", "line"):
+            xs, ys = coords[0::2], coords[1::2]
+            return (int(min(xs)) - 1, int(min(ys)) - 1,
+                    int(max(xs)) + 2, int(max(ys)) + 2)
+
+        if kind == "image":
+            image = options.get("image")
+            if image is None:
+                return None
+            width, height = image.width(), image.height()
+        else:
+            text = str(options.get("text", ""))
+            font = options.get("font")
+            if not text.strip() or font is None:
+                return None
+            width = font.measure(text)
+            height = (1 + text.count("\n")) * font.metrics("linespace")
+
+        fx, fy = ANCHOR_OFFSETS[options.get("anchor", "center")]
+        x = int(coords[0] - fx * width)
+        y = int(coords[1] - fy * height)
+        return (x, y, x + width, y + height)
+
+    def _damage(self, item: int):
+        rect = self.bbox(item)
+        if rect is not None:
+            self.damage.append(rect)
+
+    def _create(self, kind: str, args: tuple, options: dict) -> int:
+        item = super()._create(kind, args, options)
+        self._damage(item)
+        return item
+
+    def coords(self, item: int, *args):
+        if not args:
+            return super().coords(item)
+        if [float(arg) for arg in args] == self.items[item]["coords"]:
+            self._record("coords", (item, *args), {})
+            return None
+        self._damage(item)
+        super().coords(item, *args)
+        self.items[item].pop("bbox", None)
+        self._damage(item)
+        return None
+
+    def itemconfigure(self, item: int, **options):
+        current = self.items[item]["options"]
+        if all(current.get(key) == value for key, value in options.items()):
+            self._record("itemconfigure", (item,), options)
+            return
+        self._damage(item)
+        super().itemconfigure(item, **options)
+        self.items[item].pop("bbox", None)
+        self._damage(item)
+
+    itemconfig = itemconfigure
+
+    def delete(self, *tags_or_ids):
+        for tag_or_id in tags_or_ids:
+            for item in self._find(tag_or_id):
+                self._damage(item)
+        super().delete(*tags_or_ids)
+
+    def resize(self, width: int, height: int):
+        size = (int(width), int(height))
+        self.image = Image.new("RGB", size, self.background)
+        self.damage = [(0, 0, int(width), int(height))]
+        super().resize(width, height)
+
+    def grid(self, *args, **kwargs):
+        self.grid_options = {
+            "row": kwargs.get("row", 0),
+            "column": kwargs.get("column", 0),
+            "rowspan": kwargs.get("rowspan", 1),
+            "columnspan": kwargs.get("columnspan", 1),
+        }
+        super().grid(*args, **kwargs)
+
+    def render(self) -> List[Rect]:
+        """Redraw damaged regions, return the redrawn rectangles"""
+        if not self.damage:
+            return []
+        width, height = self.image.size
+        rects = []
+        for x0, y0, x1, y1 in merge_rects(self.damage):
+            rect = (max(0, x0), max(0, y0), min(width, x1), min(height, y1))
+            if rect[0] < rect[2] and rect[1] < rect[3]:
+                self._draw(rect)
+                rects.append(rect)
+        self.damage = []
+        return rects
+
+    def _draw(self, rect: Rect):
+        """Redraw all items intersecting rect, clipped to rect"""
+        x0, y0, x1, y1 = rect
+        tile = Image.new("RGB", (x1 - x0, y1 - y0), self.background)
+        draw = ImageDraw.Draw(tile)
+        for item, entry in self.items.items():
+            bbox = self.bbox(item)
+            if bbox is None or not _overlap(bbox, rect):
+                continue
+            self._draw_item(tile, draw, entry, bbox, x0, y0)
+        self.image.paste(tile, (x0, y0))
+
+    @staticmethod
+    def _draw_item(tile, draw, entry: dict, bbox: Rect, dx: int, dy: int):
+        options = entry["options"]
+        kind = entry["type"]
+        coords = [c - (dx if i % 2 == 0 else dy)
+                  for i, c in enumerate(entry["coords"])]
+        if kind == "image":
+            image = options["image"].image
+            tile.paste(image, (bbox[0] - dx, bbox[1] - dy), image)
+        elif kind == "text":
+            font = options["font"]
+            fill = options.get("fill", "black")
+            linespace = font.metrics("linespace")
+            for idx, line in enumerate(str(options["text"]).split("\n")):
+                xy = (bbox[0] - dx, bbox[1] - dy + idx * linespace)
+                draw.text(xy, line, fill=fill, font=font.pil, anchor="la")
+        elif kind == "rectangle":
+            draw.rectangle(coords, outline=options.get("outline"),
+                           fill=options.get("fill"))
+        elif kind == "oval":
+            draw.ellipse(coords, outline=options.get("outline"),
+                         fill=options.get("fill"))
+        elif kind == "line":
+            draw.line(coords, fill=options.get("fill", "black"))
+
+
+class OffscreenRoot(RecordingRoot):
+    """Root that composes its canvases into a frame after every update
+
+    Canvases are placed according to their grid options. After each batch of
+    scheduled callbacks the damaged regions are rendered and passed to all
+    sinks together with the full frame.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.canvases: List[OffscreenCanvas] = []
+        self.sinks: List[Sink] = []
+        self.frame = Image.new("RGB", (1, 1))
+
+    def _offsets(self) -> Dict[OffscreenCanvas, Tuple[int, int]]:
+        """Top left corner of every canvas in the frame"""
+        widths: Dict[int, int] = {}
+        heights: Dict[int, int] = {}
+        for canvas in self.canvases:
+            grid = canvas.grid_options
+            if grid.get("columnspan", 1) == 1:
+                col = grid.get("column", 0)
+                widths[col] = max(widths.get(col, 0), canvas.winfo_width())
+            if grid.get("rowspan", 1) == 1:
+                row = grid.get("row", 0)
+                heights[row] = max(heights.get(row, 0), canvas.winfo_height())
+        offsets = {}
+        for canvas in self.canvases:
+            grid = canvas.grid_options
+            x = sum(w for c, w in widths.items() if c < grid.get("column", 0))
+            y = sum(h for r, h in heights.items() if r < grid.get("row", 0))
+            offsets[canvas] = (x, y)
+        return offsets
+
+    def render(self) -> List[Rect]:
+        """Render damaged regions of all canvases into the frame
+
+        Return
+        ------
+        list[tuple[int, int, int, int]]
+            Damaged rectangles in frame coordinates
+        """
+        offsets = self._offsets()
+        width = max((x + c.image.width for c, (x, _) in offsets.items()),
+                    default=1)
+        height = max((y + c.image.height for c, (_, y) in offsets.items()),
+                     default=1)
+        if self.frame.size != (width, height):
+            self.frame = Image.new("RGB", (width, height))
+            for canvas in self.canvases:
+                canvas.damage.append((0, 0, *canvas.image.size))
+
+        rects = []
+        for canvas, (x, y) in offsets.items():
+            for x0, y0, x1, y1 in canvas.render():
+                self.frame.paste(canvas.image.crop((x0, y0, x1, y1)),
+                                 (x + x0, y + y0))
+                rects.append((x + x0, y + y0, x + x1, y + y1))
+        if rects:
+            for sink in self.sinks:
+                sink(self.frame, rects)
+        return rects
+
+    def run_pending(self) -> int:
+        ran = super().run_pending()
+        if ran:
+            self.render()
+        return ran
+
+
+class PNGSink:
+    """Frame sink that atomically writes the full frame to a png file"""
+
+    def __init__(self, path: Path, compress_level: int = 1):
+        """PNGSink constructor
+
+        Parameters
+        ----------
+        path: Path
+            File to write to
+        compress_level: int, optional
+            zlib compression level, encoding dominates the cost of a frame
+            for higher levels. Defaults to 1
+        """
+        self.path = Path(path)
+        self.compress_level = compress_level
+
+    def __call__(self, frame: Image.Image, rects: List[Rect]):
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        frame.save(tmp, format="PNG", compress_level=self.compress_level)
+        os.replace(tmp, self.path)
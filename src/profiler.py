@@ -0,0 +1,189 @@
+"""On-demand wall-clock sampling profiler
+A profile is started by a signal or by creating a trigger file and writes
+collapsed stacks that can be turned into flamegraphs, for example with
+https://github.com/brendangregg/FlameGraph or https://www.speedscope.app
+"""
+
+from collections import Counter
+import os
+from pathlib import Path
+import signal
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Union
+
+from . import log
+
+
+LOG = log.get(__name__)
+
+# signal that starts a profile, None disables (SIGUSR1 is not available on
+# windows)
+PROFILE_SIGNAL = getattr(signal, "SIGUSR1", None)
+# file that starts a profile when it is created, None disables
+PROFILE_TRIGGER: Union[Path, None] = None
+# seconds between checks for the trigger file
+TRIGGER_POLL_TIME = 2.0
+# seconds a profile runs
+PROFILE_DURATION = 30.0
+# seconds between two samples
+PROFILE_INTERVAL = 0.005
+# directory profiles are written to
+PROFILE_DIR = Path(__file__).parents[1].resolve() / "profiles"
+
+
+def collapse(frame: FrameType) -> str:
+    """Collapse a stack into a single line, outermost frame first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Periodically sample the stacks of all threads from a daemon thread
+
+    The profiler only runs while a profile is taken, there is no overhead
+    while it is idle.
+    """
+
+    def __init__(
+        self,
+        duration: float = PROFILE_DURATION,
+        interval: float = PROFILE_INTERVAL,
+        directory: Path = PROFILE_DIR,
+    ):
+        """SamplingProfiler constructor
+
+        Parameters
+        ----------
+        duration: float, optional
+            Seconds a profile runs. Defaults to PROFILE_DURATION
+        interval: float, optional
+            Seconds between two samples. Defaults to PROFILE_INTERVAL
+        directory: Path, optional
+            Directory to write profiles to. Defaults to PROFILE_DIR
+        """
+        self.duration = duration
+        self.interval = interval
+        self.directory = Path(directory)
+        self._thread: Union[threading.Thread, None] = None
+
+    @property
+    def running(self) -> bool:
+        """True while a profile is taken"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float = None) -> bool:
+        """Start a profile in the background
+
+        Parameters
+        ----------
+        duration: float, optional
+            Seconds the profile runs. Defaults to None (self.duration)
+
+        Return
+        ------
+        bool
+            False if a profile is already running
+        """
+        if self.running:
+            return False
+        duration = self.duration if duration is None else duration
+        self._thread = threading.Thread(
+            target=self._run, args=(duration,), name="profiler", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def _run(self, duration: float):
+        """Sample stacks for duration seconds and write the profile"""
+        LOG.info("profiling", seconds=duration)
+        own = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        samples = 0
+        stop = time.monotonic() + duration
+        while time.monotonic() < stop:
+            self._sample(stacks, names, own)
+            samples += 1
+            time.sleep(self.interval)
+
+        path = self.write(stacks)
+        LOG.info("wrote profile", samples=samples, path=path)
+
+    def _sample(self, stacks: Counter, names: dict, own: int):
+        """Add the current stack of every thread except own to stacks"""
+        # pylint: disable=protected-access
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            name = names.get(ident)
+            if name is None:
+                name = self._thread_name(ident)
+                names[ident] = name
+            stacks[f"{name};{collapse(frame)}"] += 1
+
+    @staticmethod
+    def _thread_name(ident: int) -> str:
+        for thread in threading.enumerate():
+            if thread.ident == ident:
+                return thread.name
+        return f"thread-{ident}"
+
+    def write(self, stacks: Counter) -> Path:
+        """Write collapsed stacks ("stack count" per line) to a new file"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = self.directory / f"profile-{stamp}.folded"
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        return path
+
+
+def install(
+    profiler: SamplingProfiler,
+    signum: Union[int, None] = PROFILE_SIGNAL,
+    trigger: Union[Path, None] = PROFILE_TRIGGER,
+):
+    """Start profiles on a signal or on creation of a trigger file
+
+    The signal handler must be installed from the main thread. The trigger
+    file is polled by a daemon thread and deleted once a profile starts, so
+    it can be created again to take another profile.
+
+    Parameters
+    ----------
+    profiler: SamplingProfiler
+        The profiler to start
+    signum: int, optional
+        Signal that starts a profile, None disables. Defaults to
+        PROFILE_SIGNAL
+    trigger: Path, optional
+        Trigger file, None disables. Defaults to PROFILE_TRIGGER
+    """
+    if signum is not None:
+        # pylint: disable=unused-argument
+        def handler(signum, frame):
+            profiler.start()
+
+        signal.signal(signum, handler)
+
+    if trigger is not None:
+        trigger = Path(trigger)
+
+        def poll():
+            while True:
+                if trigger.exists():
+                    trigger.unlink(missing_ok=True)
+                    profiler.start()
+                time.sleep(TRIGGER_POLL_TIME)
+
+        thread = threading.Thread(target=poll, name="trigger", daemon=True)
+        thread.start()
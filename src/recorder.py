@@ -0,0 +1,232 @@
+"""Flight recorder
+A ring buffer of the last update cycles that stays enabled permanently:
+requests (url, status, seconds), fetched departures and artist updates per
+station and callback runs. Entries are small tuples with truncated texts and
+every cycle keeps at most MAX_ENTRIES_PER_CYCLE of them, so the buffer has a
+fixed upper size. It is written to RECORD_DIR on an unhandled exception, an
+event loop stall (see monitor.py) or DUMP_SIGNAL (`kill -QUIT <pid>`).
+"""
+
+from collections import deque
+import json
+import os
+from pathlib import Path
+import signal
+import sys
+import threading
+import time
+import traceback
+from typing import Deque, List, Tuple, Union
+
+from . import log
+
+
+RECORD = True
+# number of update cycles kept
+RECORD_CYCLES = 30
+# entries per cycle, further entries of a cycle are counted as dropped
+MAX_ENTRIES_PER_CYCLE = 500
+# characters of names and urls kept per entry
+MAX_TEXT = 200
+# directory dumps are written to and number of dumps kept there per reason,
+# so frequent stall dumps do not rotate out the dumps of exceptions
+RECORD_DIR = Path(__file__).parents[1].resolve() / "flightrecords"
+MAX_DUMPS = 20
+# dumps of the same reason within one millisecond get a counter, up to
+MAX_DUMP_NAMES = 100
+# seconds between two dumps of stalls, so a slow board does not fill the disk
+STALL_DUMP_INTERVAL = 600
+# signal that writes a dump, None disables (SIGQUIT is not available on
+# windows)
+DUMP_SIGNAL = getattr(signal, "SIGQUIT", None)
+
+LOG = log.get(__name__)
+
+# time.time(), kind, name, two values, e.g. a status code and seconds
+Entry = Tuple[float, str, str, Union[int, float, None], Union[float, None]]
+
+
+class FlightRecorder:
+    """Ring buffer of entries grouped in cycles"""
+
+    def __init__(
+        self,
+        cycles: int = RECORD_CYCLES,
+        directory: Path = RECORD_DIR,
+    ):
+        """FlightRecorder constructor
+
+        Parameters
+        ----------
+        cycles: int, optional
+            Number of cycles to keep. Defaults to RECORD_CYCLES
+        directory: Path, optional
+            Directory dumps are written to. Defaults to RECORD_DIR
+        """
+        self.cycles: Deque[List[Entry]] = deque(maxlen=cycles)
+        self.current: List[Entry] = []
+        self.directory = Path(directory)
+        self.dropped = 0
+        self.last_stall_dump = float("-inf")
+        self._lock = threading.Lock()  # dumps of several threads
+
+    def record(
+        self,
+        kind: str,
+        name: str,
+        value: Union[int, float, None] = None,
+        seconds: Union[float, None] = None,
+    ):
+        """Add an entry to the current cycle
+
+        Parameters
+        ----------
+        kind: str
+            Entry kind, e.g. "request"
+        name: str
+            What the entry is about, e.g. an url, truncated to MAX_TEXT
+        value: int or float, optional
+            Kind specific value, e.g. a status code. Defaults to None
+        seconds: float, optional
+            Duration. Defaults to None
+        """
+        if not RECORD:
+            return
+        if len(self.current) >= MAX_ENTRIES_PER_CYCLE:
+            self.dropped += 1
+            return
+        self.current.append((time.time(), kind, name[:MAX_TEXT], value,
+                             seconds))
+
+    def end_cycle(self):
+        """Move the entries of the current cycle into the ring buffer"""
+        if not RECORD:
+            return
+        self.cycles.append(self.current)
+        self.current = []
+
+    def dump(self, reason: str, details: str = None) -> Union[Path, None]:
+        """Write the ring buffer and the current cycle as json to a new file
+        in directory, keeps the last MAX_DUMPS files of reason
+
+        Parameters
+        ----------
+        reason: str
+            Why the dump was written, e.g. "exception"
+        details: str, optional
+            E.g. a traceback. Defaults to None
+
+        Returns
+        -------
+        Path or None
+            Written file, None if writing failed
+        """
+        if not RECORD:
+            return None
+        now = time.time()
+        keys = ("time", "kind", "name", "value", "seconds")
+        cycles = list(self.cycles) + [list(self.current)]
+        content = {
+            "reason": reason,
+            "details": details,
+            "time": now,
+            "pid": os.getpid(),
+            "dropped": self.dropped,
+            "cycles": [[dict(zip(keys, entry)) for entry in cycle]
+                       for cycle in cycles],
+        }
+        stamp = (time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+                 + f"-{int(now * 1000) % 1000:03d}")
+        with self._lock:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                path = self._create(stamp, reason)
+                with path.open("w", encoding="utf-8") as file:
+                    json.dump(content, file)
+                dumps = sorted(self.directory.glob(f"flight-*-{reason}.json"))
+                for old in dumps[:-MAX_DUMPS]:
+                    old.unlink(missing_ok=True)
+            except OSError as e:
+                LOG.error("could not write flight record", error=str(e))
+                return None
+        LOG.warning("wrote flight record", reason=reason, path=path)
+        return path
+
+    def _create(self, stamp: str, reason: str) -> Path:
+        """Create a new, empty dump file, names sort by time"""
+        for count in range(MAX_DUMP_NAMES):
+            path = self.directory / f"flight-{stamp}-{count:02d}-{reason}.json"
+            try:
+                with path.open("x", encoding="utf-8"):
+                    return path
+            except FileExistsError:
+                continue
+        raise FileExistsError(f"{MAX_DUMP_NAMES} dumps of {reason} at {stamp}")
+
+    def stall(self, name: str, seconds: float):
+        """Record a stall and dump, at most once per STALL_DUMP_INTERVAL"""
+        self.record("stall", name, None, seconds)
+        now = time.monotonic()
+        if now - self.last_stall_dump >= STALL_DUMP_INTERVAL:
+            self.last_stall_dump = now
+            self.dump("stall", f"{name} blocked for {seconds:.3f}s")
+
+
+RECORDER = FlightRecorder()
+
+
+def record(
+    kind: str,
+    name: str,
+    value: Union[int, float, None] = None,
+    seconds: Union[float, None] = None,
+):
+    """Add an entry to the global recorder, see FlightRecorder.record"""
+    if RECORD:
+        RECORDER.record(kind, name, value, seconds)
+
+
+def _dump_exception(exc_type, exc, tb):
+    details = "".join(traceback.format_exception(exc_type, exc, tb))
+    RECORDER.dump("exception", details)
+
+
+def report_callback_exception(exc_type, exc, tb):
+    """Replacement of tkinter's report_callback_exception that dumps the
+    recorder before printing the traceback"""
+    _dump_exception(exc_type, exc, tb)
+    traceback.print_exception(exc_type, exc, tb)
+
+
+def install(root=None, signum: Union[int, None] = DUMP_SIGNAL):
+    """Dump on unhandled exceptions (of root's callbacks if given, of the
+    main and other threads) and on signum, must be called from the main
+    thread"""
+    excepthook = sys.excepthook
+
+    def hook(exc_type, exc, tb):
+        if not issubclass(exc_type, KeyboardInterrupt):
+            _dump_exception(exc_type, exc, tb)
+        excepthook(exc_type, exc, tb)
+
+    sys.excepthook = hook
+
+    thread_excepthook = threading.excepthook
+
+    def thread_hook(args):
+        if args.exc_type is not SystemExit:
+            _dump_exception(args.exc_type, args.exc_value, args.exc_traceback)
+        thread_excepthook(args)
+
+    threading.excepthook = thread_hook
+
+    if root is not None:
+        # tkinter reports exceptions of callbacks itself
+        root.report_callback_exception = report_callback_exception
+
+    if signum is not None:
+        # pylint: disable=unused-argument
+        def handler(signum, frame):
+            RECORDER.dump("signal")
+
+        signal.signal(signum, handler)
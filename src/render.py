@@ -0,0 +1,176 @@
+"""Apply display updates in time slices
+Large boards take long to update, blocking clock, poster and input callbacks.
+Updates are split into small units (e.g. one departure artist) that are
+processed in slices of at most RENDER_BUDGET ms, with an event loop
+iteration between two slices.
+"""
+
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from itertools import count
+import time
+from tkinter import Misc
+from typing import (
+    Callable, ContextManager, Deque, Dict, Hashable, Iterable, Union
+)
+
+from . import debug
+from . import defines as d
+from . import tracing
+from .monitor import LoopMonitor
+
+
+SLICE_TIME = debug.REGISTRY.histogram(
+    "mops_render_slice_seconds",
+    "Run time of render slices",
+)
+SLICE_UNITS = debug.REGISTRY.histogram(
+    "mops_render_slice_units",
+    "Render units processed per slice",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+PENDING_UNITS = debug.REGISTRY.gauge(
+    "mops_render_pending_units",
+    "Render units waiting for a slice",
+)
+
+
+@dataclass
+class _Work:
+    """Pending render units of one key"""
+
+    priority: int
+    order: int
+    units: Deque[Callable]
+    done: Union[Callable[[float], None], None] = None
+    context: Union[Callable[[], ContextManager], None] = None
+    elapsed: float = field(default=0.0)
+
+
+class SlicedRenderer:
+    """Process render units in slices of limited duration
+
+    Work is submitted per key (e.g. a station). Newer work replaces pending
+    work of the same key, work with lower priority value runs first, equal
+    priorities in submission order.
+    """
+
+    def __init__(
+        self,
+        root: Misc,
+        budget: float = d.RENDER_BUDGET,
+        monitor: LoopMonitor = None,
+    ):
+        """SlicedRenderer constructor
+
+        Parameters
+        ----------
+        root: tkinter.Misc
+            Widget whose after method is used for scheduling slices
+        budget: float, optional
+            Milliseconds a slice may run, a slice runs at least one unit.
+            Defaults to defines.RENDER_BUDGET
+        monitor: LoopMonitor, optional
+            Monitor recording drift and duration of every slice, slices are
+            scheduled with its after method. Defaults to None
+        """
+        self.root = root
+        self.monitor = monitor
+        self.budget = budget
+        self.pending: Dict[Hashable, _Work] = {}
+        self._order = count()
+        self._job: Union[str, None] = None
+
+    def submit(
+        self,
+        key: Hashable,
+        units: Iterable[Callable],
+        priority: int = 0,
+        done: Callable[[float], None] = None,
+        context: Callable[[], ContextManager] = None,
+    ):
+        """Submit render units
+
+        Parameters
+        ----------
+        key: Hashable
+            Pending units of the same key are dropped
+        units: Iterable[Callable]
+            Functions to call without arguments
+        priority: int, optional
+            Lower values are rendered first. Defaults to 0
+        done: Callable[[float], None], optional
+            Called with the summed run time of the units after the last unit,
+            immediately if there are none. Defaults to None
+        context: Callable[[], ContextManager], optional
+            Context entered around the units processed in one slice, e.g.
+            GridCanvas.batch. Defaults to None
+        """
+        self.pending.pop(key, None)
+        work = _Work(
+            priority, next(self._order), deque(units), done, context
+        )
+        if work.units:
+            self.pending[key] = work
+        elif done is not None:
+            done(0.0)
+        PENDING_UNITS.set(self.size)
+        if self.pending and self._job is None:
+            self._job = self._after(self._slice)
+
+    @property
+    def size(self) -> int:
+        """Number of pending units"""
+        return sum(len(work.units) for work in self.pending.values())
+
+    def _after(self, func: Callable) -> str:
+        """Run func in the next event loop iteration"""
+        if self.monitor is None:
+            return self.root.after(0, func)
+        return self.monitor.after(0, func)
+
+    def flush(self):
+        """Process all pending units at once"""
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+        self._slice(budget=float("inf"))
+
+    def _slice(self, budget: float = None):
+        """Process units until the budget is used up"""
+        self._job = None
+        budget = self.budget if budget is None else budget
+        start = time.perf_counter()
+        deadline = start + budget / 1000
+        units = 0
+        try:
+            with tracing.span("render slice"):
+                while self.pending:
+                    key, work = min(
+                        self.pending.items(),
+                        key=lambda item: (item[1].priority, item[1].order),
+                    )
+                    with (nullcontext() if work.context is None
+                          else work.context()):
+                        while work.units:
+                            unit_start = time.perf_counter()
+                            unit = work.units.popleft()
+                            if not work.units:
+                                del self.pending[key]
+                            unit()
+                            now = time.perf_counter()
+                            work.elapsed += now - unit_start
+                            units += 1
+                            if now >= deadline:
+                                break
+                    if not work.units and work.done is not None:
+                        work.done(work.elapsed)
+                    if time.perf_counter() >= deadline:
+                        break
+        finally:
+            # failing units are reported by tkinter, but must not stop others
+            SLICE_TIME.observe(time.perf_counter() - start)
+            SLICE_UNITS.observe(units)
+            PENDING_UNITS.set(self.size)
+            if self.pending and self._job is None:
+                self._job = self._after(self._slice)
@@ -0,0 +1,240 @@
+"""Record API responses and replay them on virtual time
+Capture mode (`python . --capture PATH`) appends responses with their
+timestamps to a json lines file (gzip compressed if PATH ends with .gz).
+Replay mode (`python . --replay PATH`) runs the headless application on a
+virtual clock that starts at the first recorded response, answers requests
+with the latest response recorded up to the virtual time and samples memory
+and update durations, so days of operation run in minutes.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import gc
+import gzip
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Tuple, Union
+from urllib.parse import urlsplit
+
+from . import clock
+from . import data
+from . import debug
+from . import endpoints
+from .monitor import LoopMonitor
+
+if TYPE_CHECKING:
+    import requests
+
+
+# seconds between two recordings of the same url
+CAPTURE_INTERVAL = 60
+# virtual seconds between two samples of the replay report
+REPORT_INTERVAL = 3600
+
+Entry = Tuple[float, int, float, str]  # timestamp, status, elapsed, body
+
+
+def _open(path: Path, mode: str):
+    """Open a text file, gzip compressed if the suffix is .gz"""
+    if Path(path).suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _strip_host(url: str) -> str:
+    """Remove scheme and host, so recordings do not depend on the endpoint"""
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}"
+
+
+class Recorder:
+    """Append responses to a json lines file"""
+
+    def __init__(self, path: Path, interval: float = CAPTURE_INTERVAL):
+        """Recorder constructor
+
+        Parameters
+        ----------
+        path: Path
+            File to append to
+        interval: float, optional
+            Minimal seconds between two recordings of the same url.
+            Defaults to CAPTURE_INTERVAL
+        """
+        self.file = _open(path, "a")
+        self.interval = interval
+        self._last: Dict[str, float] = {}
+
+    def wrap(self, send: Callable) -> Callable:
+        """Wrap a request sender (see data.send_requests) to record responses"""
+
+        def send_requests(urls: List[str]) -> Iterator[requests.Response]:
+            for response in send(urls):
+                self.record(response)
+                yield response
+
+        return send_requests
+
+    def record(self, response: requests.Response):
+        """Append a response unless its url was recorded recently"""
+        url = _strip_host(response.request.url)
+        now = clock.monotonic()
+        last = self._last.get(url)
+        if last is not None and now - last < self.interval:
+            return
+        self._last[url] = now
+        entry = {
+            "time": clock.now().astimezone().isoformat(),
+            "url": url,
+            "status": response.status_code,
+            "elapsed": response.elapsed.total_seconds(),
+            "body": response.text,
+        }
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def close(self):
+        """Close the file"""
+        self.file.close()
+
+
+class Replayer:
+    """Answer requests with recorded responses"""
+
+    def __init__(self, path: Path):
+        """Replayer constructor
+
+        Parameters
+        ----------
+        path: Path
+            Recording to replay, see Recorder
+        """
+        self.entries: Dict[str, List[Entry]] = {}
+        with _open(path, "r") as file:
+            for line in file:
+                entry = json.loads(line)
+                timestamp = datetime.fromisoformat(entry["time"]).timestamp()
+                self.entries.setdefault(entry["url"], []).append((
+                    timestamp,
+                    entry["status"],
+                    entry["elapsed"],
+                    entry["body"],
+                ))
+        if not self.entries:
+            raise ValueError(f"Recording {path} is empty")
+
+        for entries in self.entries.values():
+            entries.sort(key=lambda entry: entry[0])
+        self._times = {
+            url: [entry[0] for entry in entries]
+            for url, entries in self.entries.items()
+        }
+        start = min(entries[0][0] for entries in self.entries.values())
+        end = max(entries[-1][0] for entries in self.entries.values())
+        self.start = datetime.fromtimestamp(start).astimezone()
+        self.end = datetime.fromtimestamp(end).astimezone()
+        self.samples: List[dict] = []
+
+    def lookup(self, url: str) -> Union[Entry, None]:
+        """Latest entry of url recorded up to the current clock time"""
+        url = _strip_host(url)
+        times = self._times.get(url)
+        if times is None:
+            return None
+        idx = bisect_right(times, clock.now().astimezone().timestamp())
+        return self.entries[url][idx - 1] if idx > 0 else None
+
+    def send_requests(self, urls: List[str]) -> Iterator[requests.Response]:
+        """Replacement of data.send_requests, unknown urls fail"""
+        data.load_http()
+        # stations request paths relative to the endpoint (see
+        # endpoints.Router.get), responses carry the full url
+        base = endpoints.ROUTER.endpoints[0].url
+        for url in urls:
+            if not urlsplit(url).scheme:
+                url = base + url
+            entry = self.lookup(url)
+            if entry is None:
+                continue
+            _, status, elapsed, body = entry
+            response = data.requests.Response()
+            response.status_code = status
+            response._content = body.encode("utf-8")
+            response.encoding = "utf-8"
+            response.url = url
+            response.request = data.requests.Request("GET", url).prepare()
+            response.elapsed = timedelta(seconds=elapsed)
+            yield response
+
+    def sample(self, monitor: LoopMonitor):
+        """Record memory and update durations at the current clock time"""
+        summary = monitor.summary()
+        self.samples.append({
+            "time": clock.now().isoformat(),
+            "rss": debug.rss(),
+            # gc.get_objects() leaves out the heap frozen after startup
+            # (see heap.freeze)
+            "objects": len(gc.get_objects()) + gc.get_freeze_count(),
+            "frozen_objects": gc.get_freeze_count(),
+            "callbacks": {
+                name: {
+                    "runs": stats["runs"],
+                    "duration_p95": stats["duration_p95"],
+                    "duration_max": stats["duration_max"],
+                }
+                for name, stats in summary.items()
+            },
+        })
+
+    def report(self) -> dict:
+        """Replay report"""
+        return {
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "urls": len(self.entries),
+            "samples": self.samples,
+        }
+
+
+def install_capture(path: Path, interval: float = CAPTURE_INTERVAL):
+    """Record all responses of data.send_requests to path"""
+    recorder = Recorder(path, interval)
+    data.send_requests = recorder.wrap(data.send_requests)
+    return recorder
+
+
+def install_replay(path: Path, root, monitor: LoopMonitor) -> Replayer:
+    """Replay responses from path on virtual time
+
+    Replaces the application clock and data.send_requests, samples the
+    report every REPORT_INTERVAL virtual seconds and stops root's mainloop
+    after the last recorded response. Must be called before any callbacks
+    are scheduled on root.
+
+    Parameters
+    ----------
+    path: Path
+        Recording to replay
+    root: headless.RecordingRoot
+        Root whose mainloop runs on the application clock
+    monitor: LoopMonitor
+        Monitor whose statistics are sampled
+    """
+    replayer = Replayer(path)
+    clock.set_clock(clock.VirtualClock(replayer.start))
+    data.send_requests = replayer.send_requests
+
+    def sample():
+        replayer.sample(monitor)
+        root.after(REPORT_INTERVAL * 1000, sample)
+
+    def stop():
+        replayer.sample(monitor)
+        root.quit()
+
+    duration = (replayer.end - replayer.start).total_seconds()
+    root.after(REPORT_INTERVAL * 1000, sample)
+    root.after(int(duration * 1000) + 1, stop)
+    return replayer
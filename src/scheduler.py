@@ -0,0 +1,220 @@
+"""Schedule periodic jobs on wall clock boundaries
+All periodic updates share one tkinter timer. Aligned jobs run on multiples
+of their interval in local time (a clock updated every minute changes on
+the exact minute), jobs that fall due together run in a single wakeup
+ordered by priority.
+"""
+
+from datetime import datetime
+import math
+import time
+from typing import Callable, Dict, List, Union
+
+from . import clock
+from . import debug
+from .monitor import LoopMonitor, waited
+
+
+# milliseconds an unaligned job may run early to share a wakeup with
+# another job
+COALESCE_TIME = 500
+
+WAKEUPS = debug.REGISTRY.counter(
+    "mops_scheduler_wakeups_total",
+    "Timer wakeups of the scheduler",
+)
+JOB_NEXT_RUN = debug.REGISTRY.gauge(
+    "mops_job_next_run_timestamp_seconds",
+    "Planned start of the next run of a scheduled job",
+    ("job",),
+)
+JOB_LAST_DURATION = debug.REGISTRY.gauge(
+    "mops_job_last_duration_seconds",
+    "Run time of the last run of a scheduled job",
+    ("job",),
+)
+JOBS_MISSED = debug.REGISTRY.counter(
+    "mops_jobs_missed_total",
+    "Runs of scheduled jobs skipped because they passed their deadline",
+    ("job",),
+)
+
+
+class Job:
+    """Periodic job of a Scheduler"""
+
+    def __init__(
+        self,
+        func: Callable,
+        interval: int,
+        align: bool = False,
+        priority: int = 0,
+        deadline: Union[int, None] = None,
+        slack: Union[int, None] = None,
+        name: Union[str, None] = None,
+    ):
+        """Job constructor
+
+        Parameters
+        ----------
+        func: Callable
+            Function to call without arguments
+        interval: int
+            Milliseconds between two runs
+        align: bool, optional
+            Whether to run on multiples of interval in local time.
+            Defaults to False (interval after the first run)
+        priority: int, optional
+            Jobs with higher priority run first if due together. Defaults to 0
+        deadline: int, optional
+            Milliseconds a run may start late, later runs are skipped.
+            Defaults to None (never skip)
+        slack: int, optional
+            Milliseconds the job may run early to share a wakeup. Defaults to
+            None (0 if aligned, else COALESCE_TIME)
+        name: str, optional
+            Name in monitor statistics. Defaults to None (func.__qualname__)
+        """
+        self.func = func
+        self.interval = interval
+        self.align = align
+        self.priority = priority
+        self.deadline = deadline
+        if slack is None:
+            slack = 0 if align else COALESCE_TIME
+        self.slack = slack
+        self.name = name or getattr(func, "__qualname__", repr(func))
+
+        self.next_run = 0.0  # planned start, seconds since epoch
+        self.last_duration = float("nan")
+        self.runs = 0
+        self.missed = 0
+
+    def plan(self, now: float):
+        """Plan the next run after the one planned at self.next_run"""
+        interval = self.interval / 1000
+        if self.align:
+            # multiples of interval in local time, utc offsets may differ
+            # from whole intervals (e.g. daily jobs)
+            offset = datetime.fromtimestamp(now).astimezone().utcoffset()
+            offset = offset.total_seconds()
+            slot = math.floor((now + offset) / interval) + 1
+            self.next_run = slot * interval - offset
+        else:
+            # keep the phase, skip runs that were missed
+            self.next_run += interval
+            if self.next_run <= now:
+                missed = math.floor((now - self.next_run) / interval) + 1
+                self.next_run += missed * interval
+        JOB_NEXT_RUN.set(self.next_run, job=self.name)
+
+    def summary(self) -> Dict[str, Union[str, float, int]]:
+        """Next run, last duration and statistics of the job"""
+        return {
+            "next_run": datetime.fromtimestamp(self.next_run).isoformat(),
+            "last_duration": self.last_duration,
+            "runs": self.runs,
+            "missed": self.missed,
+            "interval": self.interval,
+            "align": self.align,
+            "priority": self.priority,
+        }
+
+
+class Scheduler:
+    """Run periodic jobs on a single tkinter timer
+
+    Every wakeup runs all jobs that are due or due within their slack, in
+    order of priority, and sets the timer to the next planned run. Drift and
+    duration of every job are recorded by the LoopMonitor.
+    """
+
+    def __init__(self, monitor: LoopMonitor):
+        """Scheduler constructor
+
+        Parameters
+        ----------
+        monitor: LoopMonitor
+            Monitor recording the runs, its root is used for the timer
+        """
+        self.monitor = monitor
+        self.root = monitor.root
+        self.jobs: List[Job] = []
+        self._timer: Union[str, None] = None
+
+    def add(
+        self, func: Callable, interval: int, immediately: bool = True,
+        **kwargs
+    ) -> Job:
+        """Add a periodic job, see Job for the other arguments
+        The job first runs on the next wakeup, aligned jobs then continue on
+        the next boundary. immediately=False skips the first run"""
+        job = Job(func, interval, **kwargs)
+        job.next_run = clock.now().timestamp()
+        if immediately:
+            JOB_NEXT_RUN.set(job.next_run, job=job.name)
+        else:
+            job.plan(job.next_run)
+        self.jobs.append(job)
+        self.jobs.sort(key=lambda job: -job.priority)
+        self._schedule()
+        return job
+
+    def remove(self, job: Job):
+        """Remove a job"""
+        self.jobs.remove(job)
+        self._schedule()
+
+    def _schedule(self):
+        """Set the timer to the earliest planned run"""
+        if self._timer is not None:
+            self.root.after_cancel(self._timer)
+            self._timer = None
+        if not self.jobs:
+            return
+        next_run = min(job.next_run for job in self.jobs)
+        delay = max(0.0, next_run - clock.now().timestamp())
+        # never wake up early, aligned jobs would wait for another wakeup
+        self._timer = self.root.after(math.ceil(delay * 1000), self._wakeup)
+
+    def _wakeup(self):
+        """Run due jobs in order of priority"""
+        self._timer = None
+        WAKEUPS.inc()
+        try:
+            for job in list(self.jobs):
+                now = clock.now().timestamp()
+                if job.next_run - job.slack / 1000 > now:
+                    continue
+                late = now - job.next_run
+                deadline = job.deadline
+                try:
+                    if deadline is not None and late > deadline / 1000:
+                        job.missed += 1
+                        JOBS_MISSED.inc(job=job.name)
+                    else:
+                        self._run(job, late)
+                finally:
+                    job.plan(clock.now().timestamp())
+        finally:
+            # failing jobs are reported by tkinter, but must not stop others
+            self._schedule()
+
+    def _run(self, job: Job, drift: float):
+        start = time.perf_counter()
+        start_wait = waited()
+        self.monitor.current = job.name
+        try:
+            job.func()
+        finally:
+            self.monitor.current = None
+            duration = time.perf_counter() - start
+            job.last_duration = duration
+            job.runs += 1
+            JOB_LAST_DURATION.set(duration, job=job.name)
+            self.monitor.record(job.name, drift, duration,
+                                duration_wait=waited() - start_wait)
+
+    def summary(self) -> Dict[str, Dict[str, Union[str, float, int]]]:
+        """Job name mapped to its next run, last duration and statistics"""
+        return {job.name: job.summary() for job in self.jobs}
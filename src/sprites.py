@@ -0,0 +1,143 @@
+"""Pre-rasterized text sprites
+Tk lays out and renders every text item again when its text changes. The
+strings on a departure board (destinations, dots, minutes 0-90) are few and
+repeat all day, so they can be rasterized once with pillow and shown as
+canvas images (see DepartureArtist, enabled by TEXT_SPRITES in defines.py).
+Sprites are kept in a cache bounded by count and bytes, least recently used
+sprites are dropped first.
+"""
+
+from collections import OrderedDict
+from math import ceil
+from tkinter.font import Font
+from typing import Dict, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from . import debug
+from . import defines as d
+from .offscreen import OffscreenFont
+
+
+SPRITE_REQUESTS = debug.REGISTRY.counter(
+    "mops_sprite_requests_total",
+    "Text sprite requests by result (hit or miss)",
+    ("result",),
+)
+SPRITE_EVICTIONS = debug.REGISTRY.counter(
+    "mops_sprite_evictions_total",
+    "Text sprites dropped from the cache",
+)
+SPRITE_BYTES = debug.REGISTRY.gauge(
+    "mops_sprite_bytes",
+    "Uncompressed size of the cached text sprites",
+)
+
+SpriteKey = Tuple[str, str, str]  # text, font, fill
+
+# pillow fonts by str(font)
+_PIL_FONTS: Dict[str, ImageFont.ImageFont] = {}
+
+
+def pil_font(font) -> ImageFont.ImageFont:
+    """Pillow font for a font of any backend (tkinter, headless, offscreen)
+    Families without a truetype file fall back to similar fonts, so sprites
+    may differ slightly from tkinter text in width.
+    """
+    key = str(font)
+    if key not in _PIL_FONTS:
+        if hasattr(font, "pil"):  # offscreen
+            pil = font.pil
+        elif isinstance(font, Font):
+            actual = font.actual()
+            pil = OffscreenFont(
+                (actual["family"], actual["size"], actual["weight"])
+            ).pil
+        else:  # headless
+            pil = OffscreenFont((font.family, font.size, *font.styles)).pil
+        _PIL_FONTS[key] = pil
+    return _PIL_FONTS[key]
+
+
+def rasterize(text: str, font, fill: str) -> Image.Image:
+    """Rasterize a single line of text on a transparent background, the image
+    is one line high and at least 1px wide"""
+    pil = pil_font(font)
+    ascent, descent = pil.getmetrics()
+    width = max(1, ceil(pil.getlength(text)))
+    image = Image.new("RGBA", (width, ascent + descent), (0, 0, 0, 0))
+    ImageDraw.Draw(image).text((0, 0), text, font=pil, fill=fill)
+    return image
+
+
+class SpriteCache:
+    """Least recently used cache of text sprites
+
+    Artists must keep a reference to the sprites they display: tkinter
+    deletes an image together with its last python reference, so a dropped
+    sprite would vanish from the canvas. Displayed sprites therefore may
+    exceed the bounds.
+    """
+
+    def __init__(
+        self,
+        max_count: int = d.SPRITE_CACHE_COUNT,
+        max_bytes: int = d.SPRITE_CACHE_BYTES,
+    ):
+        """SpriteCache constructor
+
+        Parameters
+        ----------
+        max_count: int, optional
+            Maximum number of cached sprites.
+            Defaults to defines.SPRITE_CACHE_COUNT
+        max_bytes: int, optional
+            Maximum uncompressed size (4 bytes per pixel) of cached sprites.
+            Defaults to defines.SPRITE_CACHE_BYTES
+        """
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._sprites: OrderedDict[SpriteKey, Tuple[d.PhotoImage, int]] = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._sprites)
+
+    def get(self, text: str, font, fill: str) -> d.PhotoImage:
+        """Sprite showing text in font and fill color"""
+        key = (text, str(font), fill)
+        entry = self._sprites.get(key)
+        if entry is not None:
+            SPRITE_REQUESTS.inc(result="hit")
+            self._sprites.move_to_end(key)
+            return entry[0]
+
+        SPRITE_REQUESTS.inc(result="miss")
+        image = rasterize(text, font, fill)
+        size = 4 * image.width * image.height
+        sprite = d.PhotoImage(image)
+        self._sprites[key] = (sprite, size)
+        self.bytes += size
+        self._evict()
+        return sprite
+
+    def clear(self):
+        """Drop all sprites"""
+        self._sprites.clear()
+        self.bytes = 0
+        SPRITE_BYTES.set(0)
+
+    def _evict(self):
+        # keep the newest sprite even if it exceeds max_bytes on its own
+        while len(self._sprites) > 1 and (
+            len(self._sprites) > self.max_count or self.bytes > self.max_bytes
+        ):
+            _, (_, size) = self._sprites.popitem(last=False)
+            self.bytes -= size
+            SPRITE_EVICTIONS.inc()
+        SPRITE_BYTES.set(self.bytes)
+
+
+SPRITES = SpriteCache()
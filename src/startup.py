@@ -0,0 +1,142 @@
+"""Overlapped startup
+The first departure requests are sent as soon as the config is parsed. While
+they are in flight, fonts, images and widgets are created, and every station
+is painted as soon as its departures arrive instead of waiting for the
+slowest one. Requests run in gevent greenlets on the main thread like all
+requests (see data.send_requests): they progress whenever the startup yields
+to them with Prefetcher.poll and, once the widgets exist, on a short tkinter
+timer.
+"""
+
+import time
+from typing import Callable, Iterable, List, Set
+
+from . import debug
+from . import data
+from .app import APP, START
+from .data import Departure, Station
+
+
+# milliseconds between two polls of the prefetched requests
+PREFETCH_POLL_TIME = 10
+# milliseconds the startup report waits for the full board
+REPORT_TIMEOUT = 30_000
+
+FIRST_PAINT = debug.REGISTRY.gauge(
+    "mops_startup_first_paint_seconds",
+    "Seconds from startup until the first station showed departures",
+)
+FULL_BOARD = debug.REGISTRY.gauge(
+    "mops_startup_full_board_seconds",
+    "Seconds from startup until all stations showed departures",
+)
+
+
+class Prefetcher:
+    """Fetch the departures of stations in the background during startup"""
+
+    def __init__(self, stations: Iterable[Station]):
+        """Prefetcher constructor, sends the requests
+
+        Parameters
+        ----------
+        stations: list[Station]
+            Stations to fetch the departures of
+        """
+        data.load_http()
+        import gevent  # pylint: disable=import-outside-toplevel
+
+        self._gevent = gevent
+        self.pending = {
+            station.label: (station, gevent.spawn(station.fetch_departures))
+            for station in stations
+        }
+        self._root = None
+        self._job = None
+        self._deliver: Callable[[Station, List[Departure]], None] = None
+        self.poll()
+
+    def poll(self):
+        """Let the requests progress, returns as soon as they wait"""
+        self._gevent.sleep(0)
+
+    def start(
+        self, root, deliver: Callable[[Station, List[Departure]], None]
+    ):
+        """Pass the departures of every station to deliver as they arrive,
+        polls on root's timer until all arrived
+
+        Parameters
+        ----------
+        root: tkinter.Misc
+            Widget whose after method is used for polling
+        deliver: Callable[[Station, list[Departure]], None]
+            Called with a station and its departures, an empty list if the
+            fetch failed
+        """
+        self._root = root
+        self._deliver = deliver
+        self._poll_and_deliver()
+
+    def _poll_and_deliver(self):
+        self._job = None
+        self.poll()
+        for label, (station, greenlet) in list(self.pending.items()):
+            if not greenlet.ready():
+                continue
+            del self.pending[label]
+            # failures were reported by the gevent hub
+            self._deliver(station, greenlet.value or [])
+        if self.pending:
+            self._job = self._root.after(
+                PREFETCH_POLL_TIME, self._poll_and_deliver
+            )
+
+    def cancel(self):
+        """Drop the pending requests, e.g. when regular updates start"""
+        if self._job is not None:
+            self._root.after_cancel(self._job)
+            self._job = None
+        greenlets = [greenlet for _, greenlet in self.pending.values()]
+        self._gevent.killall(greenlets, block=False)
+        self.pending.clear()
+
+
+class BoardTracker:
+    """Record the time to the first painted station and to the full board"""
+
+    def __init__(self, root, labels: Iterable[str]):
+        """BoardTracker constructor
+
+        Parameters
+        ----------
+        root: tkinter.Misc
+            Widget whose after_idle method is used to wait for redraws
+        labels: list[str]
+            Labels of the stations on the board
+        """
+        self.root = root
+        self.pending: Set[str] = set(labels)
+        self.first_paint: float = None
+        self.full_board: float = None
+        self.on_full_board: List[Callable[[], None]] = []
+
+    def painted(self, label: str):
+        """Report that the departures of a station were applied"""
+        if label in self.pending:
+            # tkinter redraws when idle, after previously queued idle tasks
+            self.root.after_idle(self._painted, label)
+
+    def _painted(self, label: str):
+        self.pending.discard(label)
+        seconds = time.perf_counter() - START
+        if self.first_paint is None:
+            self.first_paint = seconds
+            FIRST_PAINT.set(seconds)
+            APP.mark("first paint")
+        if not self.pending and self.full_board is None:
+            self.full_board = seconds
+            FULL_BOARD.set(seconds)
+            APP.mark("full board")
+            for callback in self.on_full_board:
+                callback()
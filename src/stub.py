@@ -0,0 +1,243 @@
+"""Local stand-in for the BVG API
+Serve recorded /stops/{id}/departures responses with configurable latency,
+jitter, error rate and payload size. Only uses the standard library, so it
+can run as a separate process without importing src:
+
+    python src/stub.py --port 8080 --latency 0.05 --error-rate 0.01
+
+Fixtures are json files {"recorded": iso time, "body": response} named after
+the stop id. Departure times are shifted so that they lie as far in the
+future relative to the request as they did relative to the recording.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import random
+import re
+import sys
+import threading
+import time
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+
+FIXTURE_PATH = Path(__file__).parents[1].resolve() / "data" / "fixtures"
+DEPARTURES_URL = re.compile(r"^/stops/(?P<id>[^/]+)/departures$")
+WHEN_PARAM = re.compile(r"^in (?P<minutes>[\d.]+) minutes$")
+
+
+class Fixture:
+    """Recorded departures response with times relative to the recording"""
+
+    def __init__(self, path: Path):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        recorded = datetime.fromisoformat(data["recorded"])
+        self.departures: List[dict] = []
+        self.offsets: List[float] = []
+        for departure in data["body"].get("departures", []):
+            self.departures.append(departure)
+            when = departure.get("when") or departure.get("plannedWhen")
+            offset = (datetime.fromisoformat(when) - recorded).total_seconds()
+            self.offsets.append(offset)
+        self.span = max(self.offsets, default=0) - min(self.offsets, default=0)
+
+    def render(self, start: float, count: int = None) -> dict:
+        """Create a response body
+
+        Parameters
+        ----------
+        start: float
+            Seconds from now the first departure should leave at
+        count: int, optional
+            Number of departures, the recorded departures are repeated with
+            new trip ids if necessary. Defaults to None (all recorded)
+        """
+        count = len(self.departures) if count is None else count
+        first = min(self.offsets, default=0)
+        now = datetime.now().astimezone()
+        departures = []
+        for idx in range(count if self.departures else 0):
+            repetition, pos = divmod(idx, len(self.departures))
+            departure = dict(self.departures[pos])
+            offset = self.offsets[pos] - first + repetition * (self.span + 60)
+            when = now + timedelta(seconds=start + offset)
+            delay = departure.get("delay") or 0
+            departure["when"] = when.isoformat()
+            planned = when - timedelta(seconds=delay)
+            departure["plannedWhen"] = planned.isoformat()
+            if repetition > 0:
+                departure["tripId"] = f"{departure['tripId']}#{repetition}"
+            departures.append(departure)
+        return {
+            "departures": departures,
+            "realtimeDataUpdatedAt": int(time.time()),
+        }
+
+
+class StubServer(ThreadingHTTPServer):
+    """Http server holding the stub configuration and request statistics"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        fixtures: Path = FIXTURE_PATH,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        departures: int = None,
+        keepalive: float = None,
+    ):
+        """StubServer constructor
+
+        Parameters
+        ----------
+        address: tuple[str, int]
+            Host and port to listen on
+        fixtures: Path, optional
+            Directory of recorded responses. Defaults to FIXTURE_PATH
+        latency, jitter: float, optional
+            Response delay in seconds, uniformly distributed in
+            latency +- jitter. Default to 0
+        error_rate: float, optional
+            Probability of responding with 503. Defaults to 0
+        departures: int, optional
+            Departures per response. Defaults to None (as recorded)
+        keepalive: float, optional
+            Seconds idle connections are kept open (HTTP/1.1). Defaults to
+            None (HTTP/1.0, one connection per request)
+        """
+        super().__init__(address, StubHandler)
+        self.fixtures: Dict[str, Fixture] = {
+            path.stem: Fixture(path) for path in Path(fixtures).glob("*.json")
+        }
+        if not self.fixtures:
+            raise ValueError(f"No fixtures found in {fixtures}")
+        self.default = next(iter(self.fixtures.values()))
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.departures = departures
+        self.keepalive = keepalive
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0, "connections": 0}
+        self._lock = threading.Lock()  # handlers run in their own threads
+
+    def count(self, key: str, value: int = 1):
+        """Add value to the statistic key"""
+        with self._lock:
+            self.stats[key] += value
+
+    def statistics(self) -> Dict[str, int]:
+        """Copy of the request statistics"""
+        with self._lock:
+            return dict(self.stats)
+
+    def delay(self):
+        """Sleep for the configured latency"""
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serve departures and request statistics"""
+
+    server: StubServer
+    # send a response in one write (headers and body are buffered until
+    # handle_one_request flushes) without Nagle's algorithm, otherwise the
+    # body of a kept-alive connection waits for the client's delayed ack
+    # (about 40 ms)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        """Keep the connection open if the server keeps connections alive"""
+        if self.server.keepalive is not None:
+            self.protocol_version = "HTTP/1.1"
+            self.timeout = self.server.keepalive  # closes idle connections
+        super().setup()
+        self.server.count("connections")
+
+    def do_GET(self):
+        """Handle GET request"""
+        url = urlsplit(self.path)
+        if url.path == "/stats":
+            self._send(200, self.server.statistics())
+            return
+
+        match = DEPARTURES_URL.match(url.path)
+        if match is None:
+            self._send(404, {"message": "not found"})
+            return
+
+        self.server.count("requests")
+        self.server.delay()
+        if random.random() < self.server.error_rate:
+            self.server.count("errors")
+            self._send(503, {"message": "stub error"})
+            return
+
+        query = parse_qs(url.query)
+        when = WHEN_PARAM.match(query.get("when", ["in 0 minutes"])[0])
+        start = 60 * float(when["minutes"]) if when else 0.0
+        fixture = self.server.fixtures.get(match["id"], self.server.default)
+        body = fixture.render(start, self.server.departures)
+        self.server.count("bytes", self._send(200, body))
+
+    def _send(self, status: int, data: dict) -> int:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    def log_message(self, *args):
+        """Do not log requests"""
+
+
+def main(argv: List[str] = None):
+    """Run the stub server until interrupted"""
+    parser = ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0,
+                        help="port to listen on, 0 picks a free port")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURE_PATH)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--departures", type=int, default=None,
+                        help="departures per response (default: as recorded)")
+    parser.add_argument("--keepalive", type=float, default=None,
+                        help="seconds idle connections are kept open "
+                             "(default: one connection per request)")
+    args = parser.parse_args(argv)
+
+    server = StubServer(
+        (args.host, args.port),
+        fixtures=args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        departures=args.departures,
+        keepalive=args.keepalive,
+    )
+    host, port = server.server_address[:2]
+    # the first line is parsed by loadtest.py
+    print(f"http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
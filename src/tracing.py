@@ -0,0 +1,194 @@
+"""Record spans of the update cycles and export them as Chrome trace events
+The exported json files can be opened with chrome://tracing or
+https://ui.perfetto.dev
+"""
+
+from collections import deque
+from functools import wraps
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Deque, List, Union
+
+
+TRACE = False
+# number of cycles kept in the ring buffer and written per trace file
+TRACE_CYCLES = 10
+# file the ring buffer is written to every TRACE_CYCLES cycles, None disables
+TRACE_PATH: Union[Path, None] = None
+# events per cycle, further events of a cycle are dropped
+MAX_EVENTS_PER_CYCLE = 20_000
+
+
+def timestamp() -> float:
+    """Trace timestamp in microseconds"""
+    return time.perf_counter() * 1e6
+
+
+class _NullSpan:
+    """Span that does nothing, used if tracing is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Span that records a complete event on exit"""
+
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = timestamp()
+        return self
+
+    def __exit__(self, *args):
+        duration = timestamp() - self.start
+        self.tracer.complete(self.name, self.start, duration, **self.args)
+
+
+class Tracer:
+    """Ring buffer of trace events grouped in cycles
+
+    Events are collected for the current cycle until end_cycle is called.
+    Only the last cycles are kept, so tracing can stay enabled permanently.
+    """
+
+    def __init__(self, cycles: int = TRACE_CYCLES):
+        """Tracer constructor
+
+        Parameters
+        ----------
+        cycles: int, optional
+            Number of cycles to keep. Defaults to TRACE_CYCLES
+        """
+        self.pid = os.getpid()
+        self.cycles: Deque[List[dict]] = deque(maxlen=cycles)
+        self.current: List[dict] = []
+        self.count = 0
+        self.dropped = 0
+
+    def span(self, name: str, **args) -> Union[_Span, _NullSpan]:
+        """Context manager that records the time spent inside as event"""
+        if not TRACE:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def complete(self, name: str, start: float, duration: float, **args):
+        """Record a complete event
+
+        Parameters
+        ----------
+        name: str
+            Event name
+        start, duration: float
+            Start timestamp and duration in microseconds, see timestamp
+        **args
+            Additional information shown for the event
+        """
+        if not TRACE:
+            return
+        if len(self.current) >= MAX_EVENTS_PER_CYCLE:
+            self.dropped += 1
+            return
+        self.current.append({
+            "name": name,
+            "ph": "X",
+            "ts": start,
+            "dur": duration,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    def instant(self, name: str, **args):
+        """Record an instant event"""
+        if not TRACE:
+            return
+        self.current.append({
+            "name": name,
+            "ph": "i",
+            "s": "p",
+            "ts": timestamp(),
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    def end_cycle(self, path: Union[Path, None] = None):
+        """Move events of the current cycle into the ring buffer
+
+        Parameters
+        ----------
+        path: Path, optional
+            Write the ring buffer to path every time it was filled with new
+            cycles. Defaults to None (do not write)
+        """
+        if not TRACE:
+            return
+        self.cycles.append(self.current)
+        self.current = []
+        self.count += 1
+        if path is not None and self.count % self.cycles.maxlen == 0:
+            self.dump(path)
+
+    def events(self) -> List[dict]:
+        """Get all events in the ring buffer and the current cycle"""
+        events = [event for cycle in self.cycles for event in cycle]
+        return events + self.current
+
+    def dump(self, path: Path):
+        """Atomically write the trace events as json to path"""
+        path = Path(path)
+        trace = {
+            "traceEvents": self.events(),
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped": self.dropped},
+        }
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(trace, file)
+        os.replace(tmp, path)
+
+
+TRACER = Tracer()
+
+
+def span(name: str, **args) -> Union[_Span, _NullSpan]:
+    """Record a span in the global tracer, see Tracer.span"""
+    if not TRACE:
+        return _NULL_SPAN
+    return _Span(TRACER, name, args)
+
+
+def traced(name: str = None) -> Callable:
+    """Function decorator that records every call as span
+    Returns the function itself if tracing is disabled
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if not TRACE:
+            return func
+        label = func.__qualname__ if name is None else name
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(TRACER, label, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator